@@ -0,0 +1,365 @@
+#!/bin/env python
+"""
+End-to-end benchmarks of the commands, against the mock Firefly III (see
+firefly_automate/mock_firefly.py) with a synthetic ledger of each given size, e.g.
+
+    python benchmarks/bench_e2e.py --sizes 1000 10000 100000 --latency 0.005
+
+Each command runs in a process of its own (as it would from the shell), with a
+config that points at the mock. The mock is reset in between, so that every run
+sees the same ledger. The results are appended to `--results`, and compared with
+the previous run of the same benchmark and parameters with `--compare`.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from firefly_automate.mock_firefly import TRANSFER_PERIOD, MockFirefly  # noqa: E402
+
+BENCHMARKS = ("get_transactions", "transform", "merge", "import_csv")
+# the parameters that make two results comparable
+RESULT_KEYS = ("benchmark", "size", "page_size", "latency", "error_rate")
+
+CONFIG = """
+rules:
+  classify_transaction:
+    - transaction_type: withdrawal
+      attribute_to_update: category_name
+      mappings:
+        Groceries: [woolworths, coles, aldi]
+        Entertainment: [netflix, jb hi-fi]
+  search_keyword:
+    - name: uber
+      conditional:
+        and:
+          - transaction_type: withdrawal
+          - contain_keywords: {description: UBER}
+      replace: {category_name: Transport}
+mapping_priority:
+  category_name: [Transport, Groceries]
+rule_priority:
+  category_name: []
+merge_transfer:
+  ignore_id_pairs: []
+"""
+
+GET_TRANSACTIONS = """
+import argparse, datetime, sys
+from firefly_automate import miscs
+from firefly_automate.firefly_request_manager import get_transactions
+from firefly_automate.record_cache import RecordCache
+miscs.set_args(argparse.Namespace(cache=RecordCache("cache")))
+start, end = map(datetime.date.fromisoformat, sys.argv[1:3])
+print(f"{sum(1 for _ in get_transactions(start, end))} transactions")
+"""
+
+CSV_COLUMNS = (
+    "transaction_id",
+    "description",
+    "amount",
+    "credit_debit",
+    "currency",
+    "transaction_date",
+    "posted_date",
+    "merchant_name",
+    "budget_category",
+    "category_name",
+)
+
+
+def write_import_csv(path: str, num_rows: int, start: datetime.date, days: int):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(num_rows):
+            date = start + datetime.timedelta(days=i * days // num_rows)
+            writer.writerow(
+                (
+                    f"import-{i}",
+                    f"IMPORTED PURCHASE {i}",
+                    f"-{1 + i % 200}.{i % 100:02d}",
+                    "debit",
+                    "AUD",
+                    date,
+                    date,
+                    f"IMPORTED SHOP {i % 50}",
+                    "Shopping",
+                    "",
+                )
+            )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    """Runs the commands in a scratch directory (for their cache files), with a
+    config that points at the given mock."""
+
+    def __init__(self, mock: MockFirefly, workdir: str, verbose: bool = False):
+        self.mock = mock
+        self.workdir = workdir
+        self.verbose = verbose
+        self.num_failed = 0
+        config_dir = os.path.join(workdir, ".config", "firefly-automate")
+        os.makedirs(config_dir, exist_ok=True)
+        with open(os.path.join(config_dir, "config.yaml"), "w") as f:
+            f.write(CONFIG)
+        self.env = dict(
+            os.environ,
+            HOME=workdir,
+            PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]),
+            firefly_iii_host=mock.url,
+            firefly_iii_token="benchmark",
+        )
+        ledger = mock.ledger
+        self.start, self.end = str(ledger.start_date), str(ledger.end_date)
+
+    def _run(self, argv: List[str], stdin: str = None) -> float:
+        self.mock.reset()
+        begin = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, *argv],
+            cwd=self.workdir,
+            env=self.env,
+            input=stdin,
+            capture_output=True,
+            text=True,
+        )
+        elapsed = time.perf_counter() - begin
+        if self.verbose or completed.returncode != 0:
+            print(completed.stdout[-2000:])
+            print(completed.stderr[-2000:], file=sys.stderr)
+        if completed.returncode != 0:
+            # e.g. with injected errors; still timed, but reported as failed
+            print(f"[ERROR] Exited with {completed.returncode}")
+            self.num_failed += 1
+        return elapsed
+
+    def _command(self, *argv: str, stdin: str = None) -> float:
+        return self._run(
+            ["-m", "firefly_automate.run", "--yes", "-s", self.start, "-e", self.end]
+            + list(argv),
+            stdin=stdin,
+        )
+
+    def get_transactions(self) -> float:
+        return self._run(["-c", GET_TRANSACTIONS, self.start, self.end])
+
+    def transform(self) -> float:
+        return self._command("transform", "--no-memo")
+
+    def merge(self) -> float:
+        # accept every batch of merges; each transfer has a single candidate, so
+        # there is no other question
+        num_batches = self.mock.ledger.num_transactions // TRANSFER_PERIOD
+        return self._command("merge", stdin="y\n" * (num_batches + 1))
+
+    def import_csv(self) -> float:
+        csv_path = os.path.join(self.workdir, "import.csv")
+        write_import_csv(
+            csv_path,
+            self.mock.ledger.num_transactions,
+            self.mock.ledger.start_date,
+            self.mock.ledger.days,
+        )
+        return self._command(
+            "import_csv",
+            csv_path,
+            "--load-mappings",
+            os.path.join(ROOT, "frollo-exported-data-mappings.yml"),
+            "--target-account-name",
+            "Checking account",
+            "--chunk-size",
+            "10000",
+        )
+
+
+def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    commit = git_commit()
+    results = []
+    for size in args.sizes:
+        mock = MockFirefly(
+            size,
+            days=args.days,
+            page_size=args.page_size,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            seed=args.seed,
+        )
+        with mock, tempfile.TemporaryDirectory() as workdir:
+            runner = Runner(mock, workdir, verbose=args.verbose)
+            for benchmark in args.benchmarks:
+                if benchmark == "merge" and size > args.max_merge_size:
+                    # merge compares every withdrawal with every deposit at once
+                    print(f"> Skipping merge of {size} (see --max-merge-size)")
+                    continue
+                timings = []
+                runner.num_failed = 0
+                for _ in range(args.repeat):
+                    timings.append(getattr(runner, benchmark)())
+                result = {
+                    "benchmark": benchmark,
+                    "size": size,
+                    "page_size": args.page_size,
+                    "latency": args.latency,
+                    "error_rate": args.error_rate,
+                    "seconds": statistics.median(timings),
+                    "all_seconds": timings,
+                    "num_requests": sum(mock.num_requests.values()),
+                    "num_failed": runner.num_failed,
+                    "commit": commit,
+                    "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": sys.version.split()[0],
+                }
+                print(
+                    f"{benchmark:<18}{size:>9}{result['seconds']:>10.3f}s"
+                    f"{result['num_requests']:>9} requests"
+                )
+                results.append(result)
+    return results
+
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(
+    results: List[Dict[str, Any]], previous: List[Dict[str, Any]], threshold: float
+) -> bool:
+    """Print each result against the last previous result of the same benchmark and
+    parameters. Return whether any of them regressed by more than `threshold`."""
+    latest = {tuple(r[k] for k in RESULT_KEYS): r for r in previous}
+    regressed = False
+    print("========================")
+    print(f"{'benchmark':<18}{'size':>9}{'before':>10}{'after':>10}{'ratio':>8}")
+    for result in results:
+        before = latest.get(tuple(result[k] for k in RESULT_KEYS))
+        if before is None:
+            print(f"{result['benchmark']:<18}{result['size']:>9}{'-':>10}")
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        status = ""
+        if ratio > 1 + threshold:
+            regressed = True
+            status = "  [REGRESSION]"
+        print(
+            f"{result['benchmark']:<18}{result['size']:>9}{before['seconds']:>10.3f}"
+            f"{result['seconds']:>10.3f}{ratio:>8.2f}{status}"
+            f"  (vs {before.get('commit')})"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes",
+        default=[1000, 10000],
+        nargs="+",
+        help="Number of synthetic transactions of each run",
+        type=int,
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmarks",
+        default=list(BENCHMARKS),
+        nargs="+",
+        choices=BENCHMARKS,
+    )
+    parser.add_argument(
+        "--days",
+        default=365,
+        help="The transactions are spread over this many days",
+        type=int,
+    )
+    parser.add_argument("--page-size", default=50, type=int)
+    parser.add_argument(
+        "--latency", default=0.0, help="Seconds to delay each request", type=float
+    )
+    parser.add_argument(
+        "--error-rate",
+        default=0.0,
+        help="Probability of each request to fail with 500",
+        type=float,
+    )
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument(
+        "--repeat",
+        default=1,
+        help="Run each benchmark this many times, and keep the median",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-merge-size",
+        default=20000,
+        help="Skip merge for larger sizes, as it needs memory quadratic in the size",
+        type=int,
+    )
+    parser.add_argument(
+        "--results",
+        default=os.path.join(ROOT, "benchmarks", "results.jsonl"),
+        help="File to append the results to",
+        type=str,
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare with the previous results of the same parameters",
+    )
+    parser.add_argument(
+        "--threshold",
+        default=0.1,
+        help="Relative slow down to report as regression",
+        type=float,
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with 1 if any benchmark regressed (implies --compare)",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Show the output of the commands",
+    )
+    args = parser.parse_args()
+
+    previous = load_results(args.results)
+    results = run_benchmarks(args)
+    with open(args.results, "a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    if args.compare or args.fail_on_regression:
+        regressed = compare(results, previous, args.threshold)
+        if regressed and args.fail_on_regression:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
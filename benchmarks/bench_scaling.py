@@ -0,0 +1,423 @@
+#!/bin/env python
+"""
+Scaling benchmarks of the rules and of merge's candidate discovery, on the synthetic
+ledger (see firefly_automate/mock_firefly.py) of each given size, e.g.
+
+    python benchmarks/bench_scaling.py --sizes 1000 10000 100000 1000000
+
+Unlike bench_e2e.py, these run in-process without the network, and measure the time
+and the peak (traced) memory of each benchmark at each size. Each curve is summarised
+by its scaling exponent (the slope of log time/memory over log size, i.e. 1 for
+linear and 2 for quadratic), such that an algorithmic regression shows up as a
+change in the exponent rather than in the noise of the timings. Sizes that are
+predicted (from the smaller ones) to exceed `--max-seconds` or `--max-memory` are
+skipped.
+
+The results are appended to `--results`, and compared with the previous run of each
+benchmark with `--compare`.
+"""
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_e2e import git_commit  # noqa: E402
+
+from firefly_automate.config_loader import config  # noqa: E402
+from firefly_automate.mock_firefly import SyntheticLedger  # noqa: E402
+from firefly_automate.profiling import format_bytes  # noqa: E402
+
+CONFIG = """
+firefly_iii_host: http://127.0.0.1
+firefly_iii_token: benchmark
+rules:
+  classify_transaction:
+    - transaction_type: withdrawal
+      attribute_to_update: category_name
+      mappings:
+        Groceries: [woolworths, coles, aldi]
+        Entertainment: [netflix, jb hi-fi]
+        Transport: [uber, opal]
+    - transaction_type: withdrawal
+      attribute_to_update: tags
+      set_extracted_keyword_to_attribute: destination_name
+      mappings:
+        supermarket: [woolworths, coles, {aldi: {value: ALDI, priority: low}}]
+  search_keyword:
+    - name: uber
+      conditional:
+        and:
+          - transaction_type: withdrawal
+          - contain_keywords: {description: UBER}
+      replace: {category_name: Transport}
+    - name: big-purchases
+      conditional:
+        and:
+          - transaction_type: withdrawal
+          - amount_range: {min: 250}
+      replace: {tags: big-purchase}
+    - name: salary
+      conditional:
+        or:
+          - match_exactly: {description: SALARY ACME PTY LTD}
+          - contain_keywords: {source_name: Employer}
+      replace: {category_name: Income}
+      stop: true
+  remove_duplicates: []
+mapping_priority:
+  category_name: [Transport, Groceries]
+rule_priority:
+  category_name: [rule-a, rule-b]
+vendor_name_mappings:
+  ALDI STORES 77: ALDI
+"""
+
+# the account that RemoveDuplicates looks for duplicates in
+DUPLICATES_ACCOUNT_NAME = "Checking account"
+
+
+def bench_classify_transaction(transactions: Sequence) -> Callable[[], Any]:
+    from firefly_automate.rules.rule_auto_classification_by_keywords import (
+        RuleSearchKeyword,
+    )
+
+    def run():
+        rule = RuleSearchKeyword(pending_updates={}, pending_deletes=set())
+        for entry in transactions:
+            rule.process(entry)
+
+    return run
+
+
+def bench_search_keyword(transactions: Sequence) -> Callable[[], Any]:
+    from firefly_automate.rules.base_rule import StopRuleProcessing
+    from firefly_automate.rules.rule_search_keyword import RuleSearchKeyword
+
+    def run():
+        rule = RuleSearchKeyword(pending_updates={}, pending_deletes=set())
+        for entry in transactions:
+            try:
+                rule.process(entry)
+            except StopRuleProcessing:
+                pass
+
+    return run
+
+
+def bench_remove_duplicates(transactions: Sequence) -> Callable[[], Any]:
+    from firefly_automate.rules.rule_remove_duplicates import RemoveDuplicates
+
+    def run():
+        # the candidates only, as the rule asks which of them to delete
+        rule = RemoveDuplicates(pending_updates={}, pending_deletes=set())
+        rule.account_name = DUPLICATES_ACCOUNT_NAME
+        rule.set_all_transactions(transactions)
+        for entry in transactions:
+            if DUPLICATES_ACCOUNT_NAME in (entry.source_name, entry.destination_name):
+                rule.potential_duplicates(entry)
+
+    return run
+
+
+def bench_pending_updates(transactions: Sequence) -> Callable[[], Any]:
+    from firefly_automate.data_type.pending_update import PendingUpdates
+
+    def run():
+        # a conflict resolved by the rule priority, and a non-conflicting duplicate
+        for entry in transactions:
+            updates = PendingUpdates(
+                entry, "rule-a", {"category_name": "Groceries", "tags": ["a"]}
+            )
+            updates.append_updates("rule-b", {"category_name": "Transport"})
+            updates.append_updates(
+                "rule-c", {"category_name": "Groceries", "tags": ["a", "c"]}
+            )
+
+    return run
+
+
+def bench_merge_candidates(transactions: Sequence) -> Callable[[], Any]:
+    from firefly_automate.commands.run_merge_transfer import (
+        transactions_dataframe,
+        transfer_candidates,
+    )
+
+    def run():
+        df = transactions_dataframe(transactions)
+        for _ in transfer_candidates(df, 1e-4, 0):
+            pass
+
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[Sequence], Callable[[], Any]]] = {
+    "classify_transaction": bench_classify_transaction,
+    "search_keyword": bench_search_keyword,
+    "remove_duplicates": bench_remove_duplicates,
+    "pending_updates": bench_pending_updates,
+    "merge_candidates": bench_merge_candidates,
+}
+
+
+def use_config(workdir: str):
+    path = os.path.join(workdir, "config.yaml")
+    with open(path, "w") as f:
+        f.write(CONFIG)
+    config.path = path
+    config.reload()
+
+
+def measure_seconds(run: Callable[[], Any]) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def measure_peak_memory(run: Callable[[], Any]) -> int:
+    """The peak memory (in bytes) that is allocated by the run, on top of what has
+    been allocated before (e.g. the transactions)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def scaling_exponent(sizes: Sequence[int], values: Sequence[float]) -> Optional[float]:
+    """The least squares slope of log(value) over log(size)."""
+    points = [(math.log(n), math.log(v)) for n, v in zip(sizes, values) if v > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def _predict(sizes: List[int], values: List[float], size: int) -> Optional[float]:
+    """Extrapolate to the given size with the exponent of the last two sizes (and at
+    least linearly)."""
+    if not sizes:
+        return None
+    exponent = 1.0
+    if len(sizes) >= 2:
+        exponent = max(exponent, scaling_exponent(sizes[-2:], values[-2:]) or 0)
+    return values[-1] * (size / sizes[-1]) ** exponent
+
+
+def _format_exponent(exponent: Optional[float]) -> str:
+    return "-" if exponent is None else f"{exponent:.2f}"
+
+
+def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = {
+        name: {"benchmark": name, "sizes": [], "seconds": [], "peak_bytes": []}
+        for name in args.benchmarks
+    }
+    print(f"{'benchmark':<22}{'size':>9}{'seconds':>10}{'peak memory':>14}")
+    for size in sorted(args.sizes):
+        transactions = None
+        for name in args.benchmarks:
+            result = results[name]
+            predicted_seconds = _predict(result["sizes"], result["seconds"], size)
+            predicted_bytes = None
+            if not args.no_memory:
+                predicted_bytes = _predict(result["sizes"], result["peak_bytes"], size)
+            if (predicted_seconds or 0) > args.max_seconds or (
+                predicted_bytes or 0
+            ) > args.max_memory:
+                print(
+                    f"{name:<22}{size:>9}  skipped (predicted {predicted_seconds:.0f}s"
+                    f", {format_bytes(predicted_bytes)})"
+                )
+                continue
+            if transactions is None:
+                ledger = SyntheticLedger(size, days=args.days)
+                transactions = list(ledger.transactions())
+            run = BENCHMARKS[name](transactions)
+            seconds = min(measure_seconds(run) for _ in range(args.repeat))
+            peak_bytes = None if args.no_memory else measure_peak_memory(run)
+            result["sizes"].append(size)
+            result["seconds"].append(seconds)
+            result["peak_bytes"].append(peak_bytes)
+            print(f"{name:<22}{size:>9}{seconds:>10.3f}{format_bytes(peak_bytes):>14}")
+        transactions = None
+
+    commit = git_commit()
+    for result in results.values():
+        result.update(
+            time_exponent=scaling_exponent(result["sizes"], result["seconds"]),
+            memory_exponent=None
+            if args.no_memory
+            else scaling_exponent(result["sizes"], result["peak_bytes"]),
+            commit=commit,
+            timestamp=datetime.datetime.now().isoformat(timespec="seconds"),
+            python=sys.version.split()[0],
+        )
+    return list(results.values())
+
+
+def print_exponents(results: List[Dict[str, Any]]):
+    print("========================")
+    print(f"{'benchmark':<22}{'sizes':>20}{'time exp.':>11}{'memory exp.':>13}")
+    for result in results:
+        sizes = (
+            f"{min(result['sizes'], default='-')}-{max(result['sizes'], default='-')}"
+        )
+        print(
+            f"{result['benchmark']:<22}{sizes:>20}"
+            f"{_format_exponent(result['time_exponent']):>11}"
+            f"{_format_exponent(result['memory_exponent']):>13}"
+        )
+
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _common_exponent(
+    result: Dict[str, Any], sizes: Sequence[int], key: str
+) -> Optional[float]:
+    values = dict(zip(result["sizes"], result[key]))
+    if any(values[n] is None for n in sizes):
+        return None
+    return scaling_exponent(sizes, [values[n] for n in sizes])
+
+
+def compare(
+    results: List[Dict[str, Any]], previous: List[Dict[str, Any]], threshold: float
+) -> bool:
+    """Print the exponents of each result against those of the last previous result
+    of the same benchmark, over the sizes that both have measured. Return whether any
+    of them increased by more than `threshold`."""
+    latest = {r["benchmark"]: r for r in previous}
+    regressed = False
+    print("========================")
+    print(f"{'benchmark':<22}{'':<8}{'before':>8}{'after':>8}{'change':>8}")
+    for result in results:
+        before = latest.get(result["benchmark"])
+        if before is None:
+            print(f"{result['benchmark']:<22}{'-':>16}")
+            continue
+        sizes = sorted(set(before["sizes"]) & set(result["sizes"]))
+        for kind, key in (("time", "seconds"), ("memory", "peak_bytes")):
+            exp_before = _common_exponent(before, sizes, key)
+            exp_after = _common_exponent(result, sizes, key)
+            if exp_before is None or exp_after is None:
+                continue
+            status = ""
+            if exp_after - exp_before > threshold:
+                regressed = True
+                status = "  [REGRESSION]"
+            print(
+                f"{result['benchmark']:<22}{kind:<8}{exp_before:>8.2f}"
+                f"{exp_after:>8.2f}{exp_after - exp_before:>+8.2f}{status}"
+                f"  (vs {before.get('commit')})"
+            )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes",
+        default=[1000, 10000, 100000, 1000000],
+        nargs="+",
+        help="Number of synthetic transactions of each run",
+        type=int,
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmarks",
+        default=list(BENCHMARKS),
+        nargs="+",
+        choices=list(BENCHMARKS),
+    )
+    parser.add_argument(
+        "--days",
+        default=365,
+        help="The transactions are spread over this many days",
+        type=int,
+    )
+    parser.add_argument(
+        "--repeat",
+        default=3,
+        help="Time each benchmark this many times, and keep the fastest",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-seconds",
+        default=120,
+        help="Skip the sizes that a benchmark is predicted to take longer than this "
+        "(per repeat)",
+        type=float,
+    )
+    parser.add_argument(
+        "--max-memory",
+        default=2 * 1024**3,
+        help="Skip the sizes that a benchmark is predicted to need more bytes than this",
+        type=float,
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Only measure the time (the memory is measured by a second run)",
+    )
+    parser.add_argument(
+        "--results",
+        default=os.path.join(ROOT, "benchmarks", "scaling_results.jsonl"),
+        help="File to append the results to",
+        type=str,
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare with the previous exponents of the same benchmarks",
+    )
+    parser.add_argument(
+        "--threshold",
+        default=0.25,
+        help="Increase of an exponent to report as regression",
+        type=float,
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with 1 if any exponent regressed (implies --compare)",
+    )
+    args = parser.parse_args()
+
+    previous = load_results(args.results)
+    with tempfile.TemporaryDirectory() as workdir:
+        use_config(workdir)
+        results = run_benchmarks(args)
+    print_exponents(results)
+    with open(args.results, "a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    if args.compare or args.fail_on_regression:
+        regressed = compare(results, previous, args.threshold)
+        if regressed and args.fail_on_regression:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Columnar (Parquet or Arrow IPC) exports of the transactions, accounts and tags of an
+instance, as written by the `export` command, with proper dtypes: the ids are
+integers, the amounts decimals, the dates timestamps, the tags lists and the strings
+that repeat (e.g. the account names) dictionary-encoded.
+
+An export is a directory with one file per table and a manifest, which has the date
+range of the transactions and the rules. It can be used as the snapshot of
+`--offline` (see offline.py), or loaded as tables:
+
+    tables = load_ledger("export/")
+    df = tables["transactions"].to_pandas()
+
+The Arrow (IPC) files are lz4-compressed, which is about as fast to load as it is to
+read the uncompressed buffers from disk: a ledger of 1M transactions is ~55MB and
+loads in ~0.3s. The Parquet files are ~6x smaller, but take a few times longer to
+decode.
+
+This needs pyarrow (`pip install firefly-automate[export]`).
+"""
+import datetime
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from firefly_automate.offline import SNAPSHOT_VERSION, OfflineError, Snapshot
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+MANIFEST_FILE = "manifest.json"
+TABLES = ("transactions", "accounts", "tags")
+
+# the number of rows that are converted at once, which bounds the memory of exporting
+BATCH_SIZE = 64 * 1024
+
+# Firefly's amounts have 12 decimal places
+AMOUNT_TYPE = pa.decimal128(38, 12)
+
+
+def _offset_minutes(value: datetime.datetime) -> Optional[int]:
+    offset = value.utcoffset()
+    return None if offset is None else int(offset.total_seconds()) // 60
+
+
+@dataclass
+class Column:
+    name: str
+    # one of the KINDS below
+    kind: str
+
+
+# kind: (arrow type, conversion of a value that is not None to arrow)
+KINDS: Dict[str, Tuple[pa.DataType, Callable[[Any], Any]]] = {
+    "id": (pa.int64(), int),
+    "int": (pa.int32(), int),
+    "bool": (pa.bool_(), bool),
+    "float": (pa.float64(), float),
+    "string": (pa.string(), str),
+    # the strings that repeat across the rows (e.g. the account names), as indices
+    # into a dictionary of their distinct values, which pandas loads as categoricals
+    "category": (pa.dictionary(pa.int32(), pa.string()), str),
+    "amount": (AMOUNT_TYPE, str),
+    "tags": (pa.list_(pa.string()), list),
+    "date": (pa.date32(), lambda x: datetime.date.fromisoformat(str(x)[:10])),
+    # the local time, with its utc offset (in minutes) in the column "<name>_offset",
+    # such that the dates (e.g. "2023-01-01T00:00:00+10:00") are kept as they were
+    "datetime": (
+        pa.timestamp("s"),
+        lambda x: (
+            x
+            if isinstance(x, datetime.datetime)
+            else datetime.datetime.fromisoformat(x)
+        ).replace(tzinfo=None),
+    ),
+}
+# the kinds that are strings in the api entries, which arrow formats back to strings,
+# e.g. the amounts as "12.340000000000" (as the server does)
+STRING_KINDS = ("id", "amount", "date")
+
+TRANSACTION_COLUMNS = [
+    Column("id", "id"),
+    Column("created_at", "datetime"),
+    Column("updated_at", "datetime"),
+    Column("user", "id"),
+    Column("group_title", "string"),
+    Column("transaction_journal_id", "id"),
+    Column("type", "category"),
+    Column("date", "datetime"),
+    Column("order", "int"),
+    Column("currency_id", "id"),
+    Column("currency_code", "category"),
+    Column("currency_name", "category"),
+    Column("currency_symbol", "category"),
+    Column("currency_decimal_places", "int"),
+    Column("foreign_currency_id", "id"),
+    Column("foreign_currency_code", "category"),
+    Column("foreign_currency_symbol", "category"),
+    Column("foreign_currency_decimal_places", "int"),
+    Column("amount", "amount"),
+    Column("foreign_amount", "amount"),
+    Column("description", "string"),
+    Column("source_id", "id"),
+    Column("source_name", "category"),
+    Column("source_iban", "string"),
+    Column("source_type", "category"),
+    Column("destination_id", "id"),
+    Column("destination_name", "category"),
+    Column("destination_iban", "string"),
+    Column("destination_type", "category"),
+    Column("budget_id", "id"),
+    Column("budget_name", "category"),
+    Column("category_id", "id"),
+    Column("category_name", "category"),
+    Column("bill_id", "id"),
+    Column("bill_name", "category"),
+    Column("reconciled", "bool"),
+    Column("notes", "string"),
+    Column("tags", "tags"),
+    Column("internal_reference", "string"),
+    Column("external_id", "string"),
+    Column("original_source", "category"),
+]
+# the attributes of a transaction (group), the others are of its splits
+TRANSACTION_GROUP_ATTRIBUTES = ("created_at", "updated_at", "user", "group_title")
+
+ACCOUNT_COLUMNS = [
+    Column("id", "id"),
+    Column("created_at", "datetime"),
+    Column("updated_at", "datetime"),
+    Column("active", "bool"),
+    Column("name", "string"),
+    Column("type", "category"),
+    Column("account_role", "category"),
+    Column("currency_id", "id"),
+    Column("currency_code", "category"),
+    Column("currency_symbol", "category"),
+    Column("currency_decimal_places", "int"),
+    Column("current_balance", "amount"),
+    Column("iban", "string"),
+    Column("account_number", "string"),
+    Column("notes", "string"),
+]
+
+TAG_COLUMNS = [
+    Column("id", "id"),
+    Column("created_at", "datetime"),
+    Column("updated_at", "datetime"),
+    Column("tag", "string"),
+    Column("date", "date"),
+    Column("description", "string"),
+    Column("latitude", "float"),
+    Column("longitude", "float"),
+    Column("zoom_level", "int"),
+]
+
+COLUMNS = {
+    "transactions": TRANSACTION_COLUMNS,
+    "accounts": ACCOUNT_COLUMNS,
+    "tags": TAG_COLUMNS,
+}
+
+# the attributes that have no column (e.g. of a newer server) are kept as json
+EXTRA_COLUMN = "extra"
+
+
+def schema(columns: List[Column]) -> pa.Schema:
+    fields = []
+    for column in columns:
+        fields.append(pa.field(column.name, KINDS[column.kind][0]))
+        if column.kind == "datetime":
+            fields.append(pa.field(f"{column.name}_offset", pa.int16()))
+    fields.append(pa.field(EXTRA_COLUMN, pa.string()))
+    return pa.schema(fields)
+
+
+##############################
+# api entries <-> rows
+##############################
+
+
+def _rows(table_name: str, entries: Iterable[Dict[str, Any]]) -> Iterator[Dict]:
+    """The flat rows of the api entries, i.e. one per split of the transactions."""
+    for entry in entries:
+        attributes = entry["attributes"]
+        if table_name != "transactions":
+            yield {"id": entry["id"], **attributes}
+            continue
+        group = {k: attributes.get(k) for k in TRANSACTION_GROUP_ATTRIBUTES}
+        for split in attributes["transactions"]:
+            yield {"id": entry["id"], **split, **group}
+
+
+def _entries(table_name: str, rows: Iterable[Dict]) -> Iterator[Dict[str, Any]]:
+    """The api entries of the rows, where consecutive rows of the same transaction
+    are its splits."""
+    entry = None
+    for row in rows:
+        entry_id = row.pop("id")
+        if table_name != "transactions":
+            yield {"type": table_name, "id": entry_id, "attributes": row}
+            continue
+        group = {k: row.pop(k) for k in TRANSACTION_GROUP_ATTRIBUTES}
+        # the splits also have the user
+        row["user"] = group["user"]
+        if entry is not None and entry["id"] == entry_id:
+            entry["attributes"]["transactions"].append(row)
+            continue
+        if entry is not None:
+            yield entry
+        entry = {
+            "type": table_name,
+            "id": entry_id,
+            "attributes": {**group, "transactions": [row]},
+        }
+    if entry is not None:
+        yield entry
+
+
+def _record_batch(
+    columns: List[Column], rows: List[Dict], dictionaries: Dict[str, Dict[str, int]]
+) -> pa.RecordBatch:
+    """The rows as a batch. The dictionaries (of the category columns) are shared by
+    all the batches of a file, and are only appended to, such that the Arrow writer
+    only writes the values that each batch adds to them."""
+    names = {column.name for column in columns}
+    arrays = []
+    for column in columns:
+        arrow_type, to_arrow = KINDS[column.kind]
+        values = [row.get(column.name) for row in rows]
+        values = [None if x is None else to_arrow(x) for x in values]
+        if column.kind == "category":
+            dictionary = dictionaries.setdefault(column.name, {})
+            indices = [
+                None if x is None else dictionary.setdefault(x, len(dictionary))
+                for x in values
+            ]
+            arrays.append(
+                pa.DictionaryArray.from_arrays(
+                    pa.array(indices, pa.int32()), pa.array(list(dictionary))
+                )
+            )
+        elif column.kind == "amount":
+            # which arrow parses much faster than python's Decimal
+            arrays.append(pa.array(values, pa.string()).cast(arrow_type))
+        else:
+            arrays.append(pa.array(values, arrow_type))
+        if column.kind == "datetime":
+            offsets = [
+                None
+                if row.get(column.name) is None
+                else _offset_minutes(
+                    datetime.datetime.fromisoformat(str(row[column.name]))
+                )
+                for row in rows
+            ]
+            arrays.append(pa.array(offsets, pa.int16()))
+    extras = []
+    for row in rows:
+        extra = {k: v for k, v in row.items() if k not in names}
+        extras.append(json.dumps(extra, default=str) if extra else None)
+    arrays.append(pa.array(extras, pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema(columns))
+
+
+def _format_datetimes(array: pa.Array, offsets: pa.Array) -> List[Optional[str]]:
+    """The local times with their utc offsets, e.g. "2023-01-01T00:00:00+10:00"."""
+    pairs = list(zip(array.to_pylist(), offsets.to_pylist()))
+    # the ledgers have far fewer distinct dates than transactions
+    formatted = {}
+    for local_time, offset in set(pairs):
+        tz = None
+        if offset is not None:
+            tz = datetime.timezone(datetime.timedelta(minutes=offset))
+        formatted[local_time, offset] = (
+            None if local_time is None else local_time.replace(tzinfo=tz).isoformat()
+        )
+    return [formatted[pair] for pair in pairs]
+
+
+def _decode_dictionary(array: pa.DictionaryArray) -> List[Optional[str]]:
+    # the rows share (interned) strs of the dictionary's values, rather than each
+    # having a copy of theirs
+    dictionary = [sys.intern(x) for x in array.dictionary.to_pylist()]
+    return [None if i is None else dictionary[i] for i in array.indices.to_pylist()]
+
+
+def _batch_rows(batch: pa.RecordBatch, columns: List[Column]) -> List[Dict]:
+    values = {}
+    for column in columns:
+        array = batch.column(column.name)
+        if pa.types.is_dictionary(array.type):
+            # (the category columns, but not of the exports of older versions)
+            values[column.name] = _decode_dictionary(array)
+        elif column.kind in STRING_KINDS:
+            values[column.name] = array.cast(pa.string()).to_pylist()
+        elif column.kind == "datetime":
+            offsets = batch.column(f"{column.name}_offset")
+            values[column.name] = _format_datetimes(array, offsets)
+        else:
+            values[column.name] = array.to_pylist()
+    rows = [dict(zip(values, row)) for row in zip(*values.values())]
+    for row, extra in zip(rows, batch.column(EXTRA_COLUMN).to_pylist()):
+        if extra is not None:
+            row.update(json.loads(extra))
+    return rows
+
+
+def table_entries(table_name: str, table: pa.Table) -> Iterator[Dict[str, Any]]:
+    """The api entries (as `data_entries` lists them) of the rows of a table."""
+    columns = COLUMNS[table_name]
+
+    def rows():
+        for batch in table.to_batches(BATCH_SIZE):
+            yield from _batch_rows(batch, columns)
+
+    return _entries(table_name, rows())
+
+
+##############################
+# files
+##############################
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_entries(
+    path: str, table_name: str, entries: Iterable[Dict[str, Any]], fmt: str
+) -> int:
+    """Write the api entries as a table (in batches, such that the entries can be
+    streamed), and return the number of rows."""
+    columns = COLUMNS[table_name]
+    table_schema = schema(columns)
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, table_schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(
+            path,
+            table_schema,
+            options=pa.ipc.IpcWriteOptions(
+                compression="lz4", emit_dictionary_deltas=True
+            ),
+        )
+    num_rows = 0
+    dictionaries = {}
+    with writer:
+        for rows in _batched(_rows(table_name, entries), BATCH_SIZE):
+            batch = _record_batch(columns, rows, dictionaries)
+            if fmt == "parquet":
+                writer.write_batch(batch)
+            else:
+                writer.write(batch)
+            num_rows += len(rows)
+    return num_rows
+
+
+def read_table(path: str) -> pa.Table:
+    """Memory-map the table of an export file (and decompress it)."""
+    if path.endswith(FORMATS["arrow"]):
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+    return pq.read_table(path, memory_map=True)
+
+
+def _table_path(directory: str, table_name: str, fmt: str) -> str:
+    return os.path.join(directory, table_name + FORMATS[fmt])
+
+
+def export_ledger(
+    directory: str,
+    fmt: str,
+    start: datetime.date,
+    end: datetime.date,
+    transactions: Iterable[Dict[str, Any]],
+    accounts: List[Dict[str, Any]],
+    tags: List[Dict[str, Any]],
+    rules: List[Dict[str, Any]],
+) -> Dict[str, int]:
+    """Write the api entries as an export, and return the number of rows of each
+    table."""
+    os.makedirs(directory, exist_ok=True)
+    num_rows = {}
+    for table_name, entries in zip(TABLES, (transactions, accounts, tags)):
+        num_rows[table_name] = write_entries(
+            _table_path(directory, table_name, fmt), table_name, entries, fmt
+        )
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "saved_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                "start": str(start),
+                "end": str(end),
+                "format": fmt,
+                "rules": rules,
+            },
+            f,
+            default=str,
+        )
+    return num_rows
+
+
+def _load_manifest(directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise OfflineError(f"{directory} is not an export (it has no {MANIFEST_FILE})")
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_ledger(directory: str) -> Dict[str, pa.Table]:
+    """Memory-map the tables of an export."""
+    fmt = _load_manifest(directory)["format"]
+    return {
+        table_name: read_table(_table_path(directory, table_name, fmt))
+        for table_name in TABLES
+    }
+
+
+class ColumnarSnapshot(Snapshot):
+    """An export as the snapshot of `--offline`. Its transactions stay in the
+    (memory-mapped) table, and only those that are asked for become api entries."""
+
+    def __init__(self, directory: str):
+        data = _load_manifest(directory)
+        self.tables = load_ledger(directory)
+        data["accounts"] = list(table_entries("accounts", self.tables["accounts"]))
+        data["tags"] = list(table_entries("tags", self.tables["tags"]))
+        data["transactions"] = []
+        super().__init__(data, directory)
+
+    def transaction_entries(
+        self,
+        start: datetime.date,
+        end: datetime.date,
+        account_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        table = self.tables["transactions"]
+        # the (local) dates of the transactions
+        dates = pc.cast(table.column("date"), pa.date32())
+        mask = pc.and_(
+            pc.greater_equal(dates, pa.scalar(start, pa.date32())),
+            pc.less_equal(dates, pa.scalar(end, pa.date32())),
+        )
+        if account_id is not None:
+            account_id = pa.scalar(int(account_id), pa.int64())
+            mask = pc.and_(
+                mask,
+                pc.or_(
+                    pc.equal(table.column("source_id"), account_id),
+                    pc.equal(table.column("destination_id"), account_id),
+                ),
+            )
+        return list(table_entries("transactions", table.filter(mask)))
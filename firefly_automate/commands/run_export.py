@@ -0,0 +1,58 @@
+#!/bin/env python
+import argparse
+
+command_name = "export"
+
+
+def init_subparser(parser):
+    parser.add_argument(
+        "directory",
+        help=(
+            "Directory to export the transactions (within --start and --end), accounts "
+            "and tags to as tables (with the rules in its manifest). It can be used "
+            "with --offline."
+        ),
+        type=str,
+    )
+    parser.add_argument(
+        "--format",
+        default="arrow",
+        choices=["arrow", "parquet"],
+        help=(
+            "arrow is the fastest to load, while parquet is much smaller "
+            "(default: %(default)s)"
+        ),
+    )
+
+
+def run(args: argparse.Namespace):
+    try:
+        from firefly_automate import columnar
+    except ImportError:
+        print(
+            "[ERROR] exporting needs pyarrow, which can be installed with "
+            "`pip install firefly-automate[export]`"
+        )
+        return
+    from firefly_automate.firefly_request_manager import (
+        get_all_account_entries,
+        get_all_tag_entries,
+        get_rules,
+        get_transaction_entries,
+    )
+
+    num_rows = columnar.export_ledger(
+        args.directory,
+        args.format,
+        args.start,
+        args.end,
+        get_transaction_entries(args.start, args.end),
+        get_all_account_entries(),
+        get_all_tag_entries(),
+        list(get_rules()),
+    )
+    print(
+        f"> Exported {num_rows['transactions']} transaction split(s) from "
+        f"{args.start} to {args.end}, {num_rows['accounts']} account(s) and "
+        f"{num_rows['tags']} tag(s) to {args.directory}"
+    )
@@ -1,23 +1,31 @@
 #!/bin/env python
 import argparse
+import concurrent.futures
+import copy
+import datetime
+import fnmatch
+import glob
+import itertools
+import os
 import sys
-from pathlib import Path
-from typing import Any, Iterable, List, Tuple
-
-import re
-import pandas as pd
-import tqdm
-import yaml
-
-from firefly_automate.firefly_request_manager import (
-    create_transaction_store,
-    get_firefly_account_grouped_by_type,
-    send_transaction_store,
+from collections import Counter
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set, Tuple
+
+from firefly_automate.miscs import (
+    Inequality,
+    ask_yesno,
+    select_option,
+    set_args,
+    to_datetime,
 )
-from firefly_automate.miscs import Inequality, select_option, to_datetime, ask_yesno
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def transform_col_index_to_name(df: pd.DataFrame, columns: List[str]) -> Iterable[str]:
+
+def transform_col_index_to_name(
+    df: "pd.DataFrame", columns: List[str]
+) -> Iterable[str]:
     for col in columns:
         try:
             col = int(col)
@@ -35,16 +43,6 @@ def filter_clean_dollar_format(value: str) -> str:
     return str(float(value.lstrip("$").replace(",", "")))
 
 
-def filter_map_input_to_transaction_store_input(key: str, value: Any):
-    """Map the input into correct type."""
-    if key == "type":
-        from firefly_iii_client.model import transaction_type_property
-
-        return transaction_type_property.TransactionTypeProperty(value)
-    else:
-        return value  # default
-
-
 def string_sep_with_equal_sign(arg):
     x = arg.split("=")
     assert len(x) == 2
@@ -157,10 +155,63 @@ def init_subparser(parser):
         default=None,
         type=str,
     )
+    parser.add_argument(
+        "--no-skip-existing",
+        help="do not skip rows that already exist in the target account",
+        default=True,
+        dest="skip_existing",
+        action="store_false",
+    )
+    parser.add_argument(
+        "--batch-input",
+        help=(
+            "import all csv files within this directory (or matching this glob) "
+            "at once, instead of a single file_input"
+        ),
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--batch-mappings",
+        help=(
+            "mappings file to be used for each file name pattern in --batch-input, "
+            "e.g. 'westpac-*.csv=westpac-mappings.yml' (first match wins)"
+        ),
+        default=[],
+        nargs="+",
+        type=string_sep_with_equal_sign,
+    )
+    parser.add_argument(
+        "--batch-workers",
+        help="number of worker processes for parsing and mapping the batch files",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help=(
+            "stream the csv in chunks of this many rows, instead of loading the "
+            "whole file into memory (requires --load-mappings)"
+        ),
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        help="maximum number of pending store requests when sending transactions",
+        default=None,
+        type=int,
+    )
     parser.set_defaults(parser=parser)
 
 
 def ask_for_account_name():
+    import pandas as pd
+
+    from firefly_automate.firefly_request_manager import (
+        get_firefly_account_grouped_by_type,
+    )
+
     all_accs = get_firefly_account_grouped_by_type(acc_type="asset")
 
     with pd.option_context(
@@ -199,6 +250,8 @@ def ask_for_account_name():
 
 
 def manual_mapping(df):
+    import pandas as pd
+
     remaining = df.columns
     new_df_data = {}
     print("==============================")
@@ -273,168 +326,144 @@ def manual_mapping(df):
     return pd.DataFrame(new_df_data)
 
 
-im_source = lambda _d: _d.type == "withdrawal"
-im_destination = lambda _d: _d.type == "deposit"
+def transaction_fingerprints(
+    days: "pd.Series", amounts: "pd.Series", descriptions: "pd.Series"
+) -> "pd.Series":
+    """Build an identity for each transaction that survives a round trip to
+    firefly-iii (which stores absolute amounts and may re-space the description)."""
+    return (
+        days.astype(str)
+        + "|"
+        + amounts.astype(float).abs().map("{:.2f}".format)
+        + "|"
+        + descriptions.fillna("").astype(str).str.upper().str.split().str.join(" ")
+    )
 
 
-def auto_mapping(df, preset_mappings):
-    new_df_data = pd.DataFrame()
+class ExistingTransactionsIndex:
+    """In-memory index of the transactions that already exist in the target account,
+    so that rows that had been imported before can be skipped without asking the
+    remote host about each one of them.
 
-    def __split_by_colon(_str, nparts: int = 3):
-        # this regex split on colon that are not escaped by backslash \
-        _parts = re.split(r"(?<!\\):", _str)
+    Rows are matched by `external_id`, or by their fingerprint (date, amount and
+    description). Fingerprints are counted, such that genuinely repeated transactions
+    (e.g. two identical coffees on the same day) are only skipped as many times as
+    they exist remotely.
+    """
 
-        assert len(_parts) == nparts, f"must have {nparts} parts separated by colon"
-        # replace any escaped colon back to its original form
-        return [p.replace(r"\:", ":") for p in _parts]
+    def __init__(self, account_name: str):
+        self.account_name = account_name
+        self.external_ids: Set[str] = set()
+        self.fingerprint_counts: Counter = Counter()
+        self.fetched_range: Optional[Tuple[datetime.date, datetime.date]] = None
 
-    def _assign_col(map_to_col, data, override: bool = False):
-        if override or map_to_col not in new_df_data:
-            new_df_data[map_to_col] = data
-            return
-        if map_to_col == "tag":
-            raise NotImplementedError(
-                "Multi-Tag is not implemented (they will override each other right now.)"
-            )
-        new_df_data[map_to_col] += data
-
-    def _process_special(source, extract_as):
-        if extract_as.startswith("__auto-abs:"):
-            _, map_to_col = __split_by_colon(extract_as, 2)
-            _assign_col(map_to_col, df[source].astype(float).abs().astype(str))
-
-        elif extract_as.startswith("__strip:"):
-            _, map_to_col = __split_by_colon(extract_as, 2)
-            _assign_col(map_to_col, df[source].str.strip("'\"\n\t "))
-
-        elif extract_as.startswith("__auto-type:"):
-            _, _conf, map_to_col = __split_by_colon(extract_as, 3)
-            withdrawal, deposit = _conf.split("-")
-
-            # map from the specified keyword into either withdrawal or deposit
-            _series = pd.Series([None] * len(df), dtype=object)
-            _series[df[source] == withdrawal] = "withdrawal"
-            _series[df[source] == deposit] = "deposit"
-            _assign_col(map_to_col, _series)
-
-        elif extract_as.startswith("__auto-pos-neg:"):
-            _, _conf, map_to_col = __split_by_colon(extract_as, 3)
-            pos, neg = _conf.split("-")
-
-            # assign based on whether this column is positive or negative
-            __col_as_float = df[source].astype(float)
-            _series = pd.Series([None] * len(df), dtype=object)
-            _series[__col_as_float > 0] = pos
-            _series[__col_as_float < 0] = neg
-            _assign_col(map_to_col, _series)
-
-        elif extract_as.startswith("__auto-source-destination__"):
-            # assign based on whether this is a source acc or destination acc
-            _attr = extract_as[len("__auto-source-destination__") :]
-            new_df_data.loc[_transactions_as_source, f"source_{_attr}"] = df[source]
-            new_df_data.loc[_transactions_as_destination, f"destination_{_attr}"] = df[
-                source
-            ]
+    def _fetch(self, start: datetime.date, end: datetime.date):
+        import pandas as pd
 
-        elif extract_as.startswith("__auto-inv-source-destination__"):
-            # assign based on whether this is a source acc or destination acc
-            _attr = extract_as[len("__auto-inv-source-destination__") :]
-            new_df_data.loc[_transactions_as_destination, f"source_{_attr}"] = df[
-                source
-            ]
-            new_df_data.loc[_transactions_as_source, f"destination_{_attr}"] = df[
-                source
+        from firefly_automate.firefly_request_manager import (
+            get_account_id_by_name,
+            get_transactions,
+            get_transactions_for_account,
+        )
+
+        account_id = get_account_id_by_name(self.account_name)
+        if account_id is not None:
+            # never from the cache, as it may predate the transactions that were
+            # just imported (and then they would be imported again)
+            transactions = get_transactions_for_account(account_id, start, end, ttl=0)
+        else:
+            transactions = [
+                t
+                for t in get_transactions(start, end)
+                if self.account_name in (t.source_name, t.destination_name)
             ]
+        self.external_ids.update(t.external_id for t in transactions if t.external_id)
+        self.fingerprint_counts.update(
+            transaction_fingerprints(
+                pd.Series([str(t.date)[:10] for t in transactions], dtype=object),
+                pd.Series([t.amount for t in transactions], dtype=object),
+                pd.Series([t.description for t in transactions], dtype=object),
+            )
+        )
 
-        elif extract_as.startswith("__py-expr:"):
-            _, _expression, map_to_col = __split_by_colon(extract_as, 3)
+    def ensure_range(self, start: datetime.date, end: datetime.date):
+        """Fetch the part of the [start, end] range that had not been indexed yet."""
+        if self.fetched_range is None:
+            self._fetch(start, end)
+            self.fetched_range = (start, end)
+            return
+        fetched_start, fetched_end = self.fetched_range
+        one_day = datetime.timedelta(days=1)
+        if start < fetched_start:
+            self._fetch(start, fetched_start - one_day)
+        if end > fetched_end:
+            self._fetch(fetched_end + one_day, end)
+        self.fetched_range = (min(start, fetched_start), max(end, fetched_end))
+
+    def mark_existing(self, df: "pd.DataFrame") -> "pd.Series":
+        """Return a boolean mask of rows in the (mapped) data frame that already exist.
+        Matched fingerprints are consumed, so subsequent calls (e.g. on later chunks)
+        will not match the same remote transaction twice."""
+        import pandas as pd
+
+        if len(df) == 0:
+            return pd.Series(False, index=df.index)
+        dates = pd.to_datetime(df["date"])
+        self.ensure_range(dates.min().date(), dates.max().date())
+
+        existing = pd.Series(False, index=df.index)
+        if "external_id" in df:
+            existing |= df["external_id"].isin(self.external_ids)
+
+        fingerprints = transaction_fingerprints(
+            dates.dt.strftime("%Y-%m-%d"), df["amount"], df["description"]
+        )
+        occurrence = fingerprints.groupby(fingerprints).cumcount()
+        num_remote = fingerprints.map(lambda x: self.fingerprint_counts[x])
+        matched_fingerprint = ~existing & (occurrence < num_remote)
+        self.fingerprint_counts.subtract(
+            fingerprints[matched_fingerprint].value_counts().to_dict()
+        )
+        return existing | matched_fingerprint
 
-            # DANGEROUS of eval any arbitary expression. You need to trust your own config.
-            def __run(x: pd.Series):
-                return eval(_expression)
 
-            _assign_col(map_to_col, __run(df[source]))
+def send_transactions(df: "pd.DataFrame", max_in_flight: Optional[int] = None):
+    """Send all rows as new transactions over a bounded number of concurrent
+    requests."""
+    from firefly_automate.connections_helpers import BoundedWriter
+    from firefly_automate.firefly_request_manager import (
+        create_transaction_stores,
+        send_transaction_store,
+    )
 
-        elif extract_as.startswith("__"):
-            raise NotImplementedError(
-                f"Detected special rule '{extract_as}', but I don't "
-                "know how to handle that."
-            )
-        else:
-            return False
-        return True
-
-    mapping_pairs: List[Tuple[str, str]] = []
-    for k, v in preset_mappings.items():
-        # make it so that we supports using list in a key-val reference.
-        if not isinstance(v, list):
-            v = [v]
-        mapping_pairs.extend([(k, _v) for _v in v])
-    del preset_mappings
-
-    def process_type_first(_mapping_pairs):
-        # very very first, process the type of transaction
-        # that's because many rules depends on knowing if a given transaction is source or dest first.
-        new_mapping_pairs = []
-        for k, v in _mapping_pairs:
-            if v.endswith("type"):
-                _process_special(k, v)
-            else:
-                new_mapping_pairs.append((k, v))
-        return new_mapping_pairs
-
-    mapping_pairs = process_type_first(mapping_pairs)
-    _transactions_as_source = im_source(new_df_data)  # keep track for future reference
-    _transactions_as_destination = im_destination(
-        new_df_data
-    )  # keep track for future reference
-
-    # first process all the special ones
-    for k, v in mapping_pairs:
-        print(k, v)
-        if not _process_special(k, v):  # True == processed
-            # _remaining_mappings[k] = v
-            _assign_col(v, df[k])
-        if v.endswith("date"):
-            _assign_col(v, to_datetime(new_df_data[v]), override=True)
-
-    print("==================================")
-    print(" The following is your mapped data")
-    print(df.head())
-    print("---------------------------------")
-    return new_df_data
+    new_transactions = create_transaction_stores(df, apply_rules=True)
+    with BoundedWriter(
+        send_transaction_store,
+        max_in_flight=max_in_flight,
+        desc="storing transactions",
+        total=len(new_transactions),
+    ) as writer:
+        for new_transaction in new_transactions:
+            writer.submit(new_transaction)
+    for (new_transaction,), exception in writer.failures:
+        print(f"[ERROR] {exception}")
+    print(
+        f"> Stored {writer.num_succeeded}/{len(new_transactions)} new transaction(s)."
+    )
 
 
-def run(args: argparse.Namespace):
-    if not sys.stdin.isatty() and args.file_input is None:
-        # read from stdin
-        args.file_input = sys.stdin
-    elif sys.stdin.isatty() and args.file_input is None:
-        args.parser.print_usage()
-        print(f"{args.parser.prog}: there was no stdin and no csv file given.")
-        exit(1)
-    df = pd.read_csv(args.file_input, skiprows=args.skip_rows, dtype=object)
+im_source = lambda _d: _d.type == "withdrawal"
+im_destination = lambda _d: _d.type == "deposit"
 
-    if args.interpret_int_as_column:
-        args.drop = list(transform_col_index_to_name(df, args.drop))
-        args.as_datetime = list(transform_col_index_to_name(df, args.as_datetime))
-        # args.as_float = list(transform_col_index_to_name(df, args.as_float))
 
-    ############################################################
-    args.column_mappings = None
+def load_mappings(args: argparse.Namespace):
+    """Load the mappings file given in args (if any), and merge it into args."""
+    from firefly_automate.mapping_plan import load_mappings_file
+
+    args.mapping_plan = None
 
     if args.load_mappings:
-        mappings = yaml.safe_load(Path(args.load_mappings).read_text())
-        # see if there's a base setting. if so, merge them.
-        _base_mapping_fname = mappings.pop("__base_setting_yaml", None)
-        if _base_mapping_fname:
-            _base_mapping = yaml.safe_load(Path(_base_mapping_fname).read_text())
-            # merge with base
-            for k, v in _base_mapping.items():
-                if k not in mappings:
-                    mappings[k] = v
-
-        args.column_mappings = mappings.pop("column_mappings", None)
+        mappings, args.mapping_plan = load_mappings_file(args.load_mappings)
 
         if "filter_by_col" in mappings:
             args.filter_by_col.extend(
@@ -461,45 +490,45 @@ def run(args: argparse.Namespace):
             # assign to args for later access
             setattr(args, key, mappings[key])
 
-    ############################################################
+
+def filter_rows(df: "pd.DataFrame", args: argparse.Namespace) -> "pd.DataFrame":
+    """Apply the drop/filter/non-null/datetime options on the given rows. All row
+    filters are combined into a single mask, so that the frame is only copied once."""
+    import pandas as pd
 
     if len(args.drop) > 0:
         df = df.drop(columns=list(args.drop))
+
+    mask = pd.Series(True, index=df.index)
     for col, val in args.filter_by_col:
-        df = df[df[col] == val]
+        mask &= df[col] == val
     for col in args.non_null_by_col:
-        df = df[~df[col].isna()]
-    for col in args.as_datetime:
-        df[col] = to_datetime(df[col])
+        mask &= ~df[col].isna()
     for col, inequality_sign, datetime_val in args.filter_by_datetime:
         from dateutil.parser import parse as dateutil_parser
 
         try:
-            _datetime_col = to_datetime(df[col]).dt.date
-        except:
+            _datetime_col = to_datetime(df[col], source=args.file_input).dt.date
+        except Exception:
             print(f"> exception during time parsing with col {col}")
+            raise
         datetime_val = dateutil_parser(datetime_val, dayfirst=True).date()
 
-        mask = Inequality.compare(_datetime_col, inequality_sign, datetime_val)
-        df = df[mask]
+        mask &= Inequality.compare(_datetime_col, inequality_sign, datetime_val)
+    # reset index for any filtered values
+    df = df[mask].reset_index(drop=True)
 
-    print("------------------------------")
-    print(df.head())
-    print("------------------------------")
-    if len(df) <= 0:
-        return
+    for col in args.as_datetime:
+        df[col] = to_datetime(df[col], source=args.file_input)
+    return df
 
-    # reset index for any filtered values
-    df = df.reset_index()
 
-    if args.column_mappings is None:
-        df = manual_mapping(df)
-    else:
-        df = auto_mapping(df, args.column_mappings)
+def assign_account_name(df: "pd.DataFrame", account_name: str):
+    df.loc[im_source(df), "source_name"] = account_name
+    df.loc[im_destination(df), "destination_name"] = account_name
 
-    # sort by date
-    df.sort_values(by="date", inplace=True)
 
+def get_target_account_name(args: argparse.Namespace) -> str:
     account_name = (
         args.target_account_name if hasattr(args, "target_account_name") else None
     )
@@ -509,9 +538,307 @@ def run(args: argparse.Namespace):
         args.source_name = account_name
     if args.destination_name is None:
         args.destination_name = account_name
+    return account_name
 
-    df.loc[im_source(df), "source_name"] = account_name
-    df.loc[im_destination(df), "destination_name"] = account_name
+
+def run_streaming(args: argparse.Namespace, reader: Iterable["pd.DataFrame"]):
+    """Import the csv chunk by chunk, such that the full file is never held in
+    memory. Each chunk is filtered, mapped and fed to the (bounded) sender before
+    the next chunk is read."""
+    import pandas as pd
+
+    from firefly_automate.connections_helpers import BoundedWriter
+    from firefly_automate.firefly_request_manager import (
+        create_transaction_stores,
+        send_transaction_store,
+    )
+
+    if args.mapping_plan is None:
+        print("> Streaming import (--chunk-size) requires --load-mappings.")
+        exit(1)
+    account_name = get_target_account_name(args)
+    existing_index = ExistingTransactionsIndex(account_name)
+
+    writer = BoundedWriter(
+        send_transaction_store,
+        max_in_flight=args.max_in_flight,
+        desc="storing transactions",
+    )
+    num_rows = num_skipped = 0
+    for i, df in enumerate(reader):
+        num_rows += len(df)
+        df = filter_rows(df, args)
+        if len(df) <= 0:
+            continue
+        df = args.mapping_plan.apply(df, source=args.file_input)
+        assign_account_name(df, account_name)
+
+        if i == 0:
+            with pd.option_context(
+                "display.max_columns",
+                None,
+                "display.max_colwidth",
+                20,
+                "display.width",
+                0,
+            ):
+                print(df.head(20).to_markdown(index=False))
+            if not (args.yes or ask_yesno("Looks Good?", default=False)):
+                exit(1)
+
+        is_invalid = df.amount.isnull() | df.type.isnull()
+        is_invalid |= ~is_invalid & (df.amount.astype(float) == 0)
+        if args.skip_existing:
+            is_invalid |= existing_index.mark_existing(df[~is_invalid]).reindex(
+                df.index, fill_value=False
+            )
+        num_skipped += is_invalid.sum()
+
+        for new_transaction in create_transaction_stores(df[~is_invalid]):
+            writer.submit(new_transaction)
+    writer.join()
+
+    for (new_transaction,), exception in writer.failures:
+        print(f"[ERROR] {exception}")
+    print(
+        f"> Read {num_rows} row(s), skipped {num_skipped} invalid or existing row(s), "
+        f"stored {writer.num_succeeded} new transaction(s)."
+    )
+
+
+BATCH_FILE_OPTIONS = (
+    "skip_rows",
+    "drop",
+    "as_datetime",
+    "interpret_int_as_column",
+    "date_format",
+    "date_format_day_first",
+    "target_account_name",
+    "filter_by_col",
+    "filter_by_datetime",
+    "non_null_by_col",
+)
+
+
+def load_batch_file(file_args: argparse.Namespace) -> "pd.DataFrame":
+    """Parse, filter and map one statement file of a batch. This runs within a
+    worker process, hence it only receives the (picklable) per-file options."""
+    import pandas as pd
+
+    set_args(file_args)
+    df = pd.read_csv(file_args.file_input, skiprows=file_args.skip_rows, dtype=object)
+    if file_args.interpret_int_as_column:
+        file_args.drop = list(transform_col_index_to_name(df, file_args.drop))
+        file_args.as_datetime = list(
+            transform_col_index_to_name(df, file_args.as_datetime)
+        )
+    load_mappings(file_args)
+    if file_args.mapping_plan is None:
+        raise ValueError(f"No column_mappings in '{file_args.load_mappings}'")
+    if getattr(file_args, "target_account_name", None) is None:
+        raise ValueError(
+            f"No target_account_name for '{file_args.file_input}' "
+            f"(set it in '{file_args.load_mappings}' or with --target-account-name)"
+        )
+
+    df = file_args.mapping_plan.apply(
+        filter_rows(df, file_args), source=file_args.file_input
+    )
+    assign_account_name(df, file_args.target_account_name)
+    df["_account"] = file_args.target_account_name
+    df["_file"] = file_args.file_input
+    return df
+
+
+def drop_overlapping_rows(df: "pd.DataFrame") -> "pd.Series":
+    """Statements that cover overlapping date ranges contain the same transactions
+    more than once. Return a mask of rows that had already appeared in an earlier file.
+
+    Within a single file, repeated identical rows are genuine (e.g. two coffees), so
+    the n-th occurrence of a fingerprint is only dropped if an earlier file also has
+    (at least) n occurrences of it."""
+    import pandas as pd
+
+    fingerprints = df["_account"] + "|"
+    fingerprints += transaction_fingerprints(
+        pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d"),
+        df["amount"],
+        df["description"],
+    )
+    occurrence = fingerprints.groupby([df["_file"], fingerprints]).cumcount()
+    is_overlapping = pd.DataFrame(
+        {"fingerprint": fingerprints, "occurrence": occurrence}
+    ).duplicated()
+    if "external_id" in df:
+        has_external_id = df["external_id"].notna()
+        is_overlapping |= (
+            has_external_id & (df["_account"] + "|" + df["external_id"]).duplicated()
+        )
+    return is_overlapping
+
+
+def run_batch(args: argparse.Namespace):
+    import pandas as pd
+    import tqdm
+
+    if os.path.isdir(args.batch_input):
+        fnames = sorted(glob.glob(os.path.join(args.batch_input, "*.csv")))
+    else:
+        fnames = sorted(glob.glob(args.batch_input))
+
+    batch_file_args = []
+    for fname in fnames:
+        for pattern, mapping_fname in args.batch_mappings:
+            if fnmatch.fnmatch(os.path.basename(fname), pattern) or fnmatch.fnmatch(
+                fname, pattern
+            ):
+                break
+        else:
+            if args.load_mappings is None:
+                print(f"> Skipping '{fname}', as no mappings matches its name.")
+                continue
+            mapping_fname = args.load_mappings
+        file_args = argparse.Namespace(
+            file_input=fname,
+            load_mappings=mapping_fname,
+            **{k: copy.deepcopy(getattr(args, k, None)) for k in BATCH_FILE_OPTIONS},
+        )
+        batch_file_args.append(file_args)
+    if len(batch_file_args) == 0:
+        print(f"> No csv file found with '{args.batch_input}'.")
+        exit(1)
+
+    with concurrent.futures.ProcessPoolExecutor(args.batch_workers) as executor:
+        dfs = list(
+            tqdm.tqdm(
+                executor.map(load_batch_file, batch_file_args),
+                total=len(batch_file_args),
+                desc="parsing files",
+            )
+        )
+    df = pd.concat(dfs, ignore_index=True)
+    del dfs
+
+    summary = pd.DataFrame({"file": df["_file"], "account": df["_account"]})
+    summary["rows"] = 1
+    summary["from"] = summary["to"] = pd.to_datetime(df["date"]).dt.date
+    summary["overlapping"] = drop_overlapping_rows(df)
+
+    summary["invalid"] = ~summary["overlapping"] & (
+        df.amount.isnull() | df.type.isnull()
+    )
+    summary["invalid"] |= ~summary["invalid"] & (df.amount.astype(float) == 0)
+
+    summary["existing"] = False
+    if args.skip_existing:
+        for account_name, in_account in df.groupby("_account").groups.items():
+            candidates = in_account[
+                ~(summary["overlapping"] | summary["invalid"]).loc[in_account]
+            ]
+            summary.loc[candidates, "existing"] = ExistingTransactionsIndex(
+                account_name
+            ).mark_existing(df.loc[candidates])
+    summary["new"] = ~(
+        summary["overlapping"] | summary["invalid"] | summary["existing"]
+    )
+    df = df[summary["new"]]
+
+    print(
+        summary.groupby(["file", "account"])
+        .agg(
+            {
+                "rows": "sum",
+                "overlapping": "sum",
+                "invalid": "sum",
+                "existing": "sum",
+                "new": "sum",
+                "from": "min",
+                "to": "max",
+            }
+        )
+        .reset_index()
+        .to_markdown(index=False)
+    )
+    if len(df) <= 0:
+        print("> Nothing to import.")
+        return
+    print(
+        f"> {len(df)} new transaction(s) to be imported, "
+        f"into {df['_account'].nunique()} account(s)."
+    )
+
+    if args.yes or ask_yesno("Looks Good?", default=False):
+        send_transactions(
+            df.sort_values(by="date").drop(columns=["_account", "_file"]),
+            max_in_flight=args.max_in_flight,
+        )
+
+
+def run(args: argparse.Namespace):
+    import pandas as pd
+
+    if args.batch_input is not None:
+        return run_batch(args)
+    if not sys.stdin.isatty() and args.file_input is None:
+        # read from stdin
+        args.file_input = sys.stdin
+    elif sys.stdin.isatty() and args.file_input is None:
+        args.parser.print_usage()
+        print(f"{args.parser.prog}: there was no stdin and no csv file given.")
+        exit(1)
+    reader = pd.read_csv(
+        args.file_input,
+        skiprows=args.skip_rows,
+        dtype=object,
+        chunksize=args.chunk_size,
+    )
+    if args.chunk_size is None:
+        df = reader
+    else:
+        # peek the first chunk for resolving column indices
+        reader = iter(reader)
+        df = next(reader)
+        reader = itertools.chain([df], reader)
+        if args.file_input is sys.stdin:
+            # the reader holds on to the piped stdin; capture the input terminal
+            # for any user confirmations.
+            sys.stdin = open("/dev/tty")
+
+    if args.interpret_int_as_column:
+        args.drop = list(transform_col_index_to_name(df, args.drop))
+        args.as_datetime = list(transform_col_index_to_name(df, args.as_datetime))
+        # args.as_float = list(transform_col_index_to_name(df, args.as_float))
+
+    ############################################################
+    load_mappings(args)
+    ############################################################
+
+    if args.chunk_size is not None:
+        del df
+        return run_streaming(args, reader)
+
+    df = filter_rows(df, args)
+
+    print("------------------------------")
+    print(df.head())
+    print("------------------------------")
+    if len(df) <= 0:
+        return
+
+    if args.mapping_plan is None:
+        df = manual_mapping(df)
+    else:
+        df = args.mapping_plan.apply(df, source=args.file_input)
+        print("==================================")
+        print(" The following is your mapped data")
+        print(df.head())
+        print("---------------------------------")
+
+    # sort by date
+    df.sort_values(by="date", inplace=True)
+
+    account_name = get_target_account_name(args)
+    assign_account_name(df, account_name)
 
     with pd.option_context(
         "display.max_columns", None, "display.max_colwidth", 20, "display.width", 0
@@ -538,26 +865,25 @@ def run(args: argparse.Namespace):
         print(_zero_amount_transactions)
         if ask_yesno("Proceed?", default=False):
             exit(1)
-        for index, row in df.iterrows():
-            if float(row.amount) == 0:
-                df.drop(index, inplace=True)
+        df = df[df.amount.astype(float) != 0]
 
     # pprint.pprint(get_firefly_account_mappings())
 
-    new_transactions = []
-    for index, row in df.iterrows():
-        new_transaction = create_transaction_store(
-            transaction_data={
-                k: filter_map_input_to_transaction_store_input(k, v)
-                for k, v in row.to_dict().items()
-            },
-            apply_rules=True,
-        )
-        print(new_transaction)
-        new_transactions.append(new_transaction)
+    if args.skip_existing:
+        is_existing = ExistingTransactionsIndex(account_name).mark_existing(df)
+        if is_existing.any():
+            print(
+                f"> The following {is_existing.sum()} row(s) already exist in "
+                f"'{account_name}' and will be skipped."
+            )
+            print(df[is_existing])
+            df = df[~is_existing]
+    if len(df) <= 0:
+        print("> Nothing to import.")
+        return
+    print(f"> {len(df)} new transaction(s) to be imported.")
 
     # money patch to force capturing input terminal, instead of potential pipe
     sys.stdin = open("/dev/tty")
     if ask_yesno("Looks Good?", default=False):
-        for new_transaction in tqdm.tqdm(new_transactions):
-            send_transaction_store(new_transaction)
+        send_transactions(df, max_in_flight=args.max_in_flight)
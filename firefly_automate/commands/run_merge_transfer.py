@@ -4,46 +4,36 @@ import atexit
 import logging
 from dataclasses import dataclass
 from multiprocessing import Lock
-from typing import List, Set, Tuple
-
-import numpy as np
-import pandas as pd
-import pytz
-import tqdm
+from typing import TYPE_CHECKING, Iterator, List, Set, Tuple
 
 from firefly_automate.config_loader import config
-from firefly_automate.data_type.pending_update import (
-    PendingUpdates,
-)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from firefly_automate.data_type.pending_update import PendingUpdates
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 
 
 @dataclass
 class MergingRequest:
-    info_df: pd.DataFrame
+    info_df: "pd.DataFrame"
     destination_acc_name: str
-    withdrawl_to_transfer_update: PendingUpdates
+    withdrawl_to_transfer_update: "PendingUpdates"
     deposit_transaction_to_delete: str
 
     def get_ids(self):
         return tuple(sorted(int(_id) for _id in self.info_df.id.values))
 
 
-conf = config["merge_transfer"]
+def get_ignored_ids() -> Set[Tuple[int]]:
+    conf = config.get("merge_transfer", {})
+    return {tuple(sorted(pair)) for pair in conf.get("ignore_id_pairs", [])}
 
-IGNORED_IDS: Set[Tuple[int]] = {tuple(sorted(pair)) for pair in conf["ignore_id_pairs"]}
 
 PENDING_IGNORED_MERGE_REQUEST: List[MergingRequest] = []
 
 
-from firefly_automate.connections_helpers import AsyncRequest, ignore_keyboard_interrupt
-from firefly_automate.data_type.pending_update import PendingUpdates
-from firefly_automate.firefly_request_manager import (
-    get_merge_as_transfer_rule_id,
-    send_transaction_delete,
-    update_rule_action,
-)
-from firefly_automate.miscs import to_datetime
-
 LOGGER = logging.getLogger()
 
 
@@ -52,6 +42,11 @@ RULE_AND_TAGGING_LOCK = Lock()
 
 
 def merge_atomic_operation(_transfer_update, dest_acc_name: str):
+    from firefly_automate.firefly_request_manager import (
+        get_merge_as_transfer_rule_id,
+        update_rule_action,
+    )
+
     with RULE_AND_TAGGING_LOCK:
         # set the rule to auto convert tagged transaction to this destination
         update_rule_action(
@@ -107,6 +102,10 @@ REGISTERED_ON_EXIT_STATUS = False
 
 # define a function that keep track of successful merge requests
 def _on_exit_status(_queue):
+    import tqdm
+
+    from firefly_automate.connections_helpers import ignore_keyboard_interrupt
+
     # wait for all async process to finish
     successes = []
     for p in tqdm.tqdm(_queue, desc="Waiting for updates to finish in background."):
@@ -121,6 +120,9 @@ def process_in_batch(pending_updates: List[MergingRequest], _async_process_Q: Li
     if len(pending_updates) == 0:
         return
 
+    from firefly_automate.connections_helpers import AsyncRequest
+    from firefly_automate.firefly_request_manager import send_transaction_delete
+
     print("^^^^^^^^^^^^^^^^^^^^^^^^")
     print()
     print("vvvvvvvvvvvvvvvvvvvvvvvv")
@@ -183,14 +185,18 @@ def process_in_batch(pending_updates: List[MergingRequest], _async_process_Q: Li
     # pending_deletes.clear()
 
 
-def print_df(df: pd.DataFrame):
+def print_df(df: "pd.DataFrame"):
     print(df.fillna("").to_markdown(index=False, floatfmt=".2f"))
 
 
-def run(args: argparse.ArgumentParser):
-    all_transactions = args.get_transactions()
+def transactions_dataframe(
+    transactions: List["FireflyTransactionDataClass"],
+) -> "pd.DataFrame":
+    """The columns of the transactions that are shown to (and matched for) the
+    merges."""
+    import pandas as pd
 
-    IDS_to_transaction = {t.id: t for t in all_transactions}
+    from firefly_automate.miscs import to_datetime
 
     df = pd.DataFrame(
         [
@@ -203,7 +209,7 @@ def run(args: argparse.ArgumentParser):
                 t.source_name,
                 t.destination_name,
             ]
-            for t in all_transactions
+            for t in transactions
         ],
         columns=["type", "date", "id", "desc", "amount", "source", "dest"],
     )
@@ -212,6 +218,19 @@ def run(args: argparse.ArgumentParser):
         utc=True,
         # infer_datetime_format=True,
     )
+    return df
+
+
+def transfer_candidates(
+    df: "pd.DataFrame", max_amount_differences: float, max_days_differences: int
+) -> Iterator[Tuple[int, "pd.DataFrame"]]:
+    """For each withdrawal (by its position among the withdrawals of `df`), the
+    deposits into another account with about the same amount and date, i.e. the other
+    half of a transfer in between personal accounts, if there are any."""
+    import numpy as np
+    import pytz
+
+    from firefly_automate.profiling import mem_profiler
 
     withdrawal = df[df["type"] == "withdrawal"]
     deposit = df[df["type"] == "deposit"]
@@ -220,16 +239,12 @@ def run(args: argparse.ArgumentParser):
         np.asarray(withdrawal["amount"].astype(float))[:, np.newaxis]
         - np.asarray(deposit["amount"].astype(float))
     )
+    mem_profiler.checkpoint("merge amount differences")
 
-    PENDING_DELETE_ID = set()
-
-    async_process_Q = []
-
-    process_batch = []
     for withdrawal_idx in range(amount_different.shape[0]):
         # potential match based on date being similar
         potential_match_deposit_indices = np.where(
-            amount_different[withdrawal_idx, :] <= args.max_amount_differences
+            amount_different[withdrawal_idx, :] <= max_amount_differences
         )[0]
 
         if len(potential_match_deposit_indices) > 0:
@@ -245,83 +260,112 @@ def run(args: argparse.ArgumentParser):
                 withdrawal_date - deposit_dates
             ).apply(lambda x: x.days)
             potential_match_by_date = deposit.iloc[potential_match_deposit_indices][
-                withdrawal_deposit_pair_diff <= args.max_days_differences
+                withdrawal_deposit_pair_diff <= max_days_differences
             ]
 
             # remove matches that are fom the same account
             potential_match_by_date = potential_match_by_date[
                 potential_match_by_date.dest != withdrawal.iloc[withdrawal_idx].source
             ]
+            if len(potential_match_by_date) > 0:
+                yield withdrawal_idx, potential_match_by_date
 
-            # remove any matches that had already been deleted
-            potential_match_by_date = potential_match_by_date[
-                ~potential_match_by_date.id.isin(PENDING_DELETE_ID)
-            ]
 
-            if len(potential_match_by_date) > 0:
-                canidate_transfer_from = withdrawal.iloc[withdrawal_idx]
-
-                if len(potential_match_by_date) > 1:
-                    info_row = [np.nan] * (len(withdrawal.columns) - 1)
-                    info_row[1] = "---Select followings---"
-                    info_df = pd.DataFrame(
-                        [
-                            withdrawal.iloc[withdrawal_idx].values.tolist(),
-                            info_row,
-                            *potential_match_by_date.values.tolist(),
-                        ],
-                        columns=withdrawal.columns,
-                    )
-                    info_df["amount"] = pd.to_numeric(info_df.amount)
-
-                    print("===============================")
-                    print_df(info_df)
-                    while True:
-                        _id = input(
-                            f"> which transaction ID do you want to merge? {potential_match_by_date.id.tolist()} "
-                        )
-                        _potential_match_by_date = potential_match_by_date[
-                            potential_match_by_date.id == _id
-                        ]
-                        if len(_potential_match_by_date) == 1:
-                            potential_match_by_date = _potential_match_by_date
-                            break
-                        print(f"Invalid selection, not was matched.")
+def run(args: argparse.ArgumentParser):
+    import numpy as np
+    import pandas as pd
+
+    from firefly_automate.data_type.pending_update import PendingUpdates
+    from firefly_automate.profiling import mem_profiler
+
+    ignored_ids = get_ignored_ids()
+    all_transactions = args.get_transactions()
+    mem_profiler.checkpoint("fetch transactions")
 
+    IDS_to_transaction = {t.id: t for t in all_transactions}
+
+    df = transactions_dataframe(all_transactions)
+    mem_profiler.checkpoint("merge DataFrame")
+
+    withdrawal = df[df["type"] == "withdrawal"]
+
+    PENDING_DELETE_ID = set()
+
+    async_process_Q = []
+
+    process_batch = []
+    for withdrawal_idx, potential_match_by_date in transfer_candidates(
+        df, args.max_amount_differences, args.max_days_differences
+    ):
+        # remove any matches that had already been deleted
+        potential_match_by_date = potential_match_by_date[
+            ~potential_match_by_date.id.isin(PENDING_DELETE_ID)
+        ]
+
+        if len(potential_match_by_date) > 0:
+            canidate_transfer_from = withdrawal.iloc[withdrawal_idx]
+
+            if len(potential_match_by_date) > 1:
+                info_row = [np.nan] * (len(withdrawal.columns) - 1)
+                info_row[1] = "---Select followings---"
                 info_df = pd.DataFrame(
                     [
                         withdrawal.iloc[withdrawal_idx].values.tolist(),
+                        info_row,
                         *potential_match_by_date.values.tolist(),
                     ],
                     columns=withdrawal.columns,
                 )
+                info_df["amount"] = pd.to_numeric(info_df.amount)
 
-                canidate_transfer_to = potential_match_by_date.iloc[0]
-
-                merge_request = MergingRequest(
-                    info_df=info_df,
-                    destination_acc_name=canidate_transfer_to.dest,
-                    withdrawl_to_transfer_update=PendingUpdates(
-                        IDS_to_transaction[canidate_transfer_from.id],
-                        "merging",
-                        apply_rule=True,
-                        updates_kwargs=dict(
-                            description=f"[{canidate_transfer_from.desc}] > [{canidate_transfer_to.desc}]",
-                            tags=["AUTOMATE_convert-as-transfer"],
-                        ),
+                print("===============================")
+                print_df(info_df)
+                while True:
+                    _id = input(
+                        f"> which transaction ID do you want to merge? {potential_match_by_date.id.tolist()} "
+                    )
+                    _potential_match_by_date = potential_match_by_date[
+                        potential_match_by_date.id == _id
+                    ]
+                    if len(_potential_match_by_date) == 1:
+                        potential_match_by_date = _potential_match_by_date
+                        break
+                    print(f"Invalid selection, not was matched.")
+
+            info_df = pd.DataFrame(
+                [
+                    withdrawal.iloc[withdrawal_idx].values.tolist(),
+                    *potential_match_by_date.values.tolist(),
+                ],
+                columns=withdrawal.columns,
+            )
+
+            canidate_transfer_to = potential_match_by_date.iloc[0]
+
+            merge_request = MergingRequest(
+                info_df=info_df,
+                destination_acc_name=canidate_transfer_to.dest,
+                withdrawl_to_transfer_update=PendingUpdates(
+                    IDS_to_transaction[canidate_transfer_from.id],
+                    "merging",
+                    apply_rule=True,
+                    updates_kwargs=dict(
+                        description=f"[{canidate_transfer_from.desc}] > [{canidate_transfer_to.desc}]",
+                        tags=["AUTOMATE_convert-as-transfer"],
                     ),
-                    deposit_transaction_to_delete=canidate_transfer_to.id,
-                )
+                ),
+                deposit_transaction_to_delete=canidate_transfer_to.id,
+            )
 
-                if merge_request.get_ids() in IGNORED_IDS:
-                    continue
+            if merge_request.get_ids() in ignored_ids:
+                continue
 
-                process_batch.append(merge_request)
-                PENDING_DELETE_ID.add(canidate_transfer_to.id)
+            process_batch.append(merge_request)
+            PENDING_DELETE_ID.add(canidate_transfer_to.id)
 
-                if len(process_batch) >= args.batch_size:
-                    process_in_batch(process_batch, async_process_Q)
-                    process_batch.clear()
+            if len(process_batch) >= args.batch_size:
+                process_in_batch(process_batch, async_process_Q)
+                process_batch.clear()
 
     process_in_batch(process_batch, async_process_Q)
     process_batch.clear()
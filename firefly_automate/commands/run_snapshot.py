@@ -0,0 +1,37 @@
+#!/bin/env python
+import argparse
+
+command_name = "snapshot"
+
+
+def init_subparser(parser):
+    parser.add_argument(
+        "path",
+        help=(
+            "File to save the transactions (within --start and --end), accounts, "
+            "tags and rules to, which is gzipped if it ends with .gz. Use it with "
+            "--offline."
+        ),
+        type=str,
+    )
+
+
+def run(args: argparse.Namespace):
+    from firefly_automate.firefly_request_manager import (
+        get_all_account_entries,
+        get_all_tag_entries,
+        get_rules,
+        get_transaction_entries,
+    )
+    from firefly_automate.offline import Snapshot
+
+    transactions = list(get_transaction_entries(args.start, args.end))
+    accounts = get_all_account_entries()
+    rules = list(get_rules())
+    tags = get_all_tag_entries()
+    Snapshot.save(args.path, args.start, args.end, transactions, accounts, rules, tags)
+    print(
+        f"> Saved {len(transactions)} transaction(s) from {args.start} to {args.end}, "
+        f"{len(accounts)} account(s), {len(tags)} tag(s) and {len(rules)} rule(s) "
+        f"to {args.path}"
+    )
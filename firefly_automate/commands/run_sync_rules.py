@@ -0,0 +1,145 @@
+#!/bin/env python
+import argparse
+from typing import Any, Dict, List, Tuple
+
+from firefly_automate.miscs import prompt_response
+
+command_name = "sync_rules"
+
+
+def init_subparser(parser):
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show the rules that would be created, updated or deleted",
+    )
+    parser.add_argument(
+        "--fire",
+        action="store_true",
+        help=(
+            "After syncing, let the server apply the rule groups on the transactions "
+            "within --start and --end"
+        ),
+    )
+    parser.add_argument(
+        "--keep-stale",
+        action="store_true",
+        help=(
+            "Do not delete remote rules (and rule groups) that no longer exist in the "
+            "config"
+        ),
+    )
+
+
+def _call(functor, *args):
+    return functor(*args)
+
+
+def run(args: argparse.Namespace):
+    from firefly_automate.connections_helpers import BoundedWriter
+    from firefly_automate.firefly_request_manager import (
+        create_rule_group,
+        delete_rule,
+        delete_rule_group,
+        fire_rule_group,
+        get_rule_groups,
+        get_rules_of_group,
+        store_rule,
+        update_rule,
+    )
+    from firefly_automate.server_rules import (
+        FINGERPRINT_PREFIX,
+        RULE_GROUP_PREFIX,
+        compile_rules,
+    )
+
+    compiled = compile_rules()
+    for name, reason in compiled.skipped:
+        print(f"> Not syncing [{name}], as {reason} (only applied by transform).")
+
+    rule_groups = get_rule_groups()
+    # group title -> (group id, new rules, changed rules (with remote id), stale ids)
+    plans: Dict[str, Tuple[str, List, List[Tuple[str, Any]], List[str]]] = {}
+    for group, rules in compiled.rules.items():
+        group_id = rule_groups.get(group)
+        existing = {}
+        if group_id is not None:
+            existing = {
+                r["attributes"]["title"]: r for r in get_rules_of_group(group_id)
+            }
+
+        new_rules, changed_rules = [], []
+        for rule in rules:
+            if rule.title not in existing:
+                new_rules.append(rule)
+            elif (
+                f"{FINGERPRINT_PREFIX}{rule.fingerprint}"
+                not in existing[rule.title]["attributes"]["description"]
+            ):
+                changed_rules.append((existing[rule.title]["id"], rule))
+        stale_titles = []
+        if not args.keep_stale:
+            titles = set(r.title for r in rules)
+            stale_titles = [t for t in existing if t not in titles]
+        stale_ids = [existing[t]["id"] for t in stale_titles]
+        plans[group] = (group_id, new_rules, changed_rules, stale_ids)
+
+        num_unchanged = len(rules) - len(new_rules) - len(changed_rules)
+        print(
+            f"{group}: {len(new_rules)} new, {len(changed_rules)} changed, "
+            f"{num_unchanged} unchanged, {len(stale_ids)} stale"
+        )
+        for rule in new_rules:
+            print(f"  + {rule.title}")
+        for _, rule in changed_rules:
+            print(f"  ~ {rule.title}")
+        for title in stale_titles:
+            print(f"  - {title}")
+
+    # the groups of configs that were removed (or have nothing to sync anymore),
+    # whose rules would otherwise keep running on the server
+    stale_groups = {
+        title: group_id
+        for title, group_id in rule_groups.items()
+        if title.startswith(RULE_GROUP_PREFIX) and title not in compiled.rules
+    }
+    for title in stale_groups:
+        kept = " (kept, as --keep-stale is given)" if args.keep_stale else ""
+        print(f"{title}: stale, as it is no longer in the config{kept}")
+    if args.keep_stale:
+        stale_groups = {}
+
+    num_writes = sum(len(n) + len(c) + len(s) for _, n, c, s in plans.values())
+    num_writes += len(stale_groups)
+    if args.dry_run:
+        return
+    if num_writes > 0 and (
+        args.yes or prompt_response(">> Ready to sync the above rules?")
+    ):
+        with BoundedWriter(_call, desc="syncing rules", total=num_writes) as writer:
+            for group, (group_id, new_rules, changed_rules, stale_ids) in list(
+                plans.items()
+            ):
+                if group_id is None:
+                    group_id = create_rule_group(
+                        group, description="Auto generated by firefly-automate."
+                    )
+                    plans[group] = (group_id, new_rules, changed_rules, stale_ids)
+                for rule in new_rules:
+                    writer.submit(store_rule, rule, group_id)
+                for rule_id, rule in changed_rules:
+                    writer.submit(update_rule, rule_id, rule, group_id)
+                for rule_id in stale_ids:
+                    writer.submit(delete_rule, rule_id)
+            for group_id in stale_groups.values():
+                writer.submit(delete_rule_group, group_id)
+        for _, exception in writer.failures:
+            print(f"[ERROR] {exception}")
+        print(f"> Synced {writer.num_succeeded}/{num_writes} rule(s) and group(s).")
+
+    if args.fire:
+        for group, (group_id, *_) in plans.items():
+            if group_id is None:
+                continue
+            print(f"> Firing {group} on transactions from {args.start} to {args.end}")
+            fire_rule_group(group_id, args.start, args.end)
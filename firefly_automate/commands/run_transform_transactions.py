@@ -1,57 +1,93 @@
 #!/bin/env python
 import argparse
+import functools
 import logging
-from typing import Dict, Set
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, List, Optional
 
-import tqdm
-
-from firefly_automate import rules
-from firefly_automate.config_loader import config
-from firefly_automate.data_type.pending_update import PendingUpdates
-from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
-from firefly_automate.firefly_request_manager import send_transaction_delete
 from firefly_automate.miscs import group_by, prompt_response
+from firefly_automate.rule_memo import MEMO_FILE_NAME
+
+if TYPE_CHECKING:
+    from firefly_automate.data_type.pending_update import PendingUpdates
+    from firefly_automate.data_type.transaction_query import TransactionQuery
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+    from firefly_automate.rule_engine import RuleEngine
+    from firefly_automate.rules.base_rule import Rule
 
 LOGGER = logging.getLogger()
 
 command_name = "transform"
 
-pending_updates: Dict[int, PendingUpdates] = {}
-pending_deletes: Set[int] = set()
+# beyond this many searches, fetching all transactions at once is faster
+MAX_TRANSACTION_QUERIES = 10
+
+
+@functools.lru_cache
+def get_all_rules() -> List["Rule"]:
+    """Instantiate all rules (only to list them). This is deferred until they are
+    actually needed, as it imports every rule module and validates their config."""
+    from firefly_automate.rule_engine import instantiate_rules
+
+    return instantiate_rules({}, set())
 
-all_rules = [
-    cls(
-        pending_updates=pending_updates, pending_deletes=pending_deletes  # type: ignore
-    )
-    for cls in rules.base_rule.Rule.__subclasses__()
-]
-all_rules_name = list(map(lambda r: r.base_name, all_rules))
-available_rules = list(filter(lambda x: x.enable_by_default, all_rules))
-available_rules_name = list(map(lambda r: r.base_name, available_rules))
+
+def get_all_rules_name(**kwargs) -> List[str]:
+    # kwargs are given when being used as an argcomplete completer
+    return list(map(lambda r: r.base_name, get_all_rules()))
+
+
+def rule_name(name: str) -> str:
+    """Argparse type that validates the given name against the available rules."""
+    if name not in get_all_rules_name():
+        raise argparse.ArgumentTypeError(
+            f"invalid choice: '{name}' (choose from {', '.join(get_all_rules_name())})"
+        )
+    return name
 
 
 def init_subparser(parser):
     parser.add_argument(
         "--run",
-        choices=all_rules_name,
-        help="Only run the specified rule",
-        type=str,
-    )
+        help="Only run the specified rule (see --list-rules)",
+        type=rule_name,
+    ).completer = get_all_rules_name
     parser.add_argument(
         "-d",
         "--disable",
         default=[],
         nargs="+",
-        choices=available_rules_name,
         help="Disable the following rules",
-        type=str,
-    )
+        type=rule_name,
+    ).completer = get_all_rules_name
     parser.add_argument(
         "--rule-config",
         default="",
         help="String that pass to rule backend",
         type=str,
     )
+    parser.add_argument(
+        "--full-scan",
+        action="store_true",
+        help="Always fetch all transactions, instead of only those the rules query",
+    )
+    parser.add_argument(
+        "--no-memo",
+        action="store_true",
+        help="Evaluate all rules on all transactions, even if they are unchanged since "
+        "the rules last had nothing to update on them",
+    )
+    parser.add_argument(
+        "--memo-file-name",
+        default=MEMO_FILE_NAME,
+        help="File name to store the results of the previous runs.",
+        type=str,
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show the updates, without applying them",
+    )
     parser.add_argument(
         "--list-rules",
         action="store_true",
@@ -59,60 +95,147 @@ def init_subparser(parser):
     )
 
 
-def run(args: argparse.Namespace):
-    global available_rules
+_rule_engine: "RuleEngine" = None
+
+
+def get_rule_engine(args: argparse.Namespace) -> "RuleEngine":
+    global _rule_engine
+    if _rule_engine is None:
+        from firefly_automate.rule_engine import RuleEngine
+
+        # without its memo, which is only opened once the rules are run
+        _rule_engine = RuleEngine(
+            run=args.run, disable=args.disable, rule_config=args.rule_config
+        )
+    return _rule_engine
+
+
+def needs_prefetch(args: argparse.Namespace) -> bool:
+    """Whether the startup prefetch is of any use, i.e. the transactions are going
+    to be transformed."""
+    return not args.list_rules
+
+
+def transaction_queries(args: argparse.Namespace) -> Optional[List["TransactionQuery"]]:
+    """The union of the enabled rules' server-side queries, or None if all the
+    transactions need to be fetched."""
+    if args.full_scan:
+        return None
+    queries = get_rule_engine(args).server_queries()
+    if queries is None or len(queries) > MAX_TRANSACTION_QUERIES:
+        return None
+    return queries
 
+
+def get_transactions(args: argparse.Namespace) -> List["FireflyTransactionDataClass"]:
+    queries = transaction_queries(args)
+    if queries is None:
+        return args.get_transactions()
+
+    from firefly_automate.firefly_request_manager import get_transactions_matching
+
+    return get_transactions_matching(queries, args.start, args.end)
+
+
+@dataclass
+class TransformReport:
+    num_transactions: int = 0
+    num_evaluated: int = 0
+    num_updates: int = 0
+    num_deletes: int = 0
+    # whether the above updates/deletes were applied
+    applied: bool = False
+    # updates of reconciled transactions, which were not to be overridden
+    num_skipped_reconciled: int = 0
+
+
+def run(args: argparse.Namespace) -> Optional[TransformReport]:
     if args.list_rules:
-        print("\n".join(all_rules_name))
-        return
-    if args.run:
-        available_rules = list(filter(lambda x: x.base_name == args.run, all_rules))
-
-    def process_one_transaction(entry: FireflyTransactionDataClass):
-        try:
-            for rule in available_rules:
-                if rule.base_name in args.disable:
-                    continue
-                rule.process(entry)
-        except rules.base_rule.StopRuleProcessing:
-            pass
-
-    all_transactions = args.get_transactions()
-
-    for rule in available_rules:
-        rule.set_all_transactions(all_transactions)
-        rule.set_rule_config(args.rule_config)
-    # TODO: make this parallel if num of transactions is huge
-    for data in filter(
-        lambda t: t.id not in config["ignore_transaction_ids"], all_transactions
-    ):
-        process_one_transaction(data)
+        print("\n".join(get_all_rules_name()))
+        return None
+
+    import tqdm
+
+    from firefly_automate.firefly_request_manager import send_transaction_delete
+    from firefly_automate.profiling import mem_profiler, profiler
+    from firefly_automate.rule_memo import RuleMemo
+
+    engine = get_rule_engine(args)
+    if not args.no_memo:
+        engine.set_memo(RuleMemo(args.memo_file_name))
+    with profiler.phase("fetch transactions"):
+        transactions = get_transactions(args)
+    mem_profiler.checkpoint("fetch transactions")
+    with profiler.phase("apply rules"):
+        num_evaluated = engine.process(transactions)
+    mem_profiler.checkpoint("apply rules")
+    report = TransformReport(
+        num_transactions=len(transactions),
+        num_evaluated=num_evaluated,
+    )
+    pending_updates, pending_deletes = engine.pending_updates, engine.pending_deletes
+    if engine.memo is not None:
+        engine.memo.close()
+        if engine.memo.num_skipped > 0:
+            print(
+                f"> Skipped {engine.memo.num_skipped} transaction(s) that are unchanged "
+                f"since the last run (see --no-memo)."
+            )
 
     print("========================")
 
     if len(pending_updates) == 0 and len(pending_deletes) == 0:
         print("No update necessary.")
-        exit()
 
     elif len(pending_updates) > 0:
-        for acc, updates_in_one_acc in group_by(
-            pending_updates.values(), lambda x: x.acc
-        ).items():
-            print(f"{acc}:")
-            grouped_rule_updates = group_by(updates_in_one_acc, lambda x: x.rule)
-            for rule_name, updates_in_one_rule in grouped_rule_updates.items():
-                print(f" >> rule: {rule_name} <<")
-                for updates in sorted(updates_in_one_rule, key=lambda x: x.date):
-                    print(updates)
-
+        report.num_updates = len(pending_updates)
+        print_pending_updates(pending_updates.values())
         print("=========================")
-        if args.yes or prompt_response(
-            ">> IMPORTANT: Review the above output and see if the updates are ok:"
+        if not args.dry_run and (
+            args.yes
+            or prompt_response(
+                ">> IMPORTANT: Review the above output and see if the updates are ok:"
+            )
         ):
-            for updates in tqdm.tqdm(pending_updates.values(), desc="Applying updates"):
-                updates.apply(dry_run=False)
+            with profiler.phase("send updates"):
+                for updates in tqdm.tqdm(
+                    pending_updates.values(), desc="Applying updates"
+                ):
+                    api_responses = updates.apply(
+                        dry_run=False, interactive=args.interactive
+                    )
+                    # nothing is sent back offline, as nothing is sent
+                    if (
+                        api_responses is None
+                        and updates.entry.reconciled
+                        and not args.offline
+                    ):
+                        report.num_skipped_reconciled += 1
+            report.applied = True
+            if report.num_skipped_reconciled > 0:
+                print(
+                    f"> Skipped {report.num_skipped_reconciled} reconciled "
+                    f"transaction(s) (see --always-override-reconciled)."
+                )
 
     elif len(pending_deletes) > 0:
-        if args.yes or prompt_response(">> Ready to perform the delete?"):
-            for deletes_id in tqdm.tqdm(pending_deletes, desc="Applying deletes"):
-                send_transaction_delete(int(deletes_id))
+        report.num_deletes = len(pending_deletes)
+        if not args.dry_run and (
+            args.yes or prompt_response(">> Ready to perform the delete?")
+        ):
+            with profiler.phase("send deletes"):
+                for deletes_id in tqdm.tqdm(pending_deletes, desc="Applying deletes"):
+                    send_transaction_delete(int(deletes_id))
+            report.applied = True
+    return report
+
+
+def print_pending_updates(pending_updates: Iterable["PendingUpdates"]):
+    """Print the updates grouped by account, and then by rule."""
+    for acc, updates_in_one_acc in group_by(pending_updates, lambda x: x.acc).items():
+        print(f"{acc}:")
+        grouped_rule_updates = group_by(updates_in_one_acc, lambda x: x.rule)
+        for rule_name, updates_in_one_rule in grouped_rule_updates.items():
+            print(f" >> rule: {rule_name} <<")
+            for updates in sorted(updates_in_one_rule, key=lambda x: x.date):
+                print(updates)
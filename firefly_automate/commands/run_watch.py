@@ -0,0 +1,232 @@
+#!/bin/env python
+import argparse
+import datetime
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from firefly_automate.commands.run_transform_transactions import (
+    MAX_TRANSACTION_QUERIES,
+    get_all_rules_name,
+    rule_name,
+)
+from firefly_automate.config_loader import config
+from firefly_automate.rule_memo import MEMO_FILE_NAME
+
+if TYPE_CHECKING:
+    from firefly_automate.data_type.pending_update import PendingUpdates
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+    from firefly_automate.rule_engine import RuleEngine
+    from firefly_automate.rule_memo import RuleMemo
+
+command_name = "watch"
+
+
+def init_subparser(parser):
+    parser.add_argument(
+        "--interval",
+        default=300,
+        help="Seconds in between each poll",
+        type=float,
+    )
+    parser.add_argument(
+        "--lookback-days",
+        default=7,
+        help="Each poll looks at the transactions of this many recent days",
+        type=int,
+    )
+    parser.add_argument(
+        "-d",
+        "--disable",
+        default=[],
+        nargs="+",
+        help="Disable the following rules",
+        type=rule_name,
+    ).completer = get_all_rules_name
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show the updates, without applying them",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Poll once and then exit",
+    )
+    parser.add_argument(
+        "--memo-file-name",
+        default=MEMO_FILE_NAME,
+        help="File name to store the results of the previous polls and runs.",
+        type=str,
+    )
+
+
+@dataclass
+class PollState:
+    """What the previous polls had seen, such that a poll only fetches (and
+    evaluates) what changed since."""
+
+    # the transactions whose updates were skipped as they are reconciled (by id, the
+    # content hash that they had), which would otherwise be skipped again every poll
+    reconciled: Dict[str, str] = field(default_factory=dict)
+    # the transactions that were not created or edited since this day had already
+    # been processed
+    updated_after: Optional[datetime.date] = None
+
+    def is_skipped(self, entry: "FireflyTransactionDataClass") -> bool:
+        from firefly_automate.rule_memo import transaction_hash
+
+        content_hash = self.reconciled.get(entry.id)
+        return content_hash is not None and content_hash == transaction_hash(entry)
+
+
+def _connection_settings():
+    return config.get("firefly_iii_host"), config.get("firefly_iii_token")
+
+
+def _config_mtime() -> Optional[float]:
+    try:
+        return os.path.getmtime(os.path.expanduser(config.path))
+    except OSError:
+        return None
+
+
+def reload_config() -> bool:
+    """Reload the config file if it is valid, otherwise keep using the current one."""
+    from firefly_automate import miscs
+    from firefly_automate.config_loader import load_config
+    from firefly_automate.firefly_request_manager import (
+        get_api_client,
+        get_firefly_account_mappings,
+        get_merge_as_transfer_rule_id,
+    )
+
+    try:
+        load_config(config.path, config.instance)
+    except Exception as e:
+        print(f"[ERROR] Not reloading the invalid config: {e}")
+        return False
+    connection_settings = _connection_settings()
+    config.reload()
+    if _connection_settings() != connection_settings:
+        # everything that was fetched (or connected to) is of the previous server
+        get_api_client.cache_clear()
+        get_firefly_account_mappings.cache_clear()
+        get_merge_as_transfer_rule_id.cache_clear()
+        miscs.args.cache.min_fetched_at = time.time()
+        print("> Connecting to the server of the reloaded config.")
+    return True
+
+
+def build_rule_engine(args: argparse.Namespace, memo: "RuleMemo") -> "RuleEngine":
+    from firefly_automate.rule_engine import RuleEngine
+
+    # only the rules that are enabled by default, as the others are interactive
+    # (or delete transactions)
+    return RuleEngine(disable=args.disable, memo=memo)
+
+
+def fetch_transactions(
+    engine: "RuleEngine",
+    start: datetime.date,
+    end: datetime.date,
+    updated_after: Optional[datetime.date] = None,
+) -> List["FireflyTransactionDataClass"]:
+    """Fetch the transactions that the rules need, bypassing the cached ones. With
+    `updated_after`, only those that were created or edited since then (except for
+    the rules that need all of them, see `RuleEngine.server_queries`)."""
+    from firefly_automate.firefly_request_manager import (
+        fetch_with_cache,
+        get_transactions,
+        get_transactions_matching,
+    )
+
+    queries = engine.server_queries(updated_after)
+    if queries is None or len(queries) > MAX_TRANSACTION_QUERIES:
+        return fetch_with_cache(
+            ("transaction", start, end),
+            lambda: list(get_transactions(start, end)),
+            ttl=0,
+        )
+    return get_transactions_matching(queries, start, end, ttl=0)
+
+
+def _apply_update(updates: "PendingUpdates", state: PollState):
+    from firefly_automate.rule_memo import transaction_hash
+
+    # nobody is there to confirm overriding reconciled transactions
+    if updates.apply(dry_run=False, interactive=False) is None:
+        if updates.entry.reconciled:
+            state.reconciled[updates.entry.id] = transaction_hash(updates.entry)
+
+
+def poll(engine: "RuleEngine", args: argparse.Namespace, state: PollState):
+    from firefly_automate.commands.run_transform_transactions import (
+        print_pending_updates,
+    )
+    from firefly_automate.connections_helpers import BoundedWriter
+
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=args.lookback_days)
+    transactions = fetch_transactions(engine, start, end, state.updated_after)
+    num_evaluated = engine.process([t for t in transactions if not state.is_skipped(t)])
+    # the updates of dry runs are not applied, hence are shown again next time
+    processed = not args.dry_run
+    pending_updates = engine.pending_updates
+    print(
+        f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {num_evaluated} new or "
+        f"changed transaction(s), {len(pending_updates)} to update."
+    )
+    if len(pending_updates) > 0:
+        print_pending_updates(pending_updates.values())
+        if not args.dry_run:
+            with BoundedWriter(
+                _apply_update, desc="applying updates", total=len(pending_updates)
+            ) as writer:
+                for updates in pending_updates.values():
+                    writer.submit(updates, state)
+            for (updates, _), exception in writer.failures:
+                print(f"[ERROR] Transaction {updates.entry.id}: {exception}")
+            # such that the next poll tries them again
+            processed = len(writer.failures) == 0
+    engine.clear()
+    engine.memo.sync()
+    if processed:
+        # (from the day before, as the server may be in another timezone)
+        state.updated_after = end - datetime.timedelta(days=1)
+
+
+def run(args: argparse.Namespace):
+    from firefly_automate.rule_memo import RuleMemo
+
+    memo = RuleMemo(args.memo_file_name)
+    engine = build_rule_engine(args, memo)
+    state = PollState()
+    config_mtime = _config_mtime()
+    print(
+        f"> Watching the transactions of the last {args.lookback_days} day(s), "
+        f"every {args.interval:g} seconds."
+    )
+    try:
+        while True:
+            if _config_mtime() != config_mtime:
+                config_mtime = _config_mtime()
+                if reload_config():
+                    # the new rules may update what the previous ones did not
+                    engine = build_rule_engine(args, memo)
+                    state = PollState()
+                    print("> Reloaded the config.")
+            try:
+                poll(engine, args, state)
+            except Exception as e:
+                # e.g. the host is temporarily unreachable; try again next time
+                engine.clear()
+                print(f"[ERROR] Failed to poll: {e}")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\n> Stopped watching.")
+    finally:
+        memo.close()
@@ -0,0 +1,318 @@
+#!/bin/env python
+"""
+Receives the webhooks of Firefly III (on transaction store/update), and applies the
+rules on each received transaction as soon as it arrives.
+
+To try it out locally, run with `--dry-run` and POST a recorded (or the sample)
+payload, e.g.
+
+    firefly-automate webhook --print-sample > payload.json
+    curl -X POST --data @payload.json http://127.0.0.1:8089
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from firefly_automate.commands.run_transform_transactions import (
+    get_all_rules_name,
+    rule_name,
+)
+
+if TYPE_CHECKING:
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+    from firefly_automate.rule_engine import RuleEngine
+
+command_name = "webhook"
+
+# the triggers of which the payload has a transaction to apply the rules on
+HANDLED_TRIGGERS = ("STORE_TRANSACTION", "UPDATE_TRANSACTION")
+# seconds that a signed payload is valid for, such that a captured webhook cannot be
+# replayed later on
+SIGNATURE_TOLERANCE = 5 * 60
+
+SAMPLE_PAYLOAD = {
+    "uuid": "0fcf0ee8-1d6f-4c2c-9e6a-1b0a4a5d4d3e",
+    "user_id": 1,
+    "trigger": "STORE_TRANSACTION",
+    "response": "TRANSACTIONS",
+    "url": "http://127.0.0.1:8089",
+    "version": "v0",
+    "content": {
+        "id": 1234,
+        "created_at": "2023-01-01T10:00:00+00:00",
+        "updated_at": "2023-01-01T10:00:00+00:00",
+        "user": 1,
+        "group_title": None,
+        "transactions": [
+            {
+                "user": 1,
+                "transaction_journal_id": 1234,
+                "type": "withdrawal",
+                "date": "2023-01-01T00:00:00+00:00",
+                "order": 0,
+                "currency_id": 1,
+                "currency_code": "AUD",
+                "currency_name": "Australian dollar",
+                "currency_symbol": "$",
+                "currency_decimal_places": 2,
+                "foreign_currency_id": None,
+                "foreign_currency_decimal_places": None,
+                "amount": "12.50",
+                "description": "WOOLWORTHS 1234 SYDNEY",
+                "source_id": 1,
+                "source_name": "Checking account",
+                "source_iban": None,
+                "source_type": "Asset account",
+                "destination_id": 2,
+                "destination_name": "WOOLWORTHS 1234 SYDNEY",
+                "destination_type": "Expense account",
+                "budget_id": None,
+                "category_id": None,
+                "category_name": None,
+                "reconciled": False,
+                "tags": [],
+                "internal_reference": None,
+                "external_id": None,
+                "original_source": "ff3-v5.7.0",
+            }
+        ],
+    },
+}
+
+
+def init_subparser(parser):
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on",
+        type=str,
+    )
+    parser.add_argument(
+        "--port",
+        default=8089,
+        help="Port to listen on",
+        type=int,
+    )
+    parser.add_argument(
+        "--workers",
+        default=4,
+        help="Number of workers that apply the rules and send the updates",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-queued",
+        default=1000,
+        help="Number of received transactions that can wait for a worker, before "
+        "the webhooks are rejected (and hence retried by Firefly III)",
+        type=int,
+    )
+    parser.add_argument(
+        "--secret",
+        default=os.getenv("FIREFLY_WEBHOOK_SECRET"),
+        help="Secret of the webhook, to verify the signature of the payloads "
+        "(default: $FIREFLY_WEBHOOK_SECRET). Unsigned payloads are accepted if unset.",
+        type=str,
+    )
+    parser.add_argument(
+        "-d",
+        "--disable",
+        default=[],
+        nargs="+",
+        help="Disable the following rules",
+        type=rule_name,
+    ).completer = get_all_rules_name
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show the updates, without applying them",
+    )
+    parser.add_argument(
+        "--print-sample",
+        action="store_true",
+        help="Print a sample payload (to POST for testing) and then exit",
+    )
+
+
+class InvalidPayload(ValueError):
+    pass
+
+
+def verify_signature(
+    secret: str, body: bytes, signature: Optional[str], now: float = None
+) -> bool:
+    """Firefly III signs the payload as `t=<timestamp>,v1=<signature>`, where the
+    signature is the sha3-256 HMAC of `<timestamp>.<payload>`. The timestamp must be
+    within `SIGNATURE_TOLERANCE` seconds of now."""
+    if signature is None:
+        return False
+    parts = dict(part.split("=", 1) for part in signature.split(",") if "=" in part)
+    if "t" not in parts or "v1" not in parts:
+        return False
+    try:
+        timestamp = int(parts["t"])
+    except ValueError:
+        return False
+    if now is None:
+        now = time.time()
+    if abs(now - timestamp) > SIGNATURE_TOLERANCE:
+        return False
+    expected = hmac.new(
+        secret.encode(),
+        parts["t"].encode() + b"." + body,
+        hashlib.sha3_256,
+    ).hexdigest()
+    return hmac.compare_digest(expected, parts["v1"])
+
+
+def _normalise_split(split: Dict[str, Any]) -> Dict[str, Any]:
+    # the webhooks send ids as numbers, whereas the api sends them as strings
+    return {
+        k: str(v) if k.endswith("_id") and isinstance(v, int) else v
+        for k, v in split.items()
+    }
+
+
+def parse_payload(body: bytes) -> List["FireflyTransactionDataClass"]:
+    """The transactions in the payload of a webhook (none if it is not about a
+    stored or updated transaction)."""
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+
+    try:
+        payload = json.loads(body)
+        if payload.get("trigger") not in HANDLED_TRIGGERS:
+            return []
+        if payload.get("response") != "TRANSACTIONS":
+            raise InvalidPayload(
+                f"the webhook must respond with TRANSACTIONS, not {payload['response']}"
+            )
+        content = payload["content"]
+        splits = content["transactions"]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        if isinstance(e, InvalidPayload):
+            raise
+        raise InvalidPayload(f"unexpected payload: {e!r}") from e
+    if len(splits) != 1:
+        # the same as when fetching the transactions, split transactions are not
+        # supported by the rules
+        raise InvalidPayload(f"transaction {content['id']} has {len(splits)} splits")
+    return [
+        FireflyTransactionDataClass(
+            id=str(content["id"]), **_normalise_split(splits[0])
+        )
+    ]
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Receives the webhooks and queues their transactions for the workers, such
+    that bursts of webhooks are answered immediately."""
+
+    daemon_threads = True
+
+    def __init__(self, address, args: argparse.Namespace, engine: "RuleEngine"):
+        super().__init__(address, WebhookRequestHandler)
+        self.args = args
+        self.engine = engine
+        # the rules are not thread-safe
+        self.engine_lock = threading.Lock()
+        self.queue: "queue.Queue[Optional[FireflyTransactionDataClass]]" = queue.Queue(
+            maxsize=args.max_queued
+        )
+        self.workers = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(args.workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            try:
+                self.process(entry)
+            except Exception as e:
+                print(f"[ERROR] Transaction {entry.id}: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    def process(self, entry: "FireflyTransactionDataClass"):
+        with self.engine_lock:
+            self.engine.process([entry])
+            pending_updates = list(self.engine.pending_updates.values())
+            self.engine.clear()
+        for updates in pending_updates:
+            print(updates)
+            if not self.args.dry_run:
+                # nobody is there to confirm overriding reconciled transactions
+                updates.apply(dry_run=False, interactive=False)
+
+    def stop(self):
+        self.shutdown()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.server_close()
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def _respond(self, status: int, message: str):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.write(message.encode())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        secret = self.server.args.secret
+        if secret and not verify_signature(secret, body, self.headers.get("Signature")):
+            self._respond(401, "invalid signature")
+            return
+        try:
+            transactions = parse_payload(body)
+        except InvalidPayload as e:
+            print(f"[ERROR] Rejected webhook: {e}")
+            self._respond(400, str(e))
+            return
+        for entry in transactions:
+            try:
+                self.server.queue.put_nowait(entry)
+            except queue.Full:
+                self._respond(503, "too many pending transactions")
+                return
+        self._respond(202, "accepted")
+
+    def log_message(self, format, *args):
+        # only the rule results are of interest
+        pass
+
+
+def run(args: argparse.Namespace):
+    if args.print_sample:
+        print(json.dumps(SAMPLE_PAYLOAD, indent=2))
+        return
+
+    from firefly_automate.rule_engine import RuleEngine
+
+    # only the rules that are enabled by default, as the others are interactive
+    # (or delete transactions)
+    server = WebhookServer(
+        (args.host, args.port), args, RuleEngine(disable=args.disable)
+    )
+    print(f"> Listening for webhooks on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n> Stopping, after the queued transactions are processed.")
+    finally:
+        server.stop()
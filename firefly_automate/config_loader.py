@@ -1,8 +1,9 @@
 import os
-from typing import Dict, List, Union
+from collections.abc import MutableMapping
+from typing import Any, Dict, List, Union
 
 import yaml
-from schema import Optional, Schema
+from schema import Optional, Schema, SchemaError
 
 YamlItemType = Union[Dict[str, object], List[object], str, int, None]
 JsonSerializableNonNesting = Union[str, int, List[str], List[int]]
@@ -47,8 +48,9 @@ for rule_name in config["rules"].keys():
 
 main_config_schema = Schema(
     {
-        "firefly_iii_token": str,
-        "firefly_iii_host": str,
+        # required, unless every instance has their own
+        Optional("firefly_iii_token"): str,
+        Optional("firefly_iii_host"): str,
         # various rules will be validated individually within their classes
         Optional("rules"): Schema({str: object}),
         # priority should be a str maps to a list of str
@@ -58,19 +60,105 @@ main_config_schema = Schema(
         Optional("vendor_name_mappings"): Schema({str: str}),
         Optional("ignore_transaction_ids"): Schema([int]),
         Optional("merge_transfer"): Schema({Optional("ignore_id_pairs"): [[int]]}),
+        # named firefly-iii instances (e.g. separated ledgers), which override the
+        # above settings (the rules are overridden per rule name)
+        Optional("instances"): Schema(
+            {
+                str: Schema(
+                    {
+                        "firefly_iii_token": str,
+                        "firefly_iii_host": str,
+                        Optional(str): object,
+                    }
+                )
+            }
+        ),
     }
 )
 
-with open(os.path.expanduser("~/.config/firefly-automate/config.yaml")) as file:
-    # The FullLoader parameter handles the conversion from YAML
-    # scalar values to Python the dictionary format
-    config = yaml.safe_load(file) or dict()
+CONFIG_PATH = "~/.config/firefly-automate/config.yaml"
+
+
+def instance_config(config: Dict[str, Any], instance: str) -> Dict[str, Any]:
+    """The config of the given instance, i.e. the main config overridden by the
+    instance's settings."""
+    if instance not in config.get("instances", {}):
+        raise SchemaError(f"No instance named '{instance}' in the config")
+    merged = {k: v for k, v in config.items() if k != "instances"}
+    for key, val in config["instances"][instance].items():
+        if key == "rules":
+            val = {**merged.get("rules", {}), **val}
+        merged[key] = val
+    return main_config_schema.validate(merged)
+
+
+def load_config(path: str = CONFIG_PATH, instance: str = None) -> Dict[str, Any]:
+    with open(os.path.expanduser(path)) as file:
+        # The FullLoader parameter handles the conversion from YAML
+        # scalar values to Python the dictionary format
+        config = yaml.safe_load(file) or dict()
     # optional config setting from env var for secret keys
     for key in ["firefly_iii_host", "firefly_iii_token"]:
         val = os.getenv(key)
         if val is not None:
             config[key] = val
     config = main_config_schema.validate(config)
+    if instance is not None:
+        config = instance_config(config, instance)
+    elif "instances" not in config:
+        for key in ["firefly_iii_host", "firefly_iii_token"]:
+            if key not in config:
+                raise SchemaError(f"Missing key: '{key}'")
     config["ignore_transaction_ids"] = set(
         map(str, config.get("ignore_transaction_ids", []))
     )
+    return config
+
+
+class LazyConfig(MutableMapping):
+    """The user config, which is only read (and validated) on first access, so that
+    things like `--help` and shell completion do not need a valid config file."""
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        # the instance (see `instances`) that this process works on, if any
+        self.instance: str = None
+        self._config: Dict[str, Any] = None
+
+    @property
+    def loaded(self) -> Dict[str, Any]:
+        if self._config is None:
+            self._config = load_config(self.path, self.instance)
+        return self._config
+
+    def select_instance(self, instance: str):
+        self.instance = instance
+        self.reload()
+
+    def instance_names(self) -> List[str]:
+        return list(load_config(self.path).get("instances", {}))
+
+    def reload(self):
+        """Discard the loaded config, such that it is re-read on next access."""
+        self._config = None
+
+    def __getitem__(self, key):
+        return self.loaded[key]
+
+    def __setitem__(self, key, value):
+        self.loaded[key] = value
+
+    def __delitem__(self, key):
+        del self.loaded[key]
+
+    def __iter__(self):
+        return iter(self.loaded)
+
+    def __len__(self):
+        return len(self.loaded)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path!r})"
+
+
+config = LazyConfig()
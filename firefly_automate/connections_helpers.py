@@ -1,11 +1,22 @@
 import atexit
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
 from multiprocessing import Lock
 from multiprocessing.pool import ThreadPool
-from typing import Any, Callable, Dict, Iterator
+from threading import BoundedSemaphore, Condition
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
 
+import firefly_iii_client
 import tqdm
 from firefly_iii_client.schemas import BoolClass, NoneClass
 
+from firefly_automate.profiling import profiler
+
 
 def ignore_keyboard_interrupt(functor: Callable[[], Any], reason: str = "something"):
     while True:
@@ -54,6 +65,82 @@ class _AsyncRequest:
 
 AsyncRequest = _AsyncRequest()
 
+
+class BoundedWriter:
+    """Send write requests (store/update/delete) through the shared thread pool,
+    while keeping at most `max_in_flight` requests pending at any time.
+
+    `submit` blocks once the limit is reached, so a producer can feed an arbitrarily
+    long stream of requests without materialising all of them in the pool's queue.
+    Responses are discarded (only counted); failed requests are collected in
+    `failures` rather than aborting the others.
+    """
+
+    def __init__(
+        self,
+        functor: Callable,
+        max_in_flight: int = None,
+        desc: str = "sending",
+        total: int = None,
+    ):
+        if max_in_flight is None:
+            max_in_flight = AsyncRequest.pool_threads * 2
+        self.functor = functor
+        self.num_succeeded = 0
+        self.failures: List[Tuple[Tuple, BaseException]] = []
+        self._slots = BoundedSemaphore(max_in_flight)
+        self._num_pending = 0
+        self._all_done = Condition()
+        self.pbar = tqdm.tqdm(desc=desc, total=total)
+
+    def submit(self, *args):
+        self._slots.acquire()
+        with self._all_done:
+            self._num_pending += 1
+
+        def _on_success(result):
+            with self._all_done:
+                self.num_succeeded += 1
+            self._finish()
+
+        def _on_failure(exception: BaseException):
+            with self._all_done:
+                self.failures.append((args, exception))
+            self._finish()
+
+        AsyncRequest.pool.apply_async(
+            self.functor,
+            args=args,
+            callback=_on_success,
+            error_callback=_on_failure,
+        )
+
+    def _finish(self):
+        with self._all_done:
+            self._num_pending -= 1
+            self.pbar.update(1)
+            if self._num_pending == 0:
+                self._all_done.notify_all()
+        self._slots.release()
+
+    def join(self):
+        """Block until all submitted requests had finished."""
+
+        def _wait():
+            with self._all_done:
+                while self._num_pending > 0:
+                    self._all_done.wait()
+
+        ignore_keyboard_interrupt(_wait, reason="waiting for pending writes")
+        self.pbar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.join()
+
+
 from decimal import Decimal
 
 import frozendict
@@ -120,11 +207,20 @@ class FireflyPagerWrapper:
     """
 
     def __init__(
-        self, functor: Callable, fetching_name: str = "stuff", *args, **kwargs
+        self,
+        functor: Callable,
+        fetching_name: str = "stuff",
+        *args,
+        path_params: Dict[str, Any] = None,
+        **kwargs,
     ):
         self.functor = functor
         self.args = args
         self.kwargs = kwargs
+        # the (optional) path parameters are passed as is to all pages
+        self.extra_params = {}
+        if path_params is not None:
+            self.extra_params["path_params"] = path_params
         self.fetching_name = fetching_name
         self.async_responses = []
         self.first = None
@@ -137,20 +233,19 @@ class FireflyPagerWrapper:
         # kwargs["_check_return_type"] = False
 
         header_params = {
-            # "X-Trace-Id": "X-Trace-Id_example",
+            "X-Trace-Id": TRACE_ID,
         }
 
         # First we will request the first page.
         kwargs["page"] = 1
         # Then, all subsequent pages will be obtained using async
-        api_response = self.functor(
+        api_response = self._fetch_page(
             *self.args,
             query_params=kwargs,
             header_params=header_params,
+            **self.extra_params,
         )
 
-        api_response = DynamicSchema_to_primitives(api_response.body)
-
         # see how many pages we need to go through
         self.first = api_response
 
@@ -163,8 +258,7 @@ class FireflyPagerWrapper:
         threading_lock = Lock()
 
         def _update_progress(*args, **kwargs):
-            ret = self.functor(*args, **kwargs)
-            ret = DynamicSchema_to_primitives(ret.body)
+            ret = self._fetch_page(*args, **kwargs)
             with threading_lock:
                 self.pbar.update(int(ret["meta"]["pagination"]["count"]))
             return ret
@@ -178,12 +272,21 @@ class FireflyPagerWrapper:
                     *self.args,
                     query_params=dict(kwargs),
                     header_params=header_params,
+                    **self.extra_params,
                     # async_req=True,
                 )
             )
 
         return self
 
+    def _fetch_page(self, *args, **kwargs) -> Dict[str, Any]:
+        # the request includes the client's validation of the response, whereas
+        # decoding is the conversion into python types
+        with profiler.phase("request page"):
+            api_response = self.functor(*args, **kwargs)
+        with profiler.phase("decode page"):
+            return DynamicSchema_to_primitives(api_response.body)
+
     def __next__(self):
         """
         The first response is synced and the rest is async (hence need to .get())
@@ -205,3 +308,218 @@ class FireflyPagerWrapper:
             for d in page["data"]:
                 yield d
                 # yield d.to_dict()
+
+
+# the id that is sent (as X-Trace-Id) with every request of this run, to find the
+# run's requests in the server's logs
+TRACE_ID = str(uuid.uuid4())
+
+# upper bounds (in seconds) of the latency histogram's buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class EndpointMetrics:
+    latencies: List[float] = field(default_factory=list)
+    # number of responses of each status (or "error" if there was no response)
+    statuses: Counter = field(default_factory=Counter)
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    retries: int = 0
+
+    def percentile(self, q: float) -> float:
+        latencies = sorted(self.latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+class HttpMetrics:
+    """The requests made through the api client (see `InstrumentedApiClient`),
+    per endpoint (i.e. method and path, with the ids replaced by {id})."""
+
+    def __init__(self):
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def num_requests(self) -> int:
+        return sum(len(m.latencies) for m in self.endpoints.values())
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(
+        self,
+        endpoint: str,
+        seconds: float,
+        status: Union[int, str],
+        bytes_sent: int,
+        bytes_received: int,
+        retries: int,
+    ):
+        with self._lock:
+            self.in_flight -= 1
+            metrics = self.endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self.endpoints[endpoint] = EndpointMetrics()
+            metrics.latencies.append(seconds)
+            metrics.statuses[str(status)] += 1
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.retries += retries
+
+    def summary(self) -> str:
+        lines = [
+            f"> {self.num_requests} HTTP request(s), at most {self.max_in_flight} "
+            f"in flight (trace id {TRACE_ID})",
+            f"{'endpoint':<42}{'count':>7}{'p50 (ms)':>10}{'p90 (ms)':>10}"
+            f"{'p99 (ms)':>10}{'sent (kB)':>11}{'recv (kB)':>11}{'retries':>9}"
+            f"  statuses",
+        ]
+        with self._lock:
+            ranked = sorted(self.endpoints.items(), key=lambda x: -sum(x[1].latencies))
+            for endpoint, m in ranked:
+                statuses = ", ".join(f"{s}: {n}" for s, n in sorted(m.statuses.items()))
+                lines.append(
+                    f"{endpoint[:41]:<42}{len(m.latencies):>7}"
+                    f"{m.percentile(0.5) * 1000:>10.1f}"
+                    f"{m.percentile(0.9) * 1000:>10.1f}"
+                    f"{m.percentile(0.99) * 1000:>10.1f}"
+                    f"{m.bytes_sent / 1000:>11.1f}{m.bytes_received / 1000:>11.1f}"
+                    f"{m.retries:>9}  {statuses}"
+                )
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "trace_id": TRACE_ID,
+                "max_in_flight": self.max_in_flight,
+                "endpoints": {
+                    endpoint: {
+                        "count": len(m.latencies),
+                        "latency_seconds": {
+                            "sum": sum(m.latencies),
+                            "p50": m.percentile(0.5),
+                            "p90": m.percentile(0.9),
+                            "p99": m.percentile(0.99),
+                            "max": max(m.latencies),
+                        },
+                        "statuses": dict(m.statuses),
+                        "bytes_sent": m.bytes_sent,
+                        "bytes_received": m.bytes_received,
+                        "retries": m.retries,
+                    }
+                    for endpoint, m in self.endpoints.items()
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "firefly_automate_http") -> str:
+        """The metrics in Prometheus' text format (e.g. for node exporter's textfile
+        collector)."""
+        lines = []
+
+        def add(name: str, kind: str, help: str, samples):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                labels = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{suffix}{{{labels}}} {value}")
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            add(
+                "requests_total",
+                "counter",
+                "Number of requests, per endpoint and status.",
+                [
+                    ("", {"endpoint": e, "status": s}, n)
+                    for e, m in endpoints
+                    for s, n in sorted(m.statuses.items())
+                ],
+            )
+            histogram = []
+            for e, m in endpoints:
+                for bound in LATENCY_BUCKETS:
+                    count = sum(1 for x in m.latencies if x <= bound)
+                    histogram.append(("_bucket", {"endpoint": e, "le": bound}, count))
+                histogram.append(
+                    ("_bucket", {"endpoint": e, "le": "+Inf"}, len(m.latencies))
+                )
+                histogram.append(("_sum", {"endpoint": e}, sum(m.latencies)))
+                histogram.append(("_count", {"endpoint": e}, len(m.latencies)))
+            add(
+                "request_duration_seconds",
+                "histogram",
+                "Latency of the requests, per endpoint.",
+                histogram,
+            )
+            for name, attr, help in (
+                ("sent_bytes_total", "bytes_sent", "Bytes of the request bodies."),
+                ("received_bytes_total", "bytes_received", "Bytes of the responses."),
+                ("retries_total", "retries", "Number of retried requests."),
+            ):
+                add(
+                    name,
+                    "counter",
+                    help,
+                    [("", {"endpoint": e}, getattr(m, attr)) for e, m in endpoints],
+                )
+            add(
+                "max_in_flight",
+                "gauge",
+                "Most requests that were in flight at the same time.",
+                [("", {}, self.max_in_flight)],
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Write the metrics as Prometheus' text format if the file ends with .prom,
+        or else as json."""
+        with open(path, "w") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+
+
+http_metrics = HttpMetrics()
+
+
+def _endpoint(method: str, resource_path: str) -> str:
+    path = resource_path.split("?", 1)[0]
+    return f"{method} " + re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+class InstrumentedApiClient(firefly_iii_client.ApiClient):
+    """The api client, which records every request in `http_metrics`, and sends the
+    run's trace id with them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_default_header("X-Trace-Id", TRACE_ID)
+
+    def call_api(self, resource_path: str, method: str, *args, **kwargs):
+        body = kwargs.get("body") or b""
+        status, bytes_received, retries = "error", 0, 0
+        http_metrics.started()
+        start = time.perf_counter()
+        try:
+            response = super().call_api(resource_path, method, *args, **kwargs)
+            status = response.status
+            bytes_received = len(response.data or b"")
+            if response.retries is not None:
+                retries = len(response.retries.history)
+            return response
+        finally:
+            http_metrics.finished(
+                _endpoint(method, resource_path),
+                time.perf_counter() - start,
+                status,
+                len(body.encode() if isinstance(body, str) else body),
+                bytes_received,
+                retries,
+            )
@@ -1,14 +1,15 @@
 from dataclasses import dataclass
-from typing import Dict, List, Tuple, Union
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
 
 import humanize
-from firefly_iii_client.model.transaction_split_update import TransactionSplitUpdate
-from firefly_iii_client.model.transaction_update import TransactionUpdate
 
 from firefly_automate import miscs
 from firefly_automate.config_loader import JsonSerializableNonNesting, config
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
-from firefly_automate.firefly_request_manager import send_transaction_update
+from firefly_automate.profiling import profiler
+
+if TYPE_CHECKING:
+    from firefly_iii_client.model.transaction_update import TransactionUpdate
 
 TransactionOwnerReturnType = Union[str, Tuple[str, str]]
 TransactionUpdateValueType = Union[str, List[str]]
@@ -58,7 +59,12 @@ class PendingUpdates:
     def is_empty(self) -> bool:
         return len(self.updates) == 0
 
-    def get_transaction_update(self) -> TransactionUpdate:
+    def get_transaction_update(self) -> "TransactionUpdate":
+        from firefly_iii_client.model.transaction_split_update import (
+            TransactionSplitUpdate,
+        )
+        from firefly_iii_client.model.transaction_update import TransactionUpdate
+
         _updates: Dict[str, JsonSerializableNonNesting] = {
             k: v.new_val for k, v in self.updates.items()
         }
@@ -80,6 +86,7 @@ class PendingUpdates:
         )
         return transaction_update
 
+    @profiler.timed("PendingUpdates.append_updates")
     def append_updates(self, rule: str, updates: PendingUpdateValuesDict):
         updates_by_rule = self.sanitise_updates(rule, updates)
 
@@ -125,16 +132,19 @@ class PendingUpdates:
             self.updates[k] = v
         # self.updates.update(updates)
 
-    def apply(self, dry_run=True, debug=False):
+    def apply(self, dry_run=True, debug=False, interactive=True):
+        from firefly_automate.firefly_request_manager import send_transaction_update
+
         transaction_update = self.get_transaction_update()
         if debug:
             print(transaction_update)
         if not dry_run:
             api_responses = send_transaction_update(
-                int(self.entry.id), transaction_update
+                int(self.entry.id), transaction_update, interactive=interactive
             )
             if debug:
                 print(api_responses)
+            return api_responses
 
     def __repr__(self):
         ret = f""
@@ -153,6 +163,7 @@ class PendingUpdates:
                 ret += f"        > {k}:\t{self.entry[k]}\t=>\t{v.new_val}\n"
         return ret
 
+    @profiler.timed("PendingUpdates.sanitise_updates")
     def sanitise_updates(
         self, rule_name: str, dictionary: PendingUpdateValuesDict
     ) -> Dict[str, PendingUpdateItem]:
@@ -0,0 +1,66 @@
+import datetime
+from dataclasses import dataclass, replace
+from typing import Optional
+
+
+def _quote(value: str) -> str:
+    return '"{}"'.format(value.replace('"', '\\"'))
+
+
+@dataclass(frozen=True)
+class TransactionQuery:
+    """A server-side filter on transactions, declared by rules that only care about a
+    subset of them. All the given fields must match (i.e. `and`)."""
+
+    account_name: Optional[str] = None
+    transaction_type: Optional[str] = None
+    description_contains: Optional[str] = None
+    # only the transactions that were created or edited on or after this day
+    updated_after: Optional[datetime.date] = None
+
+    def is_account_only(self) -> bool:
+        return (
+            self.account_name is not None
+            and self.transaction_type is None
+            and self.description_contains is None
+            and self.updated_after is None
+        )
+
+    def merge(self, other: "TransactionQuery") -> Optional["TransactionQuery"]:
+        """Return a query that matches (at least) the transactions matched by both
+        queries (i.e. `and`), or None if no transaction can match both of them.
+
+        A transaction can involve two different accounts, or contain two different
+        description keywords, but only one of them can be queried; in that case the
+        one of this query is kept.
+        """
+        merged = {}
+        for field in (
+            "account_name",
+            "transaction_type",
+            "description_contains",
+            "updated_after",
+        ):
+            a, b = getattr(self, field), getattr(other, field)
+            if a is not None and b is not None and a != b:
+                if field == "transaction_type":
+                    return None
+                if field == "updated_after":
+                    # updated after both days
+                    a = max(a, b)
+                b = a
+            merged[field] = a if a is not None else b
+        return replace(self, **merged)
+
+    def to_search_query(self, start: datetime.date, end: datetime.date) -> str:
+        """Format as the query string of Firefly III's search endpoint."""
+        terms = [f"date_after:{start}", f"date_before:{end}"]
+        if self.account_name is not None:
+            terms.append(f"account_is:{_quote(self.account_name)}")
+        if self.transaction_type is not None:
+            terms.append(f"type:{self.transaction_type}")
+        if self.description_contains is not None:
+            terms.append(f"description_contains:{_quote(self.description_contains)}")
+        if self.updated_after is not None:
+            terms.append(f"updated_at_after:{self.updated_after}")
+        return " ".join(terms)
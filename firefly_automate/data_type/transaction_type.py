@@ -1,8 +1,55 @@
-import dataclasses
 import datetime
+import sys
 from dataclasses import dataclass
 from typing import Dict, List
 
+# the attributes whose values repeat across the transactions (e.g. the account names,
+# which repeat for every transaction of the account, or the dates for every
+# transaction of the day), and hence are interned
+INTERNED_ATTRIBUTES = (
+    "type",
+    "user",
+    "date",
+    "currency_id",
+    "currency_code",
+    "currency_name",
+    "currency_symbol",
+    "foreign_currency_id",
+    "foreign_currency_code",
+    "foreign_currency_symbol",
+    "source_id",
+    "source_name",
+    "source_iban",
+    "source_type",
+    "destination_id",
+    "destination_name",
+    "destination_iban",
+    "destination_type",
+    "budget_id",
+    "budget_name",
+    "category_id",
+    "category_name",
+    "bill_id",
+    "bill_name",
+    "original_source",
+)
+
+
+def intern_attributes(attributes: Dict[str, object]) -> Dict[str, object]:
+    """Intern (in place) the repeating string values of a transaction's attributes,
+    such that all the transactions share one str of each, rather than each having
+    their own copy of e.g. its account names."""
+    for key in INTERNED_ATTRIBUTES:
+        value = attributes.get(key)
+        if type(value) is str:
+            attributes[key] = sys.intern(value)
+    tags = attributes.get("tags")
+    if tags:
+        attributes["tags"] = type(tags)(
+            sys.intern(tag) if type(tag) is str else tag for tag in tags
+        )
+    return attributes
+
 
 @dataclass(init=False)
 class FireflyTransactionDataClass:
@@ -40,6 +87,10 @@ class FireflyTransactionDataClass:
 
     _extra_attributes: Dict[str, object]
 
+    # the transactions have no __dict__ (which would be most of their memory), hence
+    # they can only have the attributes above
+    __slots__ = tuple(__annotations__)
+
     # foreign_currency_code: Optional[str]
     # foreign_currency_symbol: Optional[str]
     # foreign_amount: Optional[str]
@@ -71,15 +122,25 @@ class FireflyTransactionDataClass:
 
     def __init__(self, **kwargs):
         # custom init that ignore non-necessary fields, and store them in extra attr
-        names = set([f.name for f in dataclasses.fields(self)])
+        names = self.__slots__
         _extra_attrs = dict()
-        for k, v in kwargs.items():
+        for k, v in intern_attributes(kwargs).items():
             if k in names:
                 setattr(self, k, v)
             else:
                 _extra_attrs[k] = v
         setattr(self, "_extra_attributes", _extra_attrs)
 
+    def __getstate__(self) -> Dict[str, object]:
+        return {
+            name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)
+        }
+
+    def __setstate__(self, state: Dict[str, object]):
+        # e.g. when unpickled
+        for name, value in intern_attributes(state).items():
+            setattr(self, name, value)
+
     def __getitem__(self, index):
         if type(index) != str:
             raise ValueError(str)
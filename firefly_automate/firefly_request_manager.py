@@ -1,30 +1,38 @@
+import concurrent.futures
 import datetime
 import functools
 import logging
-from typing import Dict, Iterable, Tuple
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import firefly_iii_client
-import pandas as pd
 from firefly_iii_client import Configuration
-from firefly_iii_client.apis.tags import accounts_api, rules_api, transactions_api
-from firefly_iii_client.model.rule_action_keyword import RuleActionKeyword
-from firefly_iii_client.model.rule_action_store import RuleActionStore
-from firefly_iii_client.model.rule_action_update import RuleActionUpdate
-from firefly_iii_client.model.rule_store import RuleStore
-from firefly_iii_client.model.rule_trigger_keyword import RuleTriggerKeyword
-from firefly_iii_client.model.rule_trigger_store import RuleTriggerStore
-from firefly_iii_client.model.rule_trigger_type import RuleTriggerType
-from firefly_iii_client.model.rule_update import RuleUpdate
+from firefly_iii_client.apis.tags import accounts_api, tags_api, transactions_api
 from firefly_iii_client.model.transaction_split_store import TransactionSplitStore
 from firefly_iii_client.model.transaction_split_update import TransactionSplitUpdate
 from firefly_iii_client.model.transaction_store import TransactionStore
 from firefly_iii_client.model.transaction_type_filter import TransactionTypeFilter
+from firefly_iii_client.model.transaction_type_property import TransactionTypeProperty
 from firefly_iii_client.model.transaction_update import TransactionUpdate
 
-from firefly_automate import miscs
+from firefly_automate import miscs, offline
 from firefly_automate.config_loader import config
-from firefly_automate.connections_helpers import FireflyPagerWrapper
+from firefly_automate.connections_helpers import (
+    AsyncRequest,
+    DynamicSchema_to_primitives,
+    FireflyPagerWrapper,
+    InstrumentedApiClient,
+)
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+from firefly_automate.profiling import profiler
+from firefly_automate.record_cache import CacheEntry
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from firefly_automate.data_type.transaction_query import TransactionQuery
+    from firefly_automate.server_rules import ServerRule
 
 LOGGER = logging.getLogger(__name__)
 
@@ -33,6 +41,72 @@ class TransactionUpdateError(Exception):
     pass
 
 
+# the cache (sqlite) is not thread-safe, all access to it goes through this lock.
+_cache_lock = threading.Lock()
+_cache_fetches_in_flight: Dict[Tuple, concurrent.futures.Future] = {}
+
+# rules rarely change (other than through our own updates, which are written through)
+RULE_INDEX_TTL = 60 * 60
+# seconds after which the cached entries of each namespace (the first item of their
+# key) expire. The transactions have none, as they are fetched again (and hence
+# replaced) whenever they are needed fresh, e.g. by each poll of `watch`.
+CACHE_TTLS = {
+    "accounts": 24 * 60 * 60,
+    "tags": 24 * 60 * 60,
+    "rule_index": RULE_INDEX_TTL,
+}
+
+
+def _get_cached(key: Tuple, ttl: float = None) -> Optional[CacheEntry]:
+    # must be called with the cache lock held
+    entry = miscs.args.cache.get(key)
+    if not isinstance(entry, CacheEntry):
+        return None
+    if ttl is not None and time.time() - entry.fetched_at > ttl:
+        return None
+    return entry
+
+
+def fetch_with_cache(key: Tuple, fetcher: Callable[[], Any], ttl: float = None) -> Any:
+    """Return the cached entry of `key`, or fetch (and cache) it with `fetcher`. The
+    first item of the key is its namespace, e.g. `("accounts", acc_type)`. Cached
+    entries older than `ttl` seconds (if given), or than the ttl of their namespace
+    (see `CACHE_TTLS`), are fetched again.
+
+    This is safe to call from multiple threads. If the same key is already being
+    fetched (e.g. by the startup prefetch), this waits for that fetch instead of
+    sending the same requests again.
+
+    Offline, the cache is not used, as the snapshot is already local (and its entries
+    must not be mistaken for the server's).
+    """
+    if offline.is_offline():
+        return fetcher()
+    with _cache_lock:
+        entry = _get_cached(key, ttl)
+        if entry is not None:
+            return entry.value
+        in_flight = _cache_fetches_in_flight.get(key)
+        if in_flight is None:
+            _cache_fetches_in_flight[key] = concurrent.futures.Future()
+    if in_flight is not None:
+        return in_flight.result()
+
+    future = _cache_fetches_in_flight[key]
+    try:
+        value = fetcher()
+    except BaseException as e:
+        with _cache_lock:
+            _cache_fetches_in_flight.pop(key)
+        future.set_exception(e)
+        raise
+    with _cache_lock:
+        miscs.args.cache[key] = CacheEntry(value, time.time())
+        _cache_fetches_in_flight.pop(key)
+    future.set_result(value)
+    return value
+
+
 def get_firefly_client_conf() -> Configuration:
     # The client must configure the authentication and authorization parameters
     # in accordance with the API server security policy.
@@ -49,115 +123,268 @@ def get_firefly_client_conf() -> Configuration:
     return configuration
 
 
+@functools.lru_cache
+def get_api_client() -> firefly_iii_client.ApiClient:
+    """A long-lived client shared by all threads, so that concurrent requests reuse
+    the pooled (keep-alive) connections instead of doing a new handshake each time.
+    Its requests are recorded in `http_metrics`."""
+    if offline.is_offline():
+        raise offline.OfflineError(
+            "This needs the server, which is not used with --offline"
+        )
+    configuration = get_firefly_client_conf()
+    configuration.connection_pool_maxsize = max(
+        configuration.connection_pool_maxsize, AsyncRequest.pool_threads
+    )
+    return InstrumentedApiClient(configuration)
+
+
 def get_rules() -> Iterable[FireflyTransactionDataClass]:
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        # Create an instance of the API class
-        api_instance = rules_api.RulesApi(api_client)
-        # TransactionTypeFilter
-        # Optional filter on the transaction type(s) returned. (optional)
-
-        for rule in FireflyPagerWrapper(
-            api_instance.list_rule,
-            "rules",
-        ).data_entries():
-            yield rule
+    if offline.is_offline():
+        yield from offline.snapshot.rules
+        return
 
+    # the rules api is only needed by some commands, import it on demand
+    from firefly_iii_client.apis.tags import rules_api
 
-def fire_rules():
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        # Create an instance of the API class
-        api_instance = rules_api.RulesApi(api_client)
-        # TransactionTypeFilter
-        # Optional filter on the transaction type(s) returned. (optional)
+    api_client = get_api_client()
+    # Create an instance of the API class
+    api_instance = rules_api.RulesApi(api_client)
+    # TransactionTypeFilter
+    # Optional filter on the transaction type(s) returned. (optional)
 
-        for rule in FireflyPagerWrapper(
-            api_instance.list_rule,
-            "rules",
-        ).data_entries():
-            yield rule
+    for rule in FireflyPagerWrapper(
+        api_instance.list_rule,
+        "rules",
+    ).data_entries():
+        yield rule
+
+
+RULE_INDEX_KEY = ("rule_index",)
+
+
+def get_rule_index() -> Dict[str, Dict[str, Any]]:
+    """All rules, indexed by their title. The rules are only listed once, and then
+    kept in the cache for `RULE_INDEX_TTL` seconds (see `CACHE_TTLS`)."""
+    return fetch_with_cache(
+        RULE_INDEX_KEY,
+        lambda: {rule["attributes"]["title"]: rule for rule in get_rules()},
+    )
+
+
+def _update_rule_index(rule_id: str, rule: Dict[str, Any] = None):
+    """Replace (or remove, if `rule` is None) the rule of the given id in the index."""
+    with _cache_lock:
+        entry = _get_cached(RULE_INDEX_KEY)
+        if entry is None:
+            return
+        index = {t: r for t, r in entry.value.items() if r["id"] != rule_id}
+        if rule is not None:
+            index[rule["attributes"]["title"]] = rule
+        miscs.args.cache[RULE_INDEX_KEY] = CacheEntry(index, entry.fetched_at)
 
 
 def get_rule_by_title(title: str):
-    for rule in get_rules():
-        if rule["attributes"]["title"] == title:
-            return rule
-    return None
-
-
-# def create_rule_if_not_exists(title: str, rule_group_title: str):
-#     rule = get_rule_by_title(title)
-#     if rule is None:
-#         with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-#             # Create an instance of the API class
-#             api_instance = rules_api.RulesApi(api_client)
-#             body = RuleStore(
-#                 actions=[
-#                     RuleActionStore(
-#                         active=True,
-#                         order=0,
-#                         stop_processing=False,
-#                         type=RuleActionKeyword("convert_transfer"),
-#                         value="Westpac Choice",
-#                     )
-#                 ],
-#                 active=True,
-#                 description="Auto generated rule",
-#                 order=0,
-#                 rule_group_title=f"AUTOGEN_{rule_group_title}",
-#                 rule_group_id="7",
-#                 stop_processing=False,
-#                 strict=True,
-#                 title=title,
-#                 trigger=RuleTriggerType("store-journal"),
-#                 triggers=[
-#                     RuleTriggerStore(
-#                         active=True,
-#                         order=0,
-#                         stop_processing=False,
-#                         type=RuleTriggerKeyword("user_action"),
-#                         value="tag1",
-#                     )
-#                 ],
-#             )
-#             # Store a new rule
-#             api_response = api_instance.store_rule(
-#                 body,
-#             )
-#     return rule
+    return get_rule_index().get(title)
+
+
+def get_rule_groups() -> Dict[str, str]:
+    """The ids of all rule groups, by their title."""
+    from firefly_iii_client.apis.tags import rule_groups_api
+
+    api_instance = rule_groups_api.RuleGroupsApi(get_api_client())
+    return {
+        rule_group["attributes"]["title"]: rule_group["id"]
+        for rule_group in FireflyPagerWrapper(
+            api_instance.list_rule_group, "rule groups"
+        ).data_entries()
+    }
+
+
+def create_rule_group(title: str, description: str = "") -> str:
+    from firefly_iii_client.apis.tags import rule_groups_api
+    from firefly_iii_client.model.rule_group_store import RuleGroupStore
+
+    api_instance = rule_groups_api.RuleGroupsApi(get_api_client())
+    api_response = api_instance.store_rule_group(
+        RuleGroupStore(title=title, description=description, active=True)
+    )
+    return DynamicSchema_to_primitives(api_response.body)["data"]["id"]
+
+
+def delete_rule_group(id: str):
+    """Delete the rule group, along with all of its rules."""
+    from firefly_iii_client.apis.tags import rule_groups_api
+
+    api_instance = rule_groups_api.RuleGroupsApi(get_api_client())
+    api_instance.delete_rule_group(path_params=dict(id=id))
+    with _cache_lock:
+        entry = _get_cached(RULE_INDEX_KEY)
+        if entry is None:
+            return
+        index = {
+            t: r
+            for t, r in entry.value.items()
+            if r["attributes"].get("rule_group_id") != id
+        }
+        miscs.args.cache[RULE_INDEX_KEY] = CacheEntry(index, entry.fetched_at)
+
+
+def get_rules_of_group(rule_group_id: str) -> List[Dict[str, Any]]:
+    from firefly_iii_client.apis.tags import rule_groups_api
+
+    api_instance = rule_groups_api.RuleGroupsApi(get_api_client())
+    return list(
+        FireflyPagerWrapper(
+            api_instance.list_rule_by_group,
+            "rules",
+            path_params=dict(id=rule_group_id),
+        ).data_entries()
+    )
+
+
+def _rule_body(rule: "ServerRule", rule_group_id: str, update: bool = False):
+    from firefly_iii_client.model.rule_action_keyword import RuleActionKeyword
+    from firefly_iii_client.model.rule_trigger_keyword import RuleTriggerKeyword
+    from firefly_iii_client.model.rule_trigger_type import RuleTriggerType
+
+    if update:
+        from firefly_iii_client.model.rule_action_update import (
+            RuleActionUpdate as RuleAction,
+        )
+        from firefly_iii_client.model.rule_trigger_update import (
+            RuleTriggerUpdate as RuleTrigger,
+        )
+        from firefly_iii_client.model.rule_update import RuleUpdate as RuleBody
+    else:
+        from firefly_iii_client.model.rule_action_store import (
+            RuleActionStore as RuleAction,
+        )
+        from firefly_iii_client.model.rule_store import RuleStore as RuleBody
+        from firefly_iii_client.model.rule_trigger_store import (
+            RuleTriggerStore as RuleTrigger,
+        )
+
+    return RuleBody(
+        title=rule.title,
+        description=rule.description,
+        rule_group_id=rule_group_id,
+        order=rule.order,
+        active=True,
+        strict=rule.strict,
+        stop_processing=rule.stop_processing,
+        trigger=RuleTriggerType("store-journal"),
+        triggers=[
+            RuleTrigger(
+                type=RuleTriggerKeyword(trigger_type),
+                value=trigger_value,
+                order=i,
+                active=True,
+                stop_processing=False,
+            )
+            for i, (trigger_type, trigger_value) in enumerate(rule.triggers)
+        ],
+        actions=[
+            RuleAction(
+                type=RuleActionKeyword(action_type),
+                value=action_value,
+                order=i,
+                active=True,
+                stop_processing=False,
+            )
+            for i, (action_type, action_value) in enumerate(rule.actions)
+        ],
+    )
+
+
+def store_rule(rule: "ServerRule", rule_group_id: str):
+    from firefly_iii_client.apis.tags import rules_api
+
+    api_instance = rules_api.RulesApi(get_api_client())
+    api_response = api_instance.store_rule(_rule_body(rule, rule_group_id))
+    stored = DynamicSchema_to_primitives(api_response.body)["data"]
+    _update_rule_index(stored["id"], stored)
+    return stored
+
+
+def update_rule(id: str, rule: "ServerRule", rule_group_id: str):
+    """Replace the triggers and actions of an existing rule."""
+    from firefly_iii_client.apis.tags import rules_api
+
+    api_instance = rules_api.RulesApi(get_api_client())
+    api_response = api_instance.update_rule(
+        path_params=dict(id=id),
+        body=_rule_body(rule, rule_group_id, update=True),
+    )
+    updated = DynamicSchema_to_primitives(api_response.body)["data"]
+    _update_rule_index(id, updated)
+    return updated
+
+
+def delete_rule(id: str):
+    from firefly_iii_client.apis.tags import rules_api
+
+    api_instance = rules_api.RulesApi(get_api_client())
+    api_instance.delete_rule(path_params=dict(id=id))
+    _update_rule_index(id)
+
+
+def fire_rule_group(id: str, start: datetime.date, end: datetime.date):
+    """Let the server apply all rules of the group on the transactions in range."""
+    from firefly_iii_client.apis.tags import rule_groups_api
+
+    api_instance = rule_groups_api.RuleGroupsApi(get_api_client())
+    return api_instance.fire_rule_group(
+        path_params=dict(id=id),
+        query_params=dict(start=start, end=end),
+    )
 
 
 def update_rule_action(id: str, action_packs: Tuple[str, str]):
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        # Create an instance of the API class
-        api_instance = rules_api.RulesApi(api_client)
-        body = RuleUpdate(
-            actions=[
-                RuleActionUpdate(
-                    active=True,
-                    stop_processing=False,
-                    type=RuleActionKeyword(action_type),
-                    value=action_value,
-                )
-                for action_type, action_value in action_packs
-            ],
+    from firefly_iii_client.apis.tags import rules_api
+    from firefly_iii_client.model.rule_action_keyword import RuleActionKeyword
+    from firefly_iii_client.model.rule_action_update import RuleActionUpdate
+    from firefly_iii_client.model.rule_update import RuleUpdate
+
+    if offline.is_offline():
+        offline.changeset.record(
+            "update_rule_action", id=id, actions=[list(pack) for pack in action_packs]
         )
-        try:
-            # Update existing rule.
-            api_response = api_instance.update_rule(
-                path_params=dict(id=id),
-                body=body,
+        return
+
+    api_client = get_api_client()
+    # Create an instance of the API class
+    api_instance = rules_api.RulesApi(api_client)
+    body = RuleUpdate(
+        actions=[
+            RuleActionUpdate(
+                active=True,
+                stop_processing=False,
+                type=RuleActionKeyword(action_type),
+                value=action_value,
             )
-        except firefly_iii_client.ApiException as e:
-            print("Exception when calling RulesApi->update_rule: %s\n" % e)
-            raise e
+            for action_type, action_value in action_packs
+        ],
+    )
+    try:
+        # Update existing rule.
+        api_response = api_instance.update_rule(
+            path_params=dict(id=id),
+            body=body,
+        )
+    except firefly_iii_client.ApiException as e:
+        print("Exception when calling RulesApi->update_rule: %s\n" % e)
+        raise e
+    # write the updated rule through to the index, instead of re-listing them
+    _update_rule_index(id, DynamicSchema_to_primitives(api_response.body)["data"])
 
 
 @functools.lru_cache
 def get_merge_as_transfer_rule_id():
-    id = get_rule_by_title("merge-as-transfer_convert")["id"]
-    if id is None:
+    rule = get_rule_by_title("merge-as-transfer_convert")
+    if rule is None:
         raise ValueError("No necessary rule found.")
-    return id
+    return rule["id"]
 
 
 # with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
@@ -170,19 +397,21 @@ def get_merge_as_transfer_rule_id():
 
 
 def get_all_account_entries(acc_type: str = None):
-    account_key = str(("accounts", acc_type))
-    if account_key not in miscs.args.cache:
-        with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-            api_instance = accounts_api.AccountsApi(api_client)
-            kwargs = {}
-            if acc_type is not None:
-                kwargs["type"] = acc_type
-            miscs.args.cache[account_key] = list(
-                FireflyPagerWrapper(
-                    api_instance.list_account, "accounts", **kwargs
-                ).data_entries()
-            )
-    return miscs.args.cache[account_key]
+    def _fetch():
+        if offline.is_offline():
+            return offline.snapshot.account_entries(acc_type)
+        api_client = get_api_client()
+        api_instance = accounts_api.AccountsApi(api_client)
+        kwargs = {}
+        if acc_type is not None:
+            kwargs["type"] = acc_type
+        return list(
+            FireflyPagerWrapper(
+                api_instance.list_account, "accounts", **kwargs
+            ).data_entries()
+        )
+
+    return fetch_with_cache(("accounts", acc_type), _fetch)
 
 
 @functools.lru_cache
@@ -195,6 +424,20 @@ def get_firefly_account_mappings(acc_type: str = None) -> Dict[str, str]:
     return acc_id_to_name
 
 
+def get_account_id_by_name(account_name: str) -> Optional[str]:
+    """The id of the account with the given name. Asset accounts take precedence, as
+    the same name can also be used by an expense/revenue account."""
+    matched = [
+        acc
+        for acc in get_all_account_entries()
+        if acc["attributes"]["name"] == account_name
+    ]
+    if len(matched) == 0:
+        return None
+    matched.sort(key=lambda acc: acc["attributes"]["type"] != "asset")
+    return matched[0]["id"]
+
+
 def get_firefly_account_grouped_by_type(acc_type: str = None):
     # sort by id
     return miscs.group_by(
@@ -203,7 +446,25 @@ def get_firefly_account_grouped_by_type(acc_type: str = None):
     )
 
 
-def send_transaction_update(transaction_id: int, transaction_update: TransactionUpdate):
+def get_all_tag_entries() -> List[Dict[str, Any]]:
+    def _fetch():
+        if offline.is_offline():
+            return offline.snapshot.tags
+        api_instance = tags_api.TagsApi(get_api_client())
+        return list(FireflyPagerWrapper(api_instance.list_tag, "tags").data_entries())
+
+    return fetch_with_cache(("tags",), _fetch)
+
+
+def send_transaction_update(
+    transaction_id: int,
+    transaction_update: TransactionUpdate,
+    interactive: bool = True,
+):
+    """Update the transaction. If it is already reconciled, it is only overridden
+    with `--always-override-reconciled`, or if the user agrees to (when
+    interactive)."""
+
     def _raw_send(_id, _tran_update):
         path_params = {"id": str(_id)}
         return api_instance.update_transaction(
@@ -211,60 +472,72 @@ def send_transaction_update(transaction_id: int, transaction_update: Transaction
             body=_tran_update,
         )
 
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        api_instance = transactions_api.TransactionsApi(api_client)
-        try:
-            api_response = _raw_send(transaction_id, transaction_update)
-        except firefly_iii_client.ApiException as e:
-            body = e.body
-            if isinstance(body, bytes):
-                body = body.decode()
-            if "This transaction is already reconciled" in body:
-                if miscs.args.always_override_reconciled or miscs.prompt_response(
+    if offline.is_offline():
+        offline.changeset.record(
+            "update_transaction",
+            id=str(transaction_id),
+            body=DynamicSchema_to_primitives(transaction_update),
+        )
+        return None
+    api_client = get_api_client()
+    api_instance = transactions_api.TransactionsApi(api_client)
+    try:
+        api_response = _raw_send(transaction_id, transaction_update)
+    except firefly_iii_client.ApiException as e:
+        body = e.body
+        if isinstance(body, bytes):
+            body = body.decode()
+        if "This transaction is already reconciled" in body:
+            if miscs.args.always_override_reconciled or (
+                interactive
+                and miscs.prompt_response(
                     f"> Transaction {transaction_id} is already reconciled. Override?"
-                ):
-                    # first remove reconcile
-                    api_response = _raw_send(
-                        transaction_id,
-                        TransactionUpdate(
-                            apply_rules=False,
-                            transactions=[
-                                TransactionSplitUpdate(reconciled=False),
-                            ],
-                        ),
-                    )
-
-                    # re-send request.
-                    api_response = _raw_send(transaction_id, transaction_update)
-
-                    # send request on setting reconciled as TRUE again
-                    api_response = _raw_send(
-                        transaction_id,
-                        TransactionUpdate(
-                            apply_rules=False,
-                            transactions=[
-                                TransactionSplitUpdate(reconciled=True),
-                            ],
-                        ),
-                    )
-                else:
-                    return None
+                )
+            ):
+                # first remove reconcile
+                api_response = _raw_send(
+                    transaction_id,
+                    TransactionUpdate(
+                        apply_rules=False,
+                        transactions=[
+                            TransactionSplitUpdate(reconciled=False),
+                        ],
+                    ),
+                )
+
+                # re-send request.
+                api_response = _raw_send(transaction_id, transaction_update)
+
+                # send request on setting reconciled as TRUE again
+                api_response = _raw_send(
+                    transaction_id,
+                    TransactionUpdate(
+                        apply_rules=False,
+                        transactions=[
+                            TransactionSplitUpdate(reconciled=True),
+                        ],
+                    ),
+                )
             else:
-                raise TransactionUpdateError(
-                    f"Attempting to update transaction {transaction_id}: "
-                    f"{transaction_update}"
-                ) from e
-        return api_response
+                return None
+        else:
+            raise TransactionUpdateError(
+                f"Attempting to update transaction {transaction_id}: "
+                f"{transaction_update}"
+            ) from e
+    return api_response
 
 
 def create_transaction_store(transaction_data: Dict, apply_rules: bool = True):
+    import pandas as pd
+
     for k, v in list(transaction_data.items()):
         # replace null to none
         if pd.isnull(v):
             transaction_data[k] = None
             # transaction_data.pop(k)
         if k == "tag":
-            transaction_data[k] = [v]
+            transaction_data[k] = [] if transaction_data[k] is None else [v]
 
     return TransactionStore(
         apply_rules=apply_rules,
@@ -274,48 +547,187 @@ def create_transaction_store(transaction_data: Dict, apply_rules: bool = True):
     )
 
 
+def create_transaction_stores(
+    transaction_df: "pd.DataFrame", apply_rules: bool = True
+) -> List[TransactionStore]:
+    """Column-wise version of `create_transaction_store`, for building the payloads
+    of a whole data frame at once (each row is one transaction)."""
+    transaction_df = transaction_df.astype(object)
+    # replace null to none
+    transaction_df = transaction_df.where(transaction_df.notna(), None)
+    if "tag" in transaction_df:
+        transaction_df["tag"] = [
+            [] if v is None else [v] for v in transaction_df["tag"]
+        ]
+    if "type" in transaction_df:
+        _types = {
+            v: TransactionTypeProperty(v)
+            for v in transaction_df["type"].unique()
+            if v is not None
+        }
+        transaction_df["type"] = [_types.get(v) for v in transaction_df["type"]]
+
+    return [
+        TransactionStore(
+            apply_rules=apply_rules,
+            transactions=[
+                TransactionSplitStore(**transaction_data),
+            ],
+        )
+        for transaction_data in transaction_df.to_dict("records")
+    ]
+
+
 def send_transaction_store(transaction_store: TransactionStore):
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        api_instance = transactions_api.TransactionsApi(api_client)
-        try:
-            api_response = api_instance.store_transaction(transaction_store)
-        except firefly_iii_client.ApiException as e:
-            raise TransactionUpdateError(
-                f"Attempting to store new transaction: {transaction_store}"
-            ) from e
-        return api_response
+    if offline.is_offline():
+        offline.changeset.record(
+            "store_transaction", body=DynamicSchema_to_primitives(transaction_store)
+        )
+        return None
+    api_instance = transactions_api.TransactionsApi(get_api_client())
+    try:
+        api_response = api_instance.store_transaction(transaction_store)
+    except firefly_iii_client.ApiException as e:
+        raise TransactionUpdateError(
+            f"Attempting to store new transaction: {transaction_store}"
+        ) from e
+    return api_response
 
 
 def send_transaction_delete(transaction_id: int):
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        api_instance = transactions_api.TransactionsApi(api_client)
-        api_response = api_instance.delete_transaction(
-            path_params=dict(id=transaction_id),
-        )
-        return api_response
+    if offline.is_offline():
+        offline.changeset.record("delete_transaction", id=str(transaction_id))
+        return None
+    api_client = get_api_client()
+    api_instance = transactions_api.TransactionsApi(api_client)
+    api_response = api_instance.delete_transaction(
+        path_params=dict(id=transaction_id),
+    )
+    return api_response
+
+
+@profiler.timed("to transaction dataclass")
+def _to_transaction_dataclass(
+    transaction: Dict[str, Any]
+) -> FireflyTransactionDataClass:
+    assert len(transaction["attributes"]["transactions"]) == 1
+    return FireflyTransactionDataClass(
+        id=transaction["id"],
+        **transaction["attributes"]["transactions"][0],
+    )
+
+
+def get_transaction_entries(
+    start: datetime.date, end: datetime.date
+) -> Iterable[Dict[str, Any]]:
+    """The api entries of the transactions, as listed by the server."""
+    if offline.is_offline():
+        yield from offline.snapshot.transaction_entries(start, end)
+        return
+
+    api_client = get_api_client()
+    # Create an instance of the API class
+    api_instance = transactions_api.TransactionsApi(api_client)
+    # TransactionTypeFilter
+    # Optional filter on the transaction type(s) returned. (optional)
+    trans_type = TransactionTypeFilter("all")
+
+    yield from FireflyPagerWrapper(
+        api_instance.list_transaction,
+        "transactions",
+        start=start,
+        end=end,
+        type=trans_type,
+    ).data_entries()
 
 
 def get_transactions(
     start: datetime.date, end: datetime.date
 ) -> Iterable[FireflyTransactionDataClass]:
-    with firefly_iii_client.ApiClient(get_firefly_client_conf()) as api_client:
-        # Create an instance of the API class
-        api_instance = transactions_api.TransactionsApi(api_client)
-        # TransactionTypeFilter
-        # Optional filter on the transaction type(s) returned. (optional)
-        trans_type = TransactionTypeFilter("all")
-
-        for transaction in FireflyPagerWrapper(
-            api_instance.list_transaction,
-            "transactions",
-            start=start,
-            end=end,
-            type=trans_type,
-        ).data_entries():
-            transaction = transaction
-            assert len(transaction["attributes"]["transactions"]) == 1
-
-            yield FireflyTransactionDataClass(
-                id=transaction["id"],
-                **transaction["attributes"]["transactions"][0],
+    for transaction in get_transaction_entries(start, end):
+        yield _to_transaction_dataclass(transaction)
+
+
+def get_transactions_for_account(
+    account_id: str, start: datetime.date, end: datetime.date, ttl: float = None
+) -> List[FireflyTransactionDataClass]:
+    """The transactions (within start and end) of one account only, which is much
+    less to transfer than all transactions for per-account workflows."""
+
+    def _fetch():
+        if offline.is_offline():
+            return [
+                _to_transaction_dataclass(transaction)
+                for transaction in offline.snapshot.transaction_entries(
+                    start, end, account_id
+                )
+            ]
+        api_client = get_api_client()
+        api_instance = accounts_api.AccountsApi(api_client)
+        return [
+            _to_transaction_dataclass(transaction)
+            for transaction in FireflyPagerWrapper(
+                api_instance.list_transaction_by_account,
+                f"transactions of account {account_id}",
+                path_params={"id": account_id},
+                start=start,
+                end=end,
+                type=TransactionTypeFilter("all"),
+            ).data_entries()
+        ]
+
+    return fetch_with_cache(
+        ("account_transaction", account_id, start, end), _fetch, ttl
+    )
+
+
+def search_transactions(query: str) -> Iterable[FireflyTransactionDataClass]:
+    """Transactions that match the given query of Firefly III's search syntax."""
+    from firefly_iii_client.apis.tags import search_api
+
+    api_client = get_api_client()
+    api_instance = search_api.SearchApi(api_client)
+    for transaction in FireflyPagerWrapper(
+        api_instance.search_transactions,
+        "searched transactions",
+        query=query,
+    ).data_entries():
+        yield _to_transaction_dataclass(transaction)
+
+
+def get_transactions_matching(
+    queries: List["TransactionQuery"],
+    start: datetime.date,
+    end: datetime.date,
+    ttl: float = None,
+) -> List[FireflyTransactionDataClass]:
+    """The union of transactions (within start and end) matching any of the queries,
+    in the same order as `get_transactions`.
+
+    Queries on an account alone use the account's transactions endpoint, the others
+    the search endpoint. They are sent one after another, as each of them already
+    fetches its pages concurrently on the shared pool. Cached results older than
+    `ttl` seconds (if given) are fetched again.
+    """
+    if offline.is_offline():
+        # the queries only save requests, the rules check every transaction anyway
+        return list(get_transactions(start, end))
+    transactions: Dict[str, FireflyTransactionDataClass] = {}
+    for query in queries:
+        account_id = None
+        if query.is_account_only():
+            account_id = get_account_id_by_name(query.account_name)
+        if account_id is not None:
+            matched = get_transactions_for_account(account_id, start, end, ttl)
+        else:
+            search_query = query.to_search_query(start, end)
+            matched = fetch_with_cache(
+                ("search", search_query),
+                lambda: list(search_transactions(search_query)),
+                ttl,
             )
+        for transaction in matched:
+            transactions[transaction.id] = transaction
+    return sorted(
+        transactions.values(), key=lambda t: (t.date, int(t.id)), reverse=True
+    )
@@ -0,0 +1,274 @@
+"""
+Compiles the `column_mappings` of an import_csv mappings yaml, e.g.
+
+    column_mappings:
+        description: description
+        amount: __auto-abs:amount
+        credit_debit: __auto-type:debit-credit:type
+
+into a `MappingPlan`: a validated list of vectorised column operations (with any
+`__py-expr` already compiled), that can be applied to any number of data frames
+(chunks, or different files with the same layout) without re-parsing the directives.
+"""
+import functools
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from types import CodeType
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import yaml
+from schema import Or, Schema
+
+from firefly_automate.miscs import to_datetime
+
+column_mappings_schema = Schema({str: Or(str, [str])})
+
+SOURCE_DESTINATION_DIRECTIVES = (
+    "auto-source-destination",
+    "auto-inv-source-destination",
+)
+
+
+def _split_by_colon(_str: str, nparts: int = 3) -> List[str]:
+    # this regex split on colon that are not escaped by backslash \
+    _parts = re.split(r"(?<!\\):", _str)
+
+    if len(_parts) != nparts:
+        raise ValueError(
+            f"Mapping '{_str}' must have {nparts} parts separated by colon"
+        )
+    # replace any escaped colon back to its original form
+    return [p.replace(r"\:", ":") for p in _parts]
+
+
+@dataclass(frozen=True)
+class ColumnOperation:
+    """One mapping from a csv column (source) into a firefly attribute (target)."""
+
+    source: str
+    target: str
+    directive: str = "copy"
+    options: Tuple[str, ...] = ()
+    code: Optional[CodeType] = None
+
+    @classmethod
+    def parse(cls, source: str, extract_as: str) -> "ColumnOperation":
+        if extract_as.startswith("__auto-abs:"):
+            _, map_to_col = _split_by_colon(extract_as, 2)
+            return cls(source, map_to_col, "auto-abs")
+
+        elif extract_as.startswith("__strip:"):
+            _, map_to_col = _split_by_colon(extract_as, 2)
+            return cls(source, map_to_col, "strip")
+
+        elif extract_as.startswith("__auto-type:") or extract_as.startswith(
+            "__auto-pos-neg:"
+        ):
+            _directive, _conf, map_to_col = _split_by_colon(extract_as, 3)
+            options = tuple(_conf.split("-"))
+            if len(options) != 2:
+                raise ValueError(
+                    f"Mapping '{extract_as}' must have two values separated by '-'"
+                )
+            return cls(source, map_to_col, _directive[2:], options)
+
+        elif extract_as.startswith("__auto-source-destination__"):
+            _attr = extract_as[len("__auto-source-destination__") :]
+            return cls(source, _attr, "auto-source-destination")
+
+        elif extract_as.startswith("__auto-inv-source-destination__"):
+            _attr = extract_as[len("__auto-inv-source-destination__") :]
+            return cls(source, _attr, "auto-inv-source-destination")
+
+        elif extract_as.startswith("__py-expr:"):
+            _, _expression, map_to_col = _split_by_colon(extract_as, 3)
+            code = compile(_expression, f"<mapping of '{source}'>", "eval")
+            return cls(source, map_to_col, "py-expr", (_expression,), code)
+
+        elif extract_as.startswith("__"):
+            raise NotImplementedError(
+                f"Detected special rule '{extract_as}', but I don't "
+                "know how to handle that."
+            )
+        return cls(source, extract_as)
+
+    def evaluate(self, df: pd.DataFrame) -> pd.Series:
+        column = df[self.source]
+        if self.directive == "auto-abs":
+            return column.astype(float).abs().astype(str)
+        elif self.directive == "strip":
+            return column.str.strip("'\"\n\t ")
+        elif self.directive == "auto-type":
+            # map from the specified keyword into either withdrawal or deposit
+            withdrawal, deposit = self.options
+            return pd.Series(
+                np.select(
+                    [column == withdrawal, column == deposit],
+                    ["withdrawal", "deposit"],
+                    default=None,
+                ),
+                index=df.index,
+                dtype=object,
+            )
+        elif self.directive == "auto-pos-neg":
+            # assign based on whether this column is positive or negative
+            pos, neg = self.options
+            _col_as_float = column.astype(float)
+            return pd.Series(
+                np.select(
+                    [_col_as_float > 0, _col_as_float < 0], [pos, neg], default=None
+                ),
+                index=df.index,
+                dtype=object,
+            )
+        elif self.directive == "py-expr":
+            # DANGEROUS of eval any arbitary expression. You need to trust your own config.
+            return eval(self.code, {"pd": pd, "np": np, "re": re}, {"x": column})
+        return column
+
+
+class MappingPlan:
+    """A compiled set of column operations, applied in a single pass over a frame.
+
+    Operations that map into the transaction type are always evaluated first, as the
+    source/destination directives depend on knowing whether each transaction is a
+    withdrawal or a deposit.
+    """
+
+    def __init__(
+        self,
+        operations: List[ColumnOperation],
+        date_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        self.type_operations = [op for op in operations if op.target.endswith("type")]
+        self.operations = [op for op in operations if not op.target.endswith("type")]
+        self.date_kwargs = date_kwargs or {}
+        self.date_columns = [
+            t
+            for t in dict.fromkeys(op.target for op in self.operations)
+            if t.endswith("date")
+        ]
+
+        if "type" not in set(op.target for op in self.type_operations) and any(
+            op.directive in SOURCE_DESTINATION_DIRECTIVES for op in self.operations
+        ):
+            raise ValueError(
+                "Mapping into source/destination requires a mapping into 'type'."
+            )
+
+    @classmethod
+    def from_column_mappings(
+        cls, column_mappings: Dict[str, Any], **kwargs
+    ) -> "MappingPlan":
+        column_mappings = column_mappings_schema.validate(column_mappings)
+        operations = []
+        for k, v in column_mappings.items():
+            # make it so that we supports using list in a key-val reference.
+            if not isinstance(v, list):
+                v = [v]
+            operations.extend(ColumnOperation.parse(k, _v) for _v in v)
+        return cls(operations, **kwargs)
+
+    def apply(self, df: pd.DataFrame, source: Any = None) -> pd.DataFrame:
+        """Map the given frame. `source` identifies where the frame came from (e.g.
+        the csv file), for caching the inferred date formats."""
+        columns: Dict[str, pd.Series] = {}
+
+        def _assign_col(map_to_col: str, data: pd.Series):
+            if map_to_col not in columns:
+                columns[map_to_col] = data
+                return
+            if map_to_col == "tag":
+                raise NotImplementedError(
+                    "Multi-Tag is not implemented (they will override each other right now.)"
+                )
+            columns[map_to_col] = columns[map_to_col] + data
+
+        for op in self.type_operations:
+            _assign_col(op.target, op.evaluate(df))
+
+        if "type" in columns:
+            _transactions_as_source = columns["type"] == "withdrawal"
+            _transactions_as_destination = columns["type"] == "deposit"
+
+        for op in self.operations:
+            if op.directive in SOURCE_DESTINATION_DIRECTIVES:
+                # assign based on whether this is a source acc or destination acc
+                masks = (_transactions_as_source, _transactions_as_destination)
+                if op.directive == "auto-inv-source-destination":
+                    masks = masks[::-1]
+                data = op.evaluate(df)
+                for prefix, mask in zip(("source", "destination"), masks):
+                    key = f"{prefix}_{op.target}"
+                    columns[key] = data.where(mask, columns.get(key, np.nan))
+            else:
+                _assign_col(op.target, op.evaluate(df))
+
+        for col in self.date_columns:
+            columns[col] = to_datetime(
+                columns[col].rename(col), source=source, **self.date_kwargs
+            )
+
+        return pd.DataFrame(columns, index=df.index)
+
+
+@functools.lru_cache
+def _read_yaml(fname: str, mtime: float) -> Dict[str, Any]:
+    return yaml.safe_load(Path(fname).read_text()) or dict()
+
+
+def _mappings_chain(fname: str) -> Tuple[Tuple[str, float], ...]:
+    """The (path, mtime) of the given mappings yaml, followed by those of its
+    `__base_setting_yaml` (and of its base, and so on)."""
+    chain = []
+    while fname:
+        path = os.path.abspath(fname)
+        if any(path == p for p, _ in chain):
+            names = " -> ".join([p for p, _ in chain] + [path])
+            raise ValueError(f"The '__base_setting_yaml' of {names} form a cycle")
+        mtime = os.path.getmtime(path)
+        chain.append((path, mtime))
+        fname = _read_yaml(path, mtime).get("__base_setting_yaml")
+    return tuple(chain)
+
+
+def _read_mappings_yaml(chain: Tuple[Tuple[str, float], ...]) -> Dict[str, Any]:
+    # merge with the bases, where the settings of a yaml take precedence over its base
+    mappings = {}
+    for path, mtime in chain:
+        for k, v in _read_yaml(path, mtime).items():
+            if k != "__base_setting_yaml" and k not in mappings:
+                mappings[k] = v
+    return mappings
+
+
+@functools.lru_cache
+def _load_mappings_file(
+    chain: Tuple[Tuple[str, float], ...]
+) -> Tuple[Dict[str, Any], Optional[MappingPlan]]:
+    mappings = _read_mappings_yaml(chain)
+    column_mappings = mappings.pop("column_mappings", None)
+    plan = None
+    if column_mappings is not None:
+        date_kwargs = {}
+        if mappings.get("date_format") is not None:
+            date_kwargs["format"] = mappings["date_format"]
+        elif "date_format_day_first" in mappings:
+            date_kwargs["dayfirst"] = mappings["date_format_day_first"]
+        plan = MappingPlan.from_column_mappings(
+            column_mappings, date_kwargs=date_kwargs
+        )
+    return mappings, plan
+
+
+def load_mappings_file(fname: str) -> Tuple[Dict[str, Any], Optional[MappingPlan]]:
+    """Load a mappings yaml (including its `__base_setting_yaml` inheritance), and
+    return the remaining settings along with the compiled plan of its
+    `column_mappings`. Results are cached until the file (or any of its bases) is
+    modified."""
+    mappings, plan = _load_mappings_file(_mappings_chain(fname))
+    return dict(mappings), plan
@@ -2,6 +2,7 @@ import argparse
 import logging
 import pprint
 import re
+from collections import Counter
 from typing import (
     TYPE_CHECKING,
     Any,
@@ -11,17 +12,17 @@ from typing import (
     List,
     Match,
     Optional,
+    Tuple,
     TypeVar,
     Union,
 )
 
-import pandas as pd
-
 from datetime import datetime
 from dateutil.parser import parse as dateutil_parser
-from firefly_automate import firefly_request_manager
 
 if TYPE_CHECKING:
+    import pandas as pd
+
     from firefly_automate.data_type.pending_update import TransactionOwnerReturnType
     from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 
@@ -30,6 +31,8 @@ def get_transaction_owner(
     entry: "FireflyTransactionDataClass",
     actual_name: bool = False,
 ) -> "TransactionOwnerReturnType":
+    from firefly_automate import firefly_request_manager
+
     belongs_to: "TransactionOwnerReturnType"
     acc_id_to_name = firefly_request_manager.get_firefly_account_mappings()
     if entry.type == "withdrawal":
@@ -60,10 +63,97 @@ def set_args(_args):
     args = _args
 
 
-def to_datetime(x, **kwargs):
+DATE_FORMAT_INFERENCE_SAMPLE_SIZE = 100
+DATE_FORMAT_MIN_PARSED_FRACTION = 0.5
+
+# cache of inferred date format, keyed by (source, column name, dayfirst)
+_inferred_date_formats: Dict[Tuple[Any, Any, bool], str] = {}
+
+
+def _sample_date_strings(x: "pd.Series") -> Optional["pd.Series"]:
+    """Return an evenly spaced sample of the non-null values of x, or None if x does
+    not consist of strings (e.g. it is already parsed)."""
+    import numpy as np
+
+    non_null = x.dropna()
+    if len(non_null) == 0:
+        return None
+    if len(non_null) > DATE_FORMAT_INFERENCE_SAMPLE_SIZE:
+        non_null = non_null.iloc[
+            np.linspace(
+                0, len(non_null) - 1, DATE_FORMAT_INFERENCE_SAMPLE_SIZE, dtype=int
+            )
+        ]
+    if not all(isinstance(v, str) for v in non_null):
+        return None
+    return non_null
+
+
+def _parsed_fraction(sample: "pd.Series", date_format: str, **kwargs) -> float:
+    import pandas as pd
+
+    try:
+        parsed = pd.to_datetime(sample, format=date_format, errors="coerce", **kwargs)
+    except (ValueError, TypeError):
+        return 0.0
+    return float(parsed.notna().mean())
+
+
+def infer_date_format(
+    x: "pd.Series", dayfirst: bool = True, source: Any = None, **kwargs
+) -> Optional[str]:
+    """Infer the date format of a column from a small sample of its values.
+
+    The result is cached by the column name and its source (e.g. the csv file), and
+    is only re-inferred when the cached format no longer parses most of the sample.
     """
-    Custom to_datetime with default args
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:  # pandas < 2.2
+        from pandas._libs.tslibs.parsing import guess_datetime_format
+
+    sample = _sample_date_strings(x)
+    if sample is None:
+        return None
+    key = (source, x.name, dayfirst)
+    date_format = _inferred_date_formats.get(key)
+    if (
+        date_format is not None
+        and _parsed_fraction(sample, date_format, **kwargs)
+        >= DATE_FORMAT_MIN_PARSED_FRACTION
+    ):
+        return date_format
+
+    def _guess(value: str) -> Optional[str]:
+        _format = guess_datetime_format(value, dayfirst=dayfirst)
+        if dayfirst and _format is not None and _format.startswith("%Y"):
+            # year-first dates (e.g. iso format) are not written as year-day-month
+            _format = guess_datetime_format(value, dayfirst=False) or _format
+        return _format
+
+    candidates = Counter(_guess(v) for v in sample)
+    candidates.pop(None, None)
+    if len(candidates) == 0:
+        return None
+    parsed_fraction, date_format = max(
+        (_parsed_fraction(sample, _format, **kwargs), _format) for _format in candidates
+    )
+    if parsed_fraction < DATE_FORMAT_MIN_PARSED_FRACTION:
+        return None
+    _inferred_date_formats[key] = date_format
+    return date_format
+
+
+def to_datetime(x, source: Any = None, **kwargs):
     """
+    Custom to_datetime with default args.
+
+    If no format is given for a series, it is inferred once (per column and source)
+    from a sample of values and then applied to the whole column; only the rows that
+    fail to parse with it fall back to the (slow) per-element inference.
+    """
+    import pandas as pd
+
     if "format" not in kwargs and (
         hasattr(args, "date_format") and args.date_format is not None
     ):
@@ -75,9 +165,24 @@ def to_datetime(x, **kwargs):
             dayfirst = args.date_format_day_first
         except AttributeError:
             dayfirst = True
-        kwargs["dayfirst"] = dayfirst
+        kwargs.setdefault("dayfirst", dayfirst)
 
-    return pd.to_datetime(x, **kwargs)
+    if "format" in kwargs or not isinstance(x, pd.Series):
+        return pd.to_datetime(x, **kwargs)
+
+    _kwargs = {k: v for k, v in kwargs.items() if k != "dayfirst"}
+    date_format = infer_date_format(x, kwargs["dayfirst"], source=source, **_kwargs)
+    if date_format is None:
+        return pd.to_datetime(x, **kwargs)
+    try:
+        parsed = pd.to_datetime(x, format=date_format, errors="coerce", **_kwargs)
+        failed = parsed.isna() & x.notna()
+        if failed.any():
+            # parse the remaining ones individually, as they may not share a format
+            parsed[failed] = [pd.to_datetime(v, **kwargs) for v in x[failed]]
+    except (ValueError, TypeError):
+        return pd.to_datetime(x, **kwargs)
+    return parsed
 
 
 def group_by(
@@ -88,7 +193,7 @@ def group_by(
     grouped: Dict[str, List[T]] = {}
     for item in list_of_items:
         identity = functor(item)
-        if functor(item) not in grouped:
+        if identity not in grouped:
             grouped[identity] = []
         grouped[identity].append(item)
     return grouped
@@ -0,0 +1,886 @@
+#!/bin/env python
+"""
+An in-process fake of the Firefly III API, for exercising the network paths (and
+measuring their throughput) without a real instance, e.g.
+
+    with MockFirefly(num_transactions=100_000, latency=0.01) as mock:
+        os.environ["firefly_iii_host"] = mock.url
+        ...
+
+or as a standalone server to point the config at:
+
+    python -m firefly_automate.mock_firefly --num-transactions 100000 --port 8090
+
+It serves the paginated transactions (also per account, and searched), accounts,
+tags, rules and rule groups, and stores/updates/deletes transactions and rules. The
+synthetic ledger is deterministic (for a given size and date range) and each transaction
+is only generated when it is served, so that even 1M transactions take no time to
+set up. Only the changed or stored transactions are kept in memory.
+
+The ledger has what the rules and `merge` look for: recurring vendors, both halves
+of the transfers in between the accounts, near-duplicates of some purchases, paid
+salaries, purchases in a foreign currency, and reconciled transactions (all but
+the recent ones). It also serves as the data of the benchmarks, see
+`SyntheticLedger.transactions`.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import random
+import re
+import shlex
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+if TYPE_CHECKING:
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+
+# (id, name, type)
+ACCOUNTS = (
+    ("1", "Checking account", "asset"),
+    ("2", "Savings account", "asset"),
+    ("3", "Employer", "revenue"),
+    ("4", "Transfer from checking", "revenue"),
+    ("5", "Transfer to savings", "expense"),
+    ("6", "WOOLWORTHS 1234 SYDNEY", "expense"),
+    ("7", "COLES 0421 NEWTOWN", "expense"),
+    ("8", "ALDI STORES 77", "expense"),
+    ("9", "UBER *TRIP HELP.UBER.COM", "expense"),
+    ("10", "NETFLIX.COM", "expense"),
+    ("11", "JB HI-FI ONLINE", "expense"),
+    ("12", "TRANSPORTFORNSW OPAL", "expense"),
+)
+VENDOR_ACCOUNTS = ACCOUNTS[5:]
+ACCOUNT_TYPE_NAMES = {
+    "asset": "Asset account",
+    "expense": "Expense account",
+    "revenue": "Revenue account",
+}
+
+# every TRANSFER_PERIOD-th transaction is a withdrawal out of the checking account,
+# directly followed by its matching deposit into the savings account (i.e. the two
+# halves of a transfer, for `merge`). Their amounts are unique, and no other
+# withdrawal/deposit pair has the same amount, so each has exactly one candidate.
+TRANSFER_PERIOD = 50
+SALARY_PERIOD = 25
+# every DUPLICATE_PERIOD-th transaction (offset by DUPLICATE_OFFSET) is a
+# near-duplicate of the purchase before it, i.e. on the same day with the same amount,
+# but with a suffix to its description (as for `RemoveDuplicates`)
+DUPLICATE_PERIOD = 100
+DUPLICATE_OFFSET = 43
+# every FOREIGN_PERIOD-th purchase (offset by FOREIGN_OFFSET) is paid in USD, and
+# tagged as TRAVEL_TAG
+FOREIGN_PERIOD = 20
+FOREIGN_OFFSET = 3
+AUD_PER_USD = 1.5
+TRAVEL_TAG = "travel"
+# the transactions of the last RECONCILED_AFTER_DAYS days are not reconciled yet
+RECONCILED_AFTER_DAYS = 30
+
+MERGE_AS_TRANSFER_RULE = {
+    "title": "merge-as-transfer_convert",
+    "description": "",
+    "rule_group_id": "1",
+    "order": 1,
+    "active": True,
+    "strict": True,
+    "stop_processing": False,
+    "trigger": "update-journal",
+    "triggers": [
+        {"type": "tag_is", "value": "AUTOMATE_convert-as-transfer", "order": 0}
+    ],
+    "actions": [
+        {"type": "convert_transfer", "value": "Savings account", "order": 0},
+        {"type": "remove_tag", "value": "AUTOMATE_convert-as-transfer", "order": 1},
+    ],
+}
+
+TIMESTAMP = "2023-01-01T00:00:00+00:00"
+
+
+class _NotFound(Exception):
+    pass
+
+
+class SyntheticLedger:
+    """The synthetic transactions (ids 1..num_transactions, ascending by date), plus
+    whatever has been stored, updated or deleted since."""
+
+    def __init__(
+        self,
+        num_transactions: int = 1000,
+        days: int = 365,
+        end_date: datetime.date = None,
+    ):
+        self.num_transactions = num_transactions
+        self.days = days
+        self.end_date = end_date or datetime.date.today()
+        self.start_date = self.end_date - datetime.timedelta(days=days - 1)
+        self.reset()
+
+    def reset(self):
+        """Discard all the changes, i.e. back to the synthetic ledger."""
+        self.updated: Dict[str, Dict[str, Any]] = {}
+        self.stored: Dict[str, Dict[str, Any]] = {}
+        self.deleted = set()
+        # when the stored or updated transactions last were (the synthetic ones were
+        # at TIMESTAMP)
+        self.updated_at: Dict[str, str] = {}
+        self.accounts = {acc_id: (name, t) for acc_id, name, t in ACCOUNTS}
+        self.rule_groups = {
+            "1": {"title": "firefly-automate", "description": "", "active": True}
+        }
+        self.rules = {"1": dict(MERGE_AS_TRANSFER_RULE)}
+        self.tags = {
+            "1": {
+                "tag": TRAVEL_TAG,
+                "date": None,
+                "description": "Paid in a foreign currency",
+            }
+        }
+        self._ids = itertools.count(self.num_transactions + 1)
+        # the listed ids of each filter, until the next change
+        self._listed: Dict[Tuple, List[str]] = {}
+
+    def _day(self, i: int) -> int:
+        if i % TRANSFER_PERIOD == 1 and i > 1:
+            # the deposit of a transfer is on the same day as its withdrawal
+            i -= 1
+        elif i % DUPLICATE_PERIOD == DUPLICATE_OFFSET:
+            # so is a near-duplicate of the purchase before it
+            i -= 1
+        return (i - 1) * self.days // self.num_transactions
+
+    @staticmethod
+    def _purchase(i: int) -> Tuple[str, str, str]:
+        """The (vendor account id, amount, description) of the i-th purchase."""
+        vendor = VENDOR_ACCOUNTS[i % len(VENDOR_ACCOUNTS)]
+        cents = (i * 37) % 100
+        if cents in (55, 77):
+            # those are reserved for the deposits
+            cents += 1
+        amount = f"{1 + (i * 7919) % 300}.{cents:02d}"
+        return vendor[0], amount, f"{vendor[1]} {i % 10000:04d}"
+
+    def _synthetic_split(self, i: int) -> Dict[str, Any]:
+        foreign_amount = None
+        if i % TRANSFER_PERIOD == 0:
+            kind, source, destination = "withdrawal", "1", "5"
+            amount = f"{1000 + i // TRANSFER_PERIOD}.77"
+            description = "Transfer to savings"
+        elif i % TRANSFER_PERIOD == 1 and i > 1:
+            kind, source, destination = "deposit", "4", "2"
+            amount = f"{1000 + i // TRANSFER_PERIOD}.77"
+            description = "Transfer from checking"
+        elif i % SALARY_PERIOD == 10:
+            kind, source, destination = "deposit", "3", "1"
+            amount = f"{1000 + i % 4000}.55"
+            description = "SALARY ACME PTY LTD"
+        elif i % DUPLICATE_PERIOD == DUPLICATE_OFFSET:
+            kind, source = "withdrawal", "1"
+            destination, amount, description = self._purchase(i - 1)
+            description += " AUS"
+        else:
+            kind, source = "withdrawal", "1"
+            destination, amount, description = self._purchase(i)
+            if i % FOREIGN_PERIOD == FOREIGN_OFFSET:
+                foreign_amount = f"{float(amount) / AUD_PER_USD:.2f}"
+        day = self._day(i)
+        date = self.start_date + datetime.timedelta(days=day)
+        split = self._split(
+            i, kind, f"{date}T00:00:00+00:00", amount, description, source, destination
+        )
+        split["reconciled"] = day < self.days - RECONCILED_AFTER_DAYS
+        if foreign_amount is not None:
+            split.update(
+                foreign_currency_id="2",
+                foreign_currency_code="USD",
+                foreign_currency_symbol="US$",
+                foreign_currency_decimal_places=2,
+                foreign_amount=foreign_amount,
+                tags=[TRAVEL_TAG],
+            )
+        return split
+
+    def _split(
+        self,
+        i: int,
+        kind: str,
+        date: str,
+        amount: str,
+        description: str,
+        source: str,
+        destination: str,
+    ) -> Dict[str, Any]:
+        source_name, source_type = self.accounts[source]
+        destination_name, destination_type = self.accounts[destination]
+        return {
+            "user": "1",
+            "transaction_journal_id": str(i),
+            "type": kind,
+            "date": date,
+            "order": 0,
+            "currency_id": "1",
+            "currency_code": "AUD",
+            "currency_name": "Australian dollar",
+            "currency_symbol": "$",
+            "currency_decimal_places": 2,
+            "foreign_currency_id": None,
+            "foreign_currency_code": None,
+            "foreign_currency_symbol": None,
+            "foreign_currency_decimal_places": None,
+            "foreign_amount": None,
+            "amount": amount,
+            "description": description,
+            "source_id": source,
+            "source_name": source_name,
+            "source_iban": None,
+            "source_type": ACCOUNT_TYPE_NAMES[source_type],
+            "destination_id": destination,
+            "destination_name": destination_name,
+            "destination_iban": None,
+            "destination_type": ACCOUNT_TYPE_NAMES[destination_type],
+            "budget_id": None,
+            "budget_name": None,
+            "category_id": None,
+            "category_name": None,
+            "bill_id": None,
+            "bill_name": None,
+            "reconciled": False,
+            "notes": None,
+            "tags": [],
+            "internal_reference": None,
+            "external_id": None,
+            "original_source": "mock-firefly",
+        }
+
+    def split(self, transaction_id: str) -> Dict[str, Any]:
+        if transaction_id in self.deleted:
+            raise _NotFound(transaction_id)
+        if transaction_id in self.stored:
+            split = self.stored[transaction_id]
+        elif transaction_id.isdigit() and 1 <= int(transaction_id) <= (
+            self.num_transactions
+        ):
+            split = self._synthetic_split(int(transaction_id))
+        else:
+            raise _NotFound(transaction_id)
+        if transaction_id in self.updated:
+            split = {**split, **self.updated[transaction_id]}
+        return split
+
+    def _first_id_after(self, day: int) -> int:
+        """The first synthetic id that is dated after the given day (the ids are
+        ascending by date)."""
+        lo, hi = 1, self.num_transactions + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._day(mid) <= day:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _synthetic_ids_between(
+        self, start: Optional[datetime.date], end: Optional[datetime.date]
+    ) -> range:
+        lo, hi = 1, self.num_transactions + 1
+        if start is not None:
+            lo = self._first_id_after((start - self.start_date).days - 1)
+        if end is not None:
+            hi = self._first_id_after((end - self.start_date).days)
+        return range(lo, max(lo, hi))
+
+    def list_ids(
+        self,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        account_id: Optional[str] = None,
+        kind: Optional[str] = None,
+        account_name: Optional[str] = None,
+        description_contains: Optional[str] = None,
+        updated_after: Optional[datetime.date] = None,
+    ) -> List[str]:
+        """The ids of the transactions that match all the given filters, newest
+        first."""
+        key = (
+            start,
+            end,
+            account_id,
+            kind,
+            account_name,
+            description_contains,
+            updated_after,
+        )
+        ids = self._listed.get(key)
+        if ids is not None:
+            return ids
+        candidates = [str(i) for i in self._synthetic_ids_between(start, end)]
+        candidates.extend(
+            _id
+            for _id, split in self.stored.items()
+            if (start is None or str(start) <= split["date"][:10])
+            and (end is None or split["date"][:10] <= str(end))
+        )
+        ids = []
+        for _id in candidates:
+            if _id in self.deleted:
+                continue
+            if (
+                account_id is None
+                and kind is None
+                and account_name is None
+                and description_contains is None
+                and updated_after is None
+                and _id not in self.updated
+                and _id not in self.stored
+            ):
+                ids.append(_id)
+                continue
+            split = self.split(_id)
+            if account_id is not None and account_id not in (
+                split["source_id"],
+                split["destination_id"],
+            ):
+                continue
+            if kind not in (None, "all") and split["type"] != kind:
+                continue
+            if account_name is not None and account_name not in (
+                split["source_name"],
+                split["destination_name"],
+            ):
+                continue
+            if description_contains is not None and (
+                description_contains.lower() not in split["description"].lower()
+            ):
+                continue
+            if updated_after is not None and (
+                self.updated_at.get(_id, TIMESTAMP)[:10] < str(updated_after)
+            ):
+                continue
+            ids.append(_id)
+        if self.stored or self.updated:
+            ids.sort(key=lambda _id: (self.split(_id)["date"], int(_id)))
+        ids.reverse()
+        self._listed[key] = ids
+        return ids
+
+    def _changed(self, transaction_id: str = None):
+        self._listed.clear()
+        if transaction_id is not None:
+            self.updated_at[transaction_id] = datetime.datetime.now(
+                datetime.timezone.utc
+            ).isoformat(timespec="seconds")
+
+    def account_id(self, name: Optional[str], default_type: str) -> str:
+        """The id of the account with the given name, which is created (as Firefly
+        III does for expense/revenue accounts) if there is none."""
+        for acc_id, (acc_name, _) in self.accounts.items():
+            if acc_name == name:
+                return acc_id
+        acc_id = str(len(self.accounts) + 1)
+        self.accounts[acc_id] = (name or "(no name)", default_type)
+        return acc_id
+
+    def store(self, split: Dict[str, Any]) -> str:
+        transaction_id = str(next(self._ids))
+        kind = split.get("type", "withdrawal")
+        source = split.get("source_id") or self.account_id(
+            split.get("source_name"),
+            "revenue" if kind == "deposit" else "asset",
+        )
+        destination = split.get("destination_id") or self.account_id(
+            split.get("destination_name"),
+            "expense" if kind == "withdrawal" else "asset",
+        )
+        stored = self._split(
+            int(transaction_id),
+            kind,
+            split["date"],
+            split["amount"],
+            split["description"],
+            source,
+            destination,
+        )
+        for key, val in split.items():
+            if key in stored and key not in ("source_id", "destination_id"):
+                stored[key] = val
+        stored["date"] = str(split["date"])
+        self.stored[transaction_id] = stored
+        self._changed(transaction_id)
+        return transaction_id
+
+    def update(self, transaction_id: str, split: Dict[str, Any]):
+        self.split(transaction_id)
+        self.updated.setdefault(transaction_id, {}).update(split)
+        self._changed(transaction_id)
+
+    def delete(self, transaction_id: str):
+        self.split(transaction_id)
+        self.deleted.add(transaction_id)
+        self._changed()
+
+    def transactions(self, **filters) -> Iterator["FireflyTransactionDataClass"]:
+        """The transactions (that match the filters of `list_ids`), newest first, as
+        the commands get them from the api."""
+        from firefly_automate.data_type.transaction_type import (
+            FireflyTransactionDataClass,
+        )
+
+        for transaction_id in self.list_ids(**filters):
+            yield FireflyTransactionDataClass(
+                id=transaction_id, **self.split(transaction_id)
+            )
+
+
+def _date(value: Optional[str]) -> Optional[datetime.date]:
+    if value is None:
+        return None
+    return datetime.date.fromisoformat(value[:10])
+
+
+def _parse_search_query(query: str) -> Dict[str, Any]:
+    """The filters of the given search query (only the operators that the rules
+    use), e.g. `date_after:2023-01-01 account_is:"Checking account"`."""
+    filters = {}
+    for term in shlex.split(query):
+        operator, _, value = term.partition(":")
+        if operator == "date_after":
+            filters["start"] = _date(value)
+        elif operator == "date_before":
+            filters["end"] = _date(value)
+        elif operator == "account_is":
+            filters["account_name"] = value
+        elif operator == "type":
+            filters["kind"] = value
+        elif operator == "description_contains":
+            filters["description_contains"] = value
+        elif operator == "updated_at_after":
+            filters["updated_after"] = _date(value)
+        else:
+            raise ValueError(f"unsupported search operator: {term}")
+    return filters
+
+
+class MockFirefly(ThreadingHTTPServer):
+    """The fake Firefly III server, which serves on a background thread once
+    started. Point `firefly_iii_host` at its `url`.
+
+    Each request is delayed by `latency` seconds, and fails (500) with probability
+    `error_rate`. Listing endpoints return `page_size` entries per page.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        num_transactions: int = 1000,
+        days: int = 365,
+        page_size: int = 50,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        end_date: datetime.date = None,
+    ):
+        super().__init__((host, port), MockRequestHandler)
+        self.ledger = SyntheticLedger(num_transactions, days, end_date)
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        # the ledger is not thread-safe
+        self.lock = threading.Lock()
+        self.num_requests: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockFirefly":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self._thread.join()
+        self.server_close()
+
+    def reset(self):
+        """Back to the synthetic ledger, and forget the request counts."""
+        with self.lock:
+            self.ledger.reset()
+            self.num_requests.clear()
+
+    def __enter__(self) -> "MockFirefly":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self._random.random() < self.error_rate
+
+
+def _page(
+    entries: List[Any], query: Dict[str, str], page_size: int
+) -> Tuple[List[Any], Dict[str, Any]]:
+    page = max(int(query.get("page", 1)), 1)
+    selected = entries[(page - 1) * page_size : page * page_size]
+    meta = {
+        "pagination": {
+            "total": len(entries),
+            "count": len(selected),
+            "per_page": page_size,
+            "current_page": page,
+            "total_pages": max((len(entries) + page_size - 1) // page_size, 1),
+        }
+    }
+    return selected, meta
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    server: MockFirefly
+    protocol_version = "HTTP/1.1"
+    # otherwise each (small) response waits for the client's delayed ack
+    disable_nagle_algorithm = True
+
+    ROUTES = (
+        ("GET", r"/transactions", "list_transactions"),
+        ("POST", r"/transactions", "store_transaction"),
+        ("GET", r"/transactions/(\w+)", "get_transaction"),
+        ("PUT", r"/transactions/(\w+)", "update_transaction"),
+        ("DELETE", r"/transactions/(\w+)", "delete_transaction"),
+        ("GET", r"/search/transactions", "search_transactions"),
+        ("GET", r"/accounts", "list_accounts"),
+        ("GET", r"/accounts/(\w+)/transactions", "list_account_transactions"),
+        ("GET", r"/rules", "list_rules"),
+        ("POST", r"/rules", "store_rule"),
+        ("PUT", r"/rules/(\w+)", "update_rule"),
+        ("DELETE", r"/rules/(\w+)", "delete_rule"),
+        ("GET", r"/rule-groups", "list_rule_groups"),
+        ("POST", r"/rule-groups", "store_rule_group"),
+        ("DELETE", r"/rule-groups/(\w+)", "delete_rule_group"),
+        ("GET", r"/rule-groups/(\w+)/rules", "list_rules_of_group"),
+        ("GET", r"/tags", "list_tags"),
+        ("POST", r"/rule-groups/(\w+)/trigger", "trigger_rule_group"),
+    )
+
+    def _handle(self, method: str):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = url.path[len("/api/v1") :] if url.path.startswith("/api/v1") else ""
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                break
+        else:
+            self._respond(404, {"message": f"No route for {method} {url.path}"})
+            return
+        with self.server.lock:
+            self.server.num_requests[name] += 1
+        time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self._respond(500, {"message": "Injected error", "exception": "Mock"})
+            return
+        try:
+            payload = json.loads(body) if body else None
+            with self.server.lock:
+                status, response = getattr(self, name)(*match.groups(), query, payload)
+        except _NotFound as e:
+            self._respond(404, {"message": f"Resource not found: {e}"})
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            self._respond(422, {"message": f"Invalid request: {e!r}"})
+            return
+        self._respond(status, response)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _respond(self, status: int, response: Optional[Dict[str, Any]]):
+        body = b"" if response is None else json.dumps(response).encode()
+        self.send_response(status)
+        if response is not None:
+            # as Firefly III, errors are plain json
+            content_type = (
+                "application/vnd.api+json" if status < 400 else "application/json"
+            )
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+    ##############################
+    # serialisation
+    ##############################
+
+    def _links(self, path: str) -> Dict[str, Any]:
+        return {"self": f"{self.server.url}/api/v1/{path}"}
+
+    def _transaction(self, transaction_id: str) -> Dict[str, Any]:
+        return {
+            "type": "transactions",
+            "id": transaction_id,
+            "attributes": {
+                "created_at": TIMESTAMP,
+                "updated_at": self.server.ledger.updated_at.get(
+                    transaction_id, TIMESTAMP
+                ),
+                "user": "1",
+                "group_title": None,
+                "transactions": [self.server.ledger.split(transaction_id)],
+            },
+            "links": {
+                "0": {"rel": "self", "uri": f"/transactions/{transaction_id}"},
+                **self._links(f"transactions/{transaction_id}"),
+            },
+        }
+
+    def _account(self, account_id: str) -> Dict[str, Any]:
+        name, acc_type = self.server.ledger.accounts[account_id]
+        return {
+            "type": "accounts",
+            "id": account_id,
+            "attributes": {
+                "created_at": TIMESTAMP,
+                "updated_at": TIMESTAMP,
+                "active": True,
+                "name": name,
+                "type": acc_type,
+                "currency_code": "AUD",
+                "currency_symbol": "$",
+                "currency_decimal_places": 2,
+            },
+            "links": self._links(f"accounts/{account_id}"),
+        }
+
+    def _rule(self, rule_id: str) -> Dict[str, Any]:
+        return {
+            "type": "rules",
+            "id": rule_id,
+            "attributes": self.server.ledger.rules[rule_id],
+            "links": self._links(f"rules/{rule_id}"),
+        }
+
+    def _tag(self, tag_id: str) -> Dict[str, Any]:
+        return {
+            "type": "tags",
+            "id": tag_id,
+            "attributes": {
+                "created_at": TIMESTAMP,
+                "updated_at": TIMESTAMP,
+                **self.server.ledger.tags[tag_id],
+            },
+            "links": self._links(f"tags/{tag_id}"),
+        }
+
+    def _rule_group(self, group_id: str) -> Dict[str, Any]:
+        return {
+            "type": "rule_groups",
+            "id": group_id,
+            "attributes": self.server.ledger.rule_groups[group_id],
+            "links": self._links(f"rule-groups/{group_id}"),
+        }
+
+    def _list(self, path: str, ids: List[str], query, serialise) -> Tuple[int, Dict]:
+        selected, meta = _page(ids, query, self.server.page_size)
+        return 200, {
+            "data": [serialise(_id) for _id in selected],
+            "meta": meta,
+            "links": self._links(path),
+        }
+
+    ##############################
+    # transactions
+    ##############################
+
+    def list_transactions(self, query, payload):
+        ids = self.server.ledger.list_ids(
+            _date(query.get("start")), _date(query.get("end")), kind=query.get("type")
+        )
+        return self._list("transactions", ids, query, self._transaction)
+
+    def list_account_transactions(self, account_id, query, payload):
+        if account_id not in self.server.ledger.accounts:
+            raise _NotFound(account_id)
+        ids = self.server.ledger.list_ids(
+            _date(query.get("start")),
+            _date(query.get("end")),
+            account_id=account_id,
+            kind=query.get("type"),
+        )
+        return self._list(
+            f"accounts/{account_id}/transactions", ids, query, self._transaction
+        )
+
+    def search_transactions(self, query, payload):
+        ids = self.server.ledger.list_ids(**_parse_search_query(query["query"]))
+        return self._list("search/transactions", ids, query, self._transaction)
+
+    def get_transaction(self, transaction_id, query, payload):
+        return 200, {"data": self._transaction(transaction_id)}
+
+    def store_transaction(self, query, payload):
+        (split,) = payload["transactions"]
+        return 200, {"data": self._transaction(self.server.ledger.store(split))}
+
+    def update_transaction(self, transaction_id, query, payload):
+        (split,) = payload["transactions"]
+        self.server.ledger.update(transaction_id, split)
+        return 200, {"data": self._transaction(transaction_id)}
+
+    def delete_transaction(self, transaction_id, query, payload):
+        self.server.ledger.delete(transaction_id)
+        return 204, None
+
+    ##############################
+    # accounts
+    ##############################
+
+    def list_accounts(self, query, payload):
+        ids = [
+            acc_id
+            for acc_id, (_, acc_type) in self.server.ledger.accounts.items()
+            if query.get("type") in (None, "all", acc_type)
+        ]
+        return self._list("accounts", ids, query, self._account)
+
+    ##############################
+    # rules
+    ##############################
+
+    def list_rules(self, query, payload):
+        return self._list("rules", list(self.server.ledger.rules), query, self._rule)
+
+    def list_rules_of_group(self, group_id, query, payload):
+        if group_id not in self.server.ledger.rule_groups:
+            raise _NotFound(group_id)
+        ids = [
+            rule_id
+            for rule_id, rule in self.server.ledger.rules.items()
+            if rule["rule_group_id"] == group_id
+        ]
+        return self._list(f"rule-groups/{group_id}/rules", ids, query, self._rule)
+
+    def store_rule(self, query, payload):
+        rules = self.server.ledger.rules
+        rule_id = str(max(map(int, rules), default=0) + 1)
+        rules[rule_id] = payload
+        return 200, {"data": self._rule(rule_id)}
+
+    def update_rule(self, rule_id, query, payload):
+        if rule_id not in self.server.ledger.rules:
+            raise _NotFound(rule_id)
+        self.server.ledger.rules[rule_id].update(payload)
+        return 200, {"data": self._rule(rule_id)}
+
+    def delete_rule(self, rule_id, query, payload):
+        if self.server.ledger.rules.pop(rule_id, None) is None:
+            raise _NotFound(rule_id)
+        return 204, None
+
+    def list_rule_groups(self, query, payload):
+        return self._list(
+            "rule-groups",
+            list(self.server.ledger.rule_groups),
+            query,
+            self._rule_group,
+        )
+
+    def store_rule_group(self, query, payload):
+        groups = self.server.ledger.rule_groups
+        group_id = str(max(map(int, groups), default=0) + 1)
+        groups[group_id] = payload
+        return 200, {"data": self._rule_group(group_id)}
+
+    def delete_rule_group(self, group_id, query, payload):
+        if self.server.ledger.rule_groups.pop(group_id, None) is None:
+            raise _NotFound(group_id)
+        # as firefly does, its rules are deleted along with it
+        for rule_id, rule in list(self.server.ledger.rules.items()):
+            if rule["rule_group_id"] == group_id:
+                del self.server.ledger.rules[rule_id]
+        return 204, None
+
+    def trigger_rule_group(self, group_id, query, payload):
+        if group_id not in self.server.ledger.rule_groups:
+            raise _NotFound(group_id)
+        return 204, None
+
+    ##############################
+    # tags
+    ##############################
+
+    def list_tags(self, query, payload):
+        return self._list("tags", list(self.server.ledger.tags), query, self._tag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", default=8090, type=int)
+    parser.add_argument("-n", "--num-transactions", default=1000, type=int)
+    parser.add_argument(
+        "--days",
+        default=365,
+        help="The transactions are spread over this many days, up to today",
+        type=int,
+    )
+    parser.add_argument("--page-size", default=50, type=int)
+    parser.add_argument(
+        "--latency", default=0.0, help="Seconds to delay each request", type=float
+    )
+    parser.add_argument(
+        "--error-rate",
+        default=0.0,
+        help="Probability of each request to fail with 500",
+        type=float,
+    )
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    server = MockFirefly(
+        args.num_transactions,
+        days=args.days,
+        page_size=args.page_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"> Serving a mock Firefly III on {server.url} (with any token)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Offline mode (`--offline SNAPSHOT`): the transactions, accounts, tags and rules are read
+from a snapshot file (see the `snapshot` command) instead of the server, and the
+updates, deletes and stores are recorded into a changeset file instead of being sent.
+This is for iterating on the rules' config, where each run then needs no network.
+
+The request functions (see firefly_request_manager) check `snapshot` to serve from
+it; everything else that needs the server fails with `OfflineError`.
+"""
+import datetime
+import gzip
+import json
+import os
+import threading
+from typing import IO, Any, Dict, List, Optional
+
+SNAPSHOT_VERSION = 1
+
+
+class OfflineError(RuntimeError):
+    pass
+
+
+def _open(path: str, mode: str) -> IO:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+class Snapshot:
+    """The api entries of the transactions (within `start` and `end`), accounts, tags
+    and rules of an instance, as they were listed at `saved_at`."""
+
+    def __init__(self, data: Dict[str, Any], path: str = None):
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise OfflineError(
+                f"Unsupported version {data.get('version')} of snapshot {path}"
+            )
+        self.path = path
+        self.saved_at: str = data["saved_at"]
+        self.start = datetime.date.fromisoformat(data["start"])
+        self.end = datetime.date.fromisoformat(data["end"])
+        self.transactions: List[Dict[str, Any]] = data["transactions"]
+        self.accounts: List[Dict[str, Any]] = data["accounts"]
+        self.rules: List[Dict[str, Any]] = data["rules"]
+        # which the snapshots of older versions did not have
+        self.tags: List[Dict[str, Any]] = data.get("tags", [])
+
+    @classmethod
+    def load(cls, path: str) -> "Snapshot":
+        """Load a snapshot file, or an export directory (see the `export` command)."""
+        if os.path.isdir(path):
+            from firefly_automate.columnar import ColumnarSnapshot
+
+            return ColumnarSnapshot(path)
+        with _open(path, "r") as f:
+            return cls(json.load(f), path)
+
+    @staticmethod
+    def save(
+        path: str,
+        start: datetime.date,
+        end: datetime.date,
+        transactions: List[Dict[str, Any]],
+        accounts: List[Dict[str, Any]],
+        rules: List[Dict[str, Any]],
+        tags: List[Dict[str, Any]] = (),
+    ):
+        """Write the given api entries (e.g. of `data_entries`) as a snapshot, which
+        is gzipped if the path ends with .gz."""
+        with _open(path, "w") as f:
+            json.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "saved_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "start": str(start),
+                    "end": str(end),
+                    "transactions": transactions,
+                    "accounts": accounts,
+                    "rules": rules,
+                    "tags": list(tags),
+                },
+                f,
+                # e.g. dates, if the client did not leave them as strings
+                default=str,
+            )
+
+    def covers(self, start: datetime.date, end: datetime.date) -> bool:
+        return self.start <= start and end <= self.end
+
+    def transaction_entries(
+        self,
+        start: datetime.date,
+        end: datetime.date,
+        account_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """The entries of the transactions within start and end (inclusive), and of
+        the given account if any, in the order that the server listed them."""
+        start, end = str(start), str(end)
+        entries = []
+        for entry in self.transactions:
+            split = entry["attributes"]["transactions"][0]
+            if not start <= split["date"][:10] <= end:
+                continue
+            if account_id is not None and account_id not in (
+                split["source_id"],
+                split["destination_id"],
+            ):
+                continue
+            entries.append(entry)
+        return entries
+
+    def account_entries(self, acc_type: str = None) -> List[Dict[str, Any]]:
+        return [
+            acc
+            for acc in self.accounts
+            if acc_type in (None, "all", acc["attributes"]["type"])
+        ]
+
+
+class Changeset:
+    """The writes that would have been sent to the server, in the order that they
+    were made. This is safe to record into from multiple threads."""
+
+    def __init__(self):
+        self.changes: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.changes)
+
+    def record(self, action: str, **change: Any):
+        with self._lock:
+            self.changes.append({"action": action, **change})
+
+    def write(self, path: str):
+        with self._lock:
+            changes = list(self.changes)
+        with _open(path, "w") as f:
+            json.dump(
+                {
+                    "snapshot": snapshot.path if snapshot is not None else None,
+                    "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "changes": changes,
+                },
+                f,
+                indent=2,
+                default=str,
+            )
+
+
+# the loaded snapshot, if offline
+snapshot: Optional[Snapshot] = None
+changeset = Changeset()
+
+
+def go_offline(path: str) -> Snapshot:
+    global snapshot
+    snapshot = Snapshot.load(path)
+    return snapshot
+
+
+def is_offline() -> bool:
+    return snapshot is not None
@@ -0,0 +1,299 @@
+"""
+Opt-in instrumentation (`--profile`) of where the time of a command goes, e.g. the
+fetching and decoding of pages, each rule's `process`, and the conflict resolution
+of `PendingUpdates`.
+
+Instrumented code records into the module-level `profiler`, which does nothing
+until it is enabled:
+
+    with profiler.phase("fetch transactions"):
+        ...
+
+    @profiler.timed("PendingUpdates.append_updates")
+    def append_updates(...):
+        ...
+
+The timings of code that runs on the thread pool (e.g. the pages) are summed over
+all threads, hence they can add up to more than the wall time.
+
+Similarly, `--mem-profile` records the memory at the boundaries of the phases into
+the module-level `mem_profiler`, e.g. after the DataFrame of a rule is built:
+
+    mem_profiler.checkpoint("RemoveDuplicates DataFrame")
+
+Each checkpoint has the peak (traced) memory since the previous checkpoint, and
+the call sites that allocated the most in between.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class Timing:
+    calls: int = 0
+    seconds: float = 0.0
+    # number of calls that had an effect (e.g. a rule that added an update), if
+    # it applies to this timing
+    hits: Optional[int] = None
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        if self.hits is None or self.calls == 0:
+            return None
+        return self.hits / self.calls
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.timings: Dict[str, Timing] = {}
+        self._lock = threading.Lock()
+        self._started_at: float = None
+        # (time, "O"pen or "C"lose, name) of the main thread, for speedscope
+        self._events: Optional[List[Tuple[float, str, str]]] = None
+
+    def enable(self, record_events: bool = False):
+        """Start recording. The events are only needed to write a speedscope file."""
+        self.enabled = True
+        self.timings.clear()
+        self._events = [] if record_events else None
+        self._started_at = time.perf_counter()
+
+    @property
+    def wall_time(self) -> float:
+        return time.perf_counter() - self._started_at
+
+    def add(self, name: str, seconds: float, hit: Optional[bool] = None):
+        """Record one call of `name` that took `seconds`."""
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = Timing()
+            timing.calls += 1
+            timing.seconds += seconds
+            if hit is not None:
+                timing.hits = (timing.hits or 0) + hit
+
+    def _event(self, at: float, kind: str, name: str):
+        if self._events is not None and threading.current_thread() is (
+            threading.main_thread()
+        ):
+            self._events.append((at - self._started_at, kind, name))
+
+    def start(self, name: str) -> float:
+        """Start timing `name` (to be ended with `stop`), for code that cannot be
+        wrapped in `phase`, e.g. to also record whether it was a hit."""
+        start = time.perf_counter()
+        self._event(start, "O", name)
+        return start
+
+    def stop(self, name: str, start: float, hit: Optional[bool] = None):
+        end = time.perf_counter()
+        self._event(end, "C", name)
+        self.add(name, end - start, hit)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name, start)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        """Decorator that records each call of the function as `name`."""
+
+        def decorator(functor: Callable) -> Callable:
+            @functools.wraps(functor)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return functor(*args, **kwargs)
+                start = self.start(name)
+                try:
+                    return functor(*args, **kwargs)
+                finally:
+                    self.stop(name, start)
+
+            return wrapper
+
+        return decorator
+
+    def report(self) -> str:
+        """The timings as a table, ranked by their total time."""
+        wall_time = self.wall_time
+        lines = [
+            f"{'':<42}{'calls':>9}{'total (s)':>11}{'mean (ms)':>11}"
+            f"{'% wall':>8}{'hit rate':>10}"
+        ]
+        with self._lock:
+            ranked = sorted(self.timings.items(), key=lambda x: -x[1].seconds)
+        for name, timing in ranked:
+            hit_rate = "-" if timing.hit_rate is None else f"{timing.hit_rate:.1%}"
+            lines.append(
+                f"{name[:41]:<42}{timing.calls:>9}{timing.seconds:>11.3f}"
+                f"{timing.seconds / timing.calls * 1000:>11.3f}"
+                f"{timing.seconds / wall_time:>8.1%}{hit_rate:>10}"
+            )
+        lines.append(f"> Wall time: {wall_time:.3f}s")
+        return "\n".join(lines)
+
+    def write_speedscope(self, path: str, name: str = "firefly-automate"):
+        """Write the recorded phases of the main thread as a speedscope
+        (https://www.speedscope.app) evented profile."""
+        frames: Dict[str, int] = {}
+        events = []
+        # the phases that are still open (e.g. if stopped within one) are closed
+        open_names: List[str] = []
+        end = self.wall_time
+        for at, kind, frame_name in self._events or []:
+            frame = frames.setdefault(frame_name, len(frames))
+            events.append({"type": kind, "frame": frame, "at": at})
+            if kind == "O":
+                open_names.append(frame_name)
+            else:
+                open_names.pop()
+        for frame_name in reversed(open_names):
+            events.append({"type": "C", "frame": frames[frame_name], "at": end})
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "$schema": "https://www.speedscope.app/file-format-schema.json",
+                    "shared": {"frames": [{"name": n} for n in frames]},
+                    "profiles": [
+                        {
+                            "type": "evented",
+                            "name": name,
+                            "unit": "seconds",
+                            "startValue": 0,
+                            "endValue": end,
+                            "events": events,
+                        }
+                    ],
+                    "name": name,
+                    "exporter": "firefly-automate",
+                },
+                f,
+            )
+
+
+profiler = Profiler()
+
+
+def peak_rss() -> Optional[int]:
+    """The peak resident set size (in bytes) of this process so far, if known."""
+    try:
+        import resource
+    except ImportError:
+        # e.g. on Windows
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # which is in bytes on macOS, but in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def format_bytes(num_bytes: Optional[float]) -> str:
+    if num_bytes is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f}{unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f}GiB"
+
+
+@dataclass
+class MemoryCheckpoint:
+    name: str
+    # traced memory (in bytes) at the checkpoint, and its peak since the previous one
+    current: int
+    peak: int
+    peak_rss: Optional[int]
+    # ("file:line", bytes, number of blocks) allocated since the previous checkpoint
+    # (net of what was freed), by the call sites that allocated the most
+    top_sites: List[Tuple[str, int, int]] = field(default_factory=list)
+
+
+class MemoryProfiler:
+    # the allocations of tracemalloc itself, and of importing modules, are noise
+    IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap*>")
+
+    def __init__(self, top: int = 5):
+        self.enabled = False
+        self.top = top
+        self.checkpoints: List[MemoryCheckpoint] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def enable(self):
+        """Start tracing the allocations, which slows down the command a lot (up to
+        a few times), hence only the memory of the run is of interest."""
+        self.enabled = True
+        self.checkpoints.clear()
+        tracemalloc.start()
+        self._snapshot = self._take_snapshot()
+
+    def disable(self):
+        self.enabled = False
+        self._snapshot = None
+        tracemalloc.stop()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, f) for f in self.IGNORED_FILES]
+        )
+
+    def checkpoint(self, name: str):
+        """Record the memory of the phase that ends here as `name`."""
+        if not self.enabled:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._take_snapshot()
+        top_sites = []
+        for diff in snapshot.compare_to(self._snapshot, "lineno")[: self.top]:
+            if diff.size_diff <= 0:
+                break
+            frame = diff.traceback[0]
+            top_sites.append(
+                (
+                    f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                    diff.size_diff,
+                    diff.count_diff,
+                )
+            )
+        self.checkpoints.append(
+            MemoryCheckpoint(name, current, peak, peak_rss(), top_sites)
+        )
+        self._snapshot = snapshot
+        if hasattr(tracemalloc, "reset_peak"):
+            # python 3.9+; otherwise the peak is the one since the start
+            tracemalloc.reset_peak()
+
+    def report(self) -> str:
+        """The checkpoints in the order that they were reached, with the top
+        allocating call sites of each phase."""
+        lines = [f"{'':<42}{'current':>12}{'peak':>12}{'peak RSS':>12}"]
+        for checkpoint in self.checkpoints:
+            lines.append(
+                f"{checkpoint.name[:41]:<42}{format_bytes(checkpoint.current):>12}"
+                f"{format_bytes(checkpoint.peak):>12}"
+                f"{format_bytes(checkpoint.peak_rss):>12}"
+            )
+            for site, size, count in checkpoint.top_sites:
+                lines.append(
+                    f"    {site[:37]:<38}{'+' + format_bytes(size):>12}"
+                    f"{count:>+12} blocks"
+                )
+        return "\n".join(lines)
+
+
+mem_profiler = MemoryProfiler()
@@ -0,0 +1,455 @@
+"""
+The cache of the fetched values (see `fetch_with_cache`), which stores each record
+(e.g. a transaction, account or rule) once, keyed by the digest of its content, and
+a cached list as the digests of its records. Hence caching a list again after a few
+of its transactions changed only writes those transactions (and the digests), and
+the lists that have transactions in common (e.g. those of an account, and those of
+the whole date range) share them.
+
+The records are serialized with msgpack if it is installed (or else pickle), and
+compressed with zstd or lz4 if asked for (`--cache-compression`). These packages are
+installed with `pip install firefly-automate[cache]`. Each stored value starts with
+how it was encoded, such that a cache can be read whatever it was written with;
+values that cannot be decoded (e.g. without the compression module) are cache
+misses.
+
+The values are stored in a SQLite file (in WAL mode), which can be shared by
+concurrent processes (e.g. overlapping runs of cron jobs): each write is a transaction
+that holds the file's write lock, while the reads go on. The connection is not
+thread-safe though, all access to it must be serialized by the caller.
+"""
+import contextlib
+import hashlib
+import importlib.util
+import logging
+import pickle
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+
+# the first byte of an encoded value is its serializer, the second its compression
+SERIALIZERS = {"msgpack": b"m", "pickle": b"p"}
+COMPRESSIONS = {"none": b"-", "zstd": b"z", "lz4": b"l"}
+# the module that each compression needs (see the `cache` extra)
+COMPRESSION_MODULES = {"zstd": "zstandard", "lz4": "lz4"}
+
+DIGEST_SIZE = 16
+# the records are selected in chunks, as the number of parameters of a query is
+# limited (to 999 before SQLite 3.32)
+SELECT_CHUNK_SIZE = 500
+
+# the version of the tables, the cache is emptied when it changes
+SCHEMA_VERSION = 2
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+# once the cache is larger than its max size, entries are evicted until it is within
+# this fraction of it, such that the next writes do not need to evict again
+EVICT_TO_FRACTION = 0.8
+# seconds within which the last use of an entry is not updated again, as the reads
+# would otherwise each need the write lock (which is an LRU of this resolution)
+LAST_USED_RESOLUTION = 10 * 60
+# seconds to wait for another process to finish writing to the cache
+LOCK_TIMEOUT = 60
+
+LOGGER = logging.getLogger(__name__)
+
+# the msgpack extension types of the values that it has no type of its own for
+_EXT_TUPLE = 1
+_EXT_TRANSACTION = 2
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+
+
+def _msgpack_default(obj: Any) -> Any:
+    import msgpack
+
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(_EXT_TUPLE, _msgpack_dumps(list(obj)))
+    if isinstance(obj, FireflyTransactionDataClass):
+        return msgpack.ExtType(_EXT_TRANSACTION, _msgpack_dumps(obj.__getstate__()))
+    raise TypeError(f"Cannot serialize {type(obj)} with msgpack")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    import msgpack
+
+    if code == _EXT_TUPLE:
+        return tuple(_msgpack_loads(data))
+    if code == _EXT_TRANSACTION:
+        # as pickle does, without going through its (slow) init
+        transaction = FireflyTransactionDataClass.__new__(FireflyTransactionDataClass)
+        transaction.__setstate__(_msgpack_loads(data))
+        return transaction
+    return msgpack.ExtType(code, data)
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    import msgpack
+
+    # strict types, such that the tuples go through the default (and stay tuples)
+    return msgpack.packb(value, default=_msgpack_default, strict_types=True)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(
+        data, ext_hook=_msgpack_ext_hook, strict_map_key=False, use_list=True
+    )
+
+
+def _serialize(value: Any) -> bytes:
+    try:
+        return SERIALIZERS["msgpack"] + _msgpack_dumps(value)
+    except (ImportError, TypeError, OverflowError):
+        # e.g. without msgpack, or values of other types
+        return SERIALIZERS["pickle"] + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize(data: bytes) -> Any:
+    serializer, data = data[:1], data[1:]
+    if serializer == SERIALIZERS["msgpack"]:
+        return _msgpack_loads(data)
+    if serializer == SERIALIZERS["pickle"]:
+        return pickle.loads(data)
+    raise ValueError(f"Unknown serializer {serializer}")
+
+
+def is_compression_available(compression: str) -> bool:
+    """Whether the module of the compression is installed (without importing it)."""
+    module = COMPRESSION_MODULES.get(compression)
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        import zstandard
+
+        data = zstandard.ZstdCompressor().compress(data)
+    elif compression == "lz4":
+        import lz4.frame
+
+        data = lz4.frame.compress(data)
+    return COMPRESSIONS[compression] + data
+
+
+def _decompress(data: bytes) -> bytes:
+    compression, data = data[:1], data[1:]
+    if compression == COMPRESSIONS["zstd"]:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == COMPRESSIONS["lz4"]:
+        import lz4.frame
+
+        return lz4.frame.decompress(data)
+    if compression == COMPRESSIONS["none"]:
+        return data
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def _is_record(value: Any) -> bool:
+    return isinstance(value, FireflyTransactionDataClass) or (
+        isinstance(value, dict) and "id" in value
+    )
+
+
+class RecordCache:
+    """The cache, keyed by tuples whose first item is their namespace, e.g.
+    `("accounts", None)`. The entries of a namespace that has a ttl expire after it,
+    and the least recently used entries are evicted to keep the file within
+    `max_size` bytes. The reads do not write to the file: when the entries were used
+    is only written along with the next write (or on close)."""
+
+    # how a cached value is stored: as the digests of its records (a list of records,
+    # or a dict of them, e.g. the rules by their title), or else as it is
+    RECORDS = "records"
+    RECORDS_BY_KEY = "records_by_key"
+    VALUE = "value"
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = "none",
+        max_size: int = DEFAULT_MAX_SIZE,
+        ttls: Dict[str, float] = None,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}")
+        if not is_compression_available(compression):
+            raise ImportError(
+                f"The {compression} compression needs the "
+                f"{COMPRESSION_MODULES[compression]} package"
+            )
+        self.path = path
+        self.compression = compression
+        self.max_size = max_size
+        self.ttls = ttls or {}
+        # the entries fetched before this (e.g. by an earlier run) are misses
+        self.min_fetched_at: float = None
+        # when the entries were used, which is yet to be written
+        self._last_used: Dict[str, float] = {}
+        # the access is serialized by the caller, but it can be from any thread. The
+        # transactions are managed explicitly (see `_transaction`), and the timeout is
+        # how long to wait for the write lock of another process.
+        self.db = sqlite3.connect(
+            path,
+            timeout=LOCK_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        # which lets the other processes read while one writes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # it is only a cache, the entries of older versions are dropped
+                for table in ("records", "refs", "entries"):
+                    self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    digest BLOB PRIMARY KEY,
+                    data BLOB NOT NULL
+                )
+                """
+            )
+            # the digests of the records of each entry
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS refs (
+                    key TEXT NOT NULL,
+                    digest BLOB NOT NULL,
+                    PRIMARY KEY (key, digest)
+                ) WITHOUT ROWID
+                """
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest)")
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    kind TEXT NOT NULL,
+                    data BLOB NOT NULL
+                )
+                """
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """A transaction that holds the write lock from its start, such that it
+        cannot be interleaved with the writes of another process (or deadlock with
+        it, as deferred ones can)."""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _encode(self, value: Any) -> bytes:
+        return _compress(_serialize(value), self.compression)
+
+    @staticmethod
+    def _decode(data: bytes) -> Any:
+        return _deserialize(_decompress(data))
+
+    @staticmethod
+    def _split_digests(digests: bytes) -> List[bytes]:
+        return [
+            digests[i : i + DIGEST_SIZE] for i in range(0, len(digests), DIGEST_SIZE)
+        ]
+
+    def _select(self, columns: str, digests: List[bytes]) -> Iterator[Tuple]:
+        for i in range(0, len(digests), SELECT_CHUNK_SIZE):
+            chunk = digests[i : i + SELECT_CHUNK_SIZE]
+            yield from self.db.execute(
+                f"SELECT {columns} FROM records WHERE digest IN "
+                f"({','.join('?' * len(chunk))})",
+                chunk,
+            )
+
+    def _store_records(self, records: List[Any]) -> bytes:
+        """Store the records that are not stored yet, and return their digests."""
+        digests = []
+        new_records: Dict[bytes, bytes] = {}
+        for record in records:
+            serialized = _serialize(record)
+            digest = hashlib.blake2b(serialized, digest_size=DIGEST_SIZE).digest()
+            digests.append(digest)
+            new_records[digest] = serialized
+        stored = {row[0] for row in self._select("digest", list(new_records))}
+        self.db.executemany(
+            "INSERT INTO records (digest, data) VALUES (?, ?)",
+            (
+                (digest, _compress(serialized, self.compression))
+                for digest, serialized in new_records.items()
+                if digest not in stored
+            ),
+        )
+        return b"".join(digests)
+
+    def _load_records(self, digests: bytes) -> Optional[List[Any]]:
+        digests = self._split_digests(digests)
+        unique_digests = list(set(digests))
+        data = dict(self._select("digest, data", unique_digests))
+        if len(data) != len(unique_digests):
+            return None
+        # each occurrence is its own object, as with any other cached value
+        return [self._decode(data[digest]) for digest in digests]
+
+    def _entry_digests(self, key: str) -> Set[bytes]:
+        return {
+            row[0]
+            for row in self.db.execute("SELECT digest FROM refs WHERE key = ?", (key,))
+        }
+
+    def _set_refs(self, key: str, digests: Set[bytes]):
+        """Replace the digests of the records of an entry, and delete the records
+        that no entry has anymore (which is only what changed)."""
+        old_digests = self._entry_digests(key)
+        self.db.executemany(
+            "INSERT INTO refs (key, digest) VALUES (?, ?)",
+            ((key, digest) for digest in digests - old_digests),
+        )
+        removed = old_digests - digests
+        self.db.executemany(
+            "DELETE FROM refs WHERE key = ? AND digest = ?",
+            ((key, digest) for digest in removed),
+        )
+        self.db.executemany(
+            "DELETE FROM records WHERE digest = ? AND NOT EXISTS "
+            "(SELECT 1 FROM refs WHERE refs.digest = records.digest)",
+            ((digest,) for digest in removed),
+        )
+
+    def _is_expired(self, namespace: str, fetched_at: float, now: float) -> bool:
+        ttl = self.ttls.get(namespace)
+        return ttl is not None and now - fetched_at > ttl
+
+    def get(self, key: Tuple, default: Any = None) -> Optional[CacheEntry]:
+        row = self.db.execute(
+            "SELECT namespace, fetched_at, last_used, kind, data FROM entries "
+            "WHERE key = ?",
+            (str(key),),
+        ).fetchone()
+        if row is None:
+            return default
+        namespace, fetched_at, last_used, kind, data = row
+        now = time.time()
+        if self._is_expired(namespace, fetched_at, now) or (
+            self.min_fetched_at is not None and fetched_at < self.min_fetched_at
+        ):
+            return default
+        try:
+            if kind == self.RECORDS:
+                value = self._load_records(data)
+            elif kind == self.RECORDS_BY_KEY:
+                keys, digests = self._decode(data)
+                value = self._load_records(digests)
+                if value is not None:
+                    value = dict(zip(keys, value))
+            else:
+                value = self._decode(data)
+        except Exception as e:
+            # e.g. written with a compression whose module is not installed
+            LOGGER.debug("Cannot decode the cached %s: %r", key, e)
+            return default
+        if value is None and kind != self.VALUE:
+            # some of the records are gone
+            return default
+        if now - last_used > LAST_USED_RESOLUTION:
+            self._last_used[str(key)] = now
+        return CacheEntry(value, fetched_at)
+
+    def _write_last_used(self):
+        # must be called within a transaction
+        self.db.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?",
+            ((last_used, key) for key, last_used in self._last_used.items()),
+        )
+        self._last_used.clear()
+
+    def __setitem__(self, key: Tuple, entry: CacheEntry):
+        value = entry.value
+        with self._transaction():
+            digests = b""
+            if isinstance(value, list) and value and all(map(_is_record, value)):
+                kind = self.RECORDS
+                data = digests = self._store_records(value)
+            elif (
+                isinstance(value, dict)
+                and value
+                and all(map(_is_record, value.values()))
+            ):
+                kind = self.RECORDS_BY_KEY
+                digests = self._store_records(list(value.values()))
+                data = self._encode((list(value.keys()), digests))
+            else:
+                kind, data = self.VALUE, self._encode(value)
+            self._set_refs(str(key), set(self._split_digests(digests)))
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, namespace, fetched_at, last_used, kind, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(key), key[0], entry.fetched_at, time.time(), kind, data),
+            )
+            self._last_used.pop(str(key), None)
+            self._write_last_used()
+            self._evict(keep=str(key))
+
+    def _delete(self, key: str):
+        self._set_refs(key, set())
+        self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def size(self) -> int:
+        """The bytes that the entries and records take in the file."""
+        page_size, page_count, freelist_count = (
+            self.db.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in ("page_size", "page_count", "freelist_count")
+        )
+        return page_size * (page_count - freelist_count)
+
+    def _evict(self, keep: str):
+        """If the cache is larger than `max_size`, delete the expired entries and
+        then the least recently used ones, until it is within `EVICT_TO_FRACTION` of
+        it, except for the `keep` entry (i.e. the one that was just stored). The
+        expired entries are misses anyway, they are only taking space."""
+        if self.max_size is None or self.size() <= self.max_size:
+            return
+        now = time.time()
+        entries = self.db.execute(
+            "SELECT key, namespace, fetched_at, last_used FROM entries"
+        ).fetchall()
+        # the expired ones first, and then by when they were used
+        entries.sort(key=lambda e: (not self._is_expired(e[1], e[2], now), e[3]))
+        for key, *_ in entries:
+            if self.size() <= self.max_size * EVICT_TO_FRACTION:
+                break
+            if key == keep:
+                continue
+            LOGGER.debug("Evicting the cached %s", key)
+            self._delete(key)
+
+    def clear(self):
+        with self._transaction():
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM refs")
+            self.db.execute("DELETE FROM records")
+
+    def close(self):
+        if self._last_used:
+            with self._transaction():
+                self._write_last_used()
+        self.db.close()
@@ -0,0 +1,164 @@
+"""
+Applies the rules on transactions. This is shared by `transform` (a single pass) and
+`watch` (repeated passes within one process).
+"""
+import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set
+
+from firefly_automate.config_loader import config
+from firefly_automate.profiling import profiler
+
+if TYPE_CHECKING:
+    from firefly_automate.data_type.pending_update import PendingUpdates
+    from firefly_automate.data_type.transaction_query import TransactionQuery
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+    from firefly_automate.rule_memo import RuleMemo
+    from firefly_automate.rules.base_rule import Rule
+
+
+def instantiate_rules(
+    pending_updates: Dict[str, "PendingUpdates"], pending_deletes: Set[str]
+) -> List["Rule"]:
+    """Instantiate all rules, which imports every rule module and validates their
+    config."""
+    from firefly_automate import rules
+
+    return [
+        cls(
+            pending_updates=pending_updates,
+            pending_deletes=pending_deletes,  # type: ignore
+        )
+        for cls in rules.base_rule.Rule.__subclasses__()
+    ]
+
+
+class RuleEngine:
+    """The enabled rules, and the updates/deletes that they had collected.
+
+    If a memo is given, rules are skipped on the transactions that are unchanged
+    since they last had nothing to update on them (see rule_memo).
+    """
+
+    def __init__(
+        self,
+        run: Optional[str] = None,
+        disable: Iterable[str] = (),
+        rule_config: str = "",
+        memo: Optional["RuleMemo"] = None,
+    ):
+        self.pending_updates: Dict[str, "PendingUpdates"] = {}
+        self.pending_deletes: Set[str] = set()
+        self.all_rules = instantiate_rules(self.pending_updates, self.pending_deletes)
+        if run:
+            rules = [r for r in self.all_rules if r.base_name == run]
+        else:
+            rules = [r for r in self.all_rules if r.enable_by_default]
+        self.rules = [r for r in rules if r.base_name not in disable]
+        for rule in self.rules:
+            rule.set_rule_config(rule_config)
+        self.rule_config = rule_config
+        self.set_memo(memo)
+
+    def set_memo(self, memo: Optional["RuleMemo"]):
+        """Use the given memo from now on (or none). The engine can thus be built
+        (e.g. for its `server_queries`) before the memo is opened."""
+        from firefly_automate import rule_memo
+
+        self.memo = memo
+        self.rule_hashes: Dict[str, str] = {}
+        if memo is not None:
+            self.rule_hashes = {
+                rule.base_name: rule_memo.rule_config_hash(rule, self.rule_config)
+                for rule in self.rules
+                if rule.memoizable
+            }
+
+    def server_queries(
+        self, updated_after: Optional[datetime.date] = None
+    ) -> Optional[List["TransactionQuery"]]:
+        """The union of the rules' server-side queries, or None if all transactions
+        are needed. With `updated_after`, the rules that only look at each transaction
+        itself (see `Rule.memoizable`) only need the transactions that were created
+        or edited since then, which are few, hence fetched by a single query."""
+        from firefly_automate.data_type.transaction_query import TransactionQuery
+
+        queries = []
+        for rule in self.rules:
+            if updated_after is not None and rule.memoizable:
+                queries.append(TransactionQuery(updated_after=updated_after))
+                continue
+            _queries = rule.server_queries()
+            if _queries is None:
+                return None
+            queries.extend(_queries)
+        return list(dict.fromkeys(queries))
+
+    def clear(self):
+        """Forget the collected updates and deletes (e.g. once they are applied)."""
+        self.pending_updates.clear()
+        self.pending_deletes.clear()
+
+    def process_one(self, entry: "FireflyTransactionDataClass") -> bool:
+        """Apply the rules on one transaction. Return whether any rule needed to be
+        evaluated (i.e. not all of them are skipped by the memo)."""
+        from firefly_automate import rule_memo
+        from firefly_automate.rules.base_rule import StopRuleProcessing
+
+        skipped_rules = set()
+        if self.memo is not None:
+            content_hash = rule_memo.transaction_hash(entry)
+            skipped_rules = self.memo.unchanged_rules(
+                entry.id, content_hash, self.rule_hashes
+            )
+        evaluated = False
+        try:
+            for rule in self.rules:
+                if rule.base_name in skipped_rules:
+                    continue
+                evaluated = True
+                if profiler.enabled:
+                    self._profiled_process(rule, entry)
+                else:
+                    rule.process(entry)
+        except StopRuleProcessing:
+            return evaluated
+        if (
+            self.memo is not None
+            and entry.id not in self.pending_updates
+            and entry.id not in self.pending_deletes
+        ):
+            self.memo.record(entry.id, content_hash, self.rule_hashes)
+        return evaluated
+
+    def _effect(self, entry_id: str):
+        updates = self.pending_updates.get(entry_id)
+        return (
+            entry_id in self.pending_deletes,
+            None if updates is None else updates.rule,
+        )
+
+    def _profiled_process(self, rule: "Rule", entry: "FireflyTransactionDataClass"):
+        """Apply the rule while recording its time, and whether it was a hit (i.e.
+        it added an update or delete, or stopped the processing)."""
+        name = f"rule {rule.base_name}"
+        before = self._effect(entry.id)
+        start = profiler.start(name)
+        hit = True
+        try:
+            rule.process(entry)
+            hit = self._effect(entry.id) != before
+        finally:
+            profiler.stop(name, start, hit)
+
+    def process(self, transactions: List["FireflyTransactionDataClass"]) -> int:
+        """Apply the rules on all the (non-ignored) transactions. Return the number
+        of transactions that the rules were evaluated on."""
+        for rule in self.rules:
+            rule.set_all_transactions(transactions)
+        num_evaluated = 0
+        # TODO: make this parallel if num of transactions is huge
+        for entry in filter(
+            lambda t: t.id not in config["ignore_transaction_ids"], transactions
+        ):
+            num_evaluated += self.process_one(entry)
+        return num_evaluated
@@ -0,0 +1,92 @@
+"""
+Remembers, across runs, which rules had nothing to update on which transactions, such
+that repeated runs (e.g. daily) only need to evaluate the rules on new or edited
+transactions.
+
+A rule is skipped on a transaction only if both the transaction's content and the
+rule's config are the same as when the rule last found nothing to update. Rules
+whose result depends on anything else (e.g. other transactions) set
+`Rule.memoizable = False` and are always evaluated.
+"""
+import dataclasses
+import hashlib
+import json
+import shelve
+from typing import TYPE_CHECKING, Any, Dict, Set
+
+from firefly_automate.config_loader import config
+
+if TYPE_CHECKING:
+    from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
+    from firefly_automate.rules.base_rule import Rule
+
+MEMO_FILE_NAME = "__firefly-iii_automate_rule_memo.pkl"
+
+
+def _hash(obj: Any) -> str:
+    definition = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha1(definition.encode()).hexdigest()[:16]
+
+
+def transaction_hash(entry: "FireflyTransactionDataClass") -> str:
+    content = {
+        f.name: getattr(entry, f.name, None)
+        for f in dataclasses.fields(entry)
+        if f.name != "_extra_attributes"
+    }
+    return _hash(content)
+
+
+def rule_config_hash(rule: "Rule", rule_config: str) -> str:
+    # the global settings are also part of the config, as they decide whether the
+    # rule's result is an actual update
+    return _hash(
+        [
+            rule.base_name,
+            rule.config,
+            rule_config,
+            config.get("vendor_name_mappings", {}),
+            config.get("mapping_priority", {}),
+        ]
+    )
+
+
+class RuleMemo:
+    """The memo (persisted in a shelve file) of each transaction id, as the content
+    hash of the transaction and the config hashes of the rules that had nothing to
+    update on it."""
+
+    def __init__(self, file_name: str = MEMO_FILE_NAME):
+        self.store = shelve.open(file_name)
+        self.num_skipped = 0
+
+    def unchanged_rules(
+        self, entry_id: str, content_hash: str, rule_hashes: Dict[str, str]
+    ) -> Set[str]:
+        """Name of the rules that can be skipped on this transaction."""
+        memo = self.store.get(str(entry_id))
+        if memo is None or memo[0] != content_hash:
+            return set()
+        skipped = {
+            name
+            for name, config_hash in rule_hashes.items()
+            if memo[1].get(name) == config_hash
+        }
+        if len(skipped) == len(rule_hashes):
+            self.num_skipped += 1
+        return skipped
+
+    def record(self, entry_id: str, content_hash: str, rule_hashes: Dict[str, str]):
+        """Remember that the given rules had nothing to update on this transaction."""
+        memo = self.store.get(str(entry_id))
+        if memo is None or memo[0] != content_hash:
+            memo = (content_hash, {})
+        memo[1].update(rule_hashes)
+        self.store[str(entry_id)] = memo
+
+    def sync(self):
+        """Write the memo to disk, for long running processes."""
+        self.store.sync()
+
+    def close(self):
+        self.store.close()
@@ -1,7 +1,7 @@
 import dataclasses
 import pprint
 from abc import abstractmethod
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set
 
 from schema import Schema
 
@@ -10,6 +10,7 @@ from firefly_automate.data_type.pending_update import (
     PendingUpdates,
     TransactionUpdateValueType,
 )
+from firefly_automate.data_type.transaction_query import TransactionQuery
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 from firefly_automate.miscs import FireflyIIIRulesConflictException
 
@@ -18,6 +19,9 @@ class Rule:
     # to be implemented by sub-classed
     schema: Schema
     enable_by_default: bool = True
+    # whether the result only depends on the transaction itself and the rule's config
+    # (see rule_memo)
+    memoizable: bool = True
 
     def __init__(
         self,
@@ -103,6 +107,12 @@ class Rule:
                 f"Original message:\n" f"{pprint.pformat(dataclasses.asdict(entry))}"
             ) from e
 
+    def server_queries(self) -> Optional[List[TransactionQuery]]:
+        """The queries that, together, match (at least) every transaction this rule
+        can act on, such that only those need to be fetched. None denotes that the
+        rule needs all transactions."""
+        return None
+
     @abstractmethod
     def process(self, entry: FireflyTransactionDataClass):
         raise NotImplementedError()
@@ -1,5 +1,8 @@
 from schema import Optional, Or, Schema
 from dataclasses import dataclass
+from typing import List
+
+from firefly_automate.data_type.transaction_query import TransactionQuery
 
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 from firefly_automate.miscs import search_keywords_in_text
@@ -52,10 +55,8 @@ class Keyword:
                 self.value = val
             else:
                 assert type(val) == dict
-                if "value" not in val:
-                    # default as the search term
-                    val["value"] = search_term
-                self.value = val["value"]
+                # default as the search term
+                self.value = val.get("value", search_term)
                 if "priority" in val:
                     self.priority = val["priority"]
 
@@ -67,6 +68,18 @@ class RuleSearchKeyword(Rule):
     def __init__(self, *args, **kwargs):
         super().__init__("classify_transaction", *args, **kwargs)
 
+    def server_queries(self) -> List[TransactionQuery]:
+        # the server matches sub-strings, which includes our whole word matches
+        return [
+            TransactionQuery(
+                transaction_type=rule["transaction_type"],
+                description_contains=Keyword(k).keyword,
+            )
+            for rule in self.config
+            for keywords in rule["mappings"].values()
+            for k in keywords
+        ]
+
     def process(self, entry: FireflyTransactionDataClass):
         for rule in filter(
             lambda x: x["transaction_type"] == entry.type,
@@ -104,7 +117,6 @@ class RuleSearchKeyword(Rule):
                         desc = entry.description.upper()
                         for k, v in _keyword_to_result_mapping.items():
                             if k.upper() in desc:
-
                                 if v.priority == "low":
                                     if getattr(
                                         entry,
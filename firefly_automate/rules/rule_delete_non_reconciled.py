@@ -1,5 +1,8 @@
+from typing import List, Optional
+
 from schema import Schema
 
+from firefly_automate.data_type.transaction_query import TransactionQuery
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 from firefly_automate.rules.base_rule import Rule
 
@@ -13,6 +16,11 @@ class DeleteNonReconciled(Rule):
     def __init__(self, *args, **kwargs):
         super().__init__("delete_non_reconciled", *args, **kwargs)
 
+    def server_queries(self) -> Optional[List[TransactionQuery]]:
+        if not self.rule_config:
+            return None
+        return [TransactionQuery(account_name=self.rule_config)]
+
     def process(self, entry: FireflyTransactionDataClass):
         if not self.rule_config:
             print(
@@ -6,6 +6,7 @@ from firefly_automate.rules.base_rule import Rule
 
 class DisplayFiltered(Rule):
     enable_by_default: bool = False
+    memoizable: bool = False
 
     def __init__(self, *args, **kwargs):
         super().__init__("display_filtered", *args, **kwargs)
@@ -1,11 +1,16 @@
 import dataclasses
+from typing import TYPE_CHECKING, List, Optional
 
 from schema import Schema
 
 from firefly_automate import miscs
+from firefly_automate.data_type.transaction_query import TransactionQuery
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 from firefly_automate.rules.base_rule import Rule
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 remove_duplicates_schema = Schema(
     [
         Schema(
@@ -18,6 +23,9 @@ remove_duplicates_schema = Schema(
 class RemoveDuplicates(Rule):
     schema = remove_duplicates_schema
     enable_by_default: bool = False
+    memoizable: bool = False
+    # only look for duplicates within this account
+    account_name: str = "Westpac Choice"
 
     def __init__(self, *args, **kwargs):
         super().__init__("remove_duplicates", *args, **kwargs)
@@ -39,24 +47,24 @@ class RemoveDuplicates(Rule):
 
         atexit.register(exit_handler)
 
-    def process(self, entry: FireflyTransactionDataClass):
-        if entry.id in self.delete_master_id or entry.id in self.pending_deletes:
-            # do not remove both the master and slave transactions
-            return
-
-        if (
-            entry.source_name != "Westpac Choice"
-            and entry.destination_name != "Westpac Choice"
-        ):
-            return
+    def server_queries(self) -> Optional[List[TransactionQuery]]:
+        return [TransactionQuery(account_name=self.account_name)]
 
+    def potential_duplicates(
+        self, entry: FireflyTransactionDataClass
+    ) -> "pd.DataFrame":
+        """The transactions (including the entry itself) on the same day, with the same
+        amount and account, of which the description starts or ends with the entry's."""
         if self.df_transactions is None:
             import pandas as pd
 
+            from firefly_automate.profiling import mem_profiler
+
             self.df_transactions = pd.DataFrame(
                 map(lambda x: dataclasses.asdict(x), self.transactions)
             )
-        potential_duplicates = self.df_transactions[
+            mem_profiler.checkpoint("RemoveDuplicates DataFrame")
+        return self.df_transactions[
             (
                 self.df_transactions.description.str.upper().str.startswith(
                     entry.description.upper()
@@ -76,6 +84,16 @@ class RemoveDuplicates(Rule):
                 < 0.001
             )
         ]
+
+    def process(self, entry: FireflyTransactionDataClass):
+        if entry.id in self.delete_master_id or entry.id in self.pending_deletes:
+            # do not remove both the master and slave transactions
+            return
+
+        if self.account_name not in (entry.source_name, entry.destination_name):
+            return
+
+        potential_duplicates = self.potential_duplicates(entry)
         assert len(potential_duplicates) >= 1, "Logic error?"
         assert int(entry.id) in set(potential_duplicates.id.astype(int)), "Logic error?"
         if len(potential_duplicates) > 1:
@@ -1,8 +1,9 @@
-from typing import Union, Dict
+from typing import Union, Dict, List
 from abc import ABC, abstractmethod
 
 from schema import Optional, Or, Schema
 
+from firefly_automate.data_type.transaction_query import TransactionQuery
 from firefly_automate.data_type.transaction_type import FireflyTransactionDataClass
 from firefly_automate.miscs import search_keywords_in_text
 from firefly_automate.rules.base_rule import Rule, StopRuleProcessing
@@ -11,14 +12,12 @@ replace_schema = Schema({str: Or(str, [str])})
 
 
 class Conditional(ABC):
-
     @abstractmethod
     def parse(self):
         pass
 
 
 class TransactionTypeCond(Conditional):
-
     def parse(self):
         pass
 
@@ -78,6 +77,39 @@ def unit_conditional_parser(entry: FireflyTransactionDataClass, conditional_rule
     raise NotImplementedError(f"unknown cond {key} with val {val}")
 
 
+def conditional_queries(conditional_rule: Dict) -> Union[List[TransactionQuery], None]:
+    """Server-side queries that match (at least) the transactions that satisfy the
+    conditional, or None if it cannot be narrowed down (i.e. all transactions)."""
+    assert len(conditional_rule) == 1
+    key, val = list(conditional_rule.items())[0]
+    if key == "transaction_type":
+        return [TransactionQuery(transaction_type=val)]
+    elif key in ("contain_keywords", "match_exactly"):
+        if "description" in val:
+            return [TransactionQuery(description_contains=val["description"])]
+    elif key == "and":
+        queries = None
+        for _conditional in val:
+            _queries = conditional_queries(_conditional)
+            if _queries is None:
+                continue
+            if queries is None:
+                queries = _queries
+            else:
+                queries = [q1.merge(q2) for q1 in queries for q2 in _queries]
+                queries = [q for q in queries if q is not None]
+        return queries
+    elif key == "or":
+        queries = []
+        for _conditional in val:
+            _queries = conditional_queries(_conditional)
+            if _queries is None:
+                return None
+            queries.extend(_queries)
+        return queries
+    return None
+
+
 _and_children = []
 _or_children = []
 UnitConditionalSchema = Or(
@@ -124,6 +156,18 @@ class RuleSearchKeyword(Rule):
     def __init__(self, *args, **kwargs):
         super().__init__("search_keyword", *args, **kwargs)
 
+    def server_queries(self) -> Union[List[TransactionQuery], None]:
+        queries = []
+        for rule in self.config:
+            if "replace" not in rule:
+                # only stops the processing of the transactions that others matched
+                continue
+            _queries = conditional_queries(rule["conditional"])
+            if _queries is None:
+                return None
+            queries.extend(_queries)
+        return queries
+
     def process(self, entry: FireflyTransactionDataClass):
         self._process(entry, "ignore")
         # self._process(entry, num_of_token=len(entry.description.split(" - ")))
@@ -136,9 +180,7 @@ class RuleSearchKeyword(Rule):
             #     lambda x: x["num_of_token"] == num_of_token,
             #     self.config,
             # ):
-            if "name" not in rule:
-                rule["name"] = f"unnamed__[{rule['conditional']}]"
-            self.set_name_suffix(rule["name"])
+            self.set_name_suffix(rule.get("name", f"unnamed__[{rule['conditional']}]"))
             if "conditional" in rule and not unit_conditional_parser(
                 entry, rule["conditional"]
             ):
@@ -1,23 +1,39 @@
 #!/bin/env python
 import argparse
+import atexit
+import contextlib
+import importlib
 import logging
 import os
-import shelve
+import sys
+import time
 from datetime import datetime
+from typing import Callable, Iterable, List
 
 import argcomplete
 from dateutil.relativedelta import relativedelta
 
-from firefly_automate.config_loader import config
-from firefly_automate.firefly_request_manager import get_transactions
 from firefly_automate.miscs import setup_logger
+from firefly_automate.record_cache import (
+    COMPRESSION_MODULES,
+    RecordCache,
+    is_compression_available,
+)
 
 from . import miscs
-from .commands import run_import_csv, run_merge_transfer, run_transform_transactions
 
 LOGGER = logging.getLogger()
 
 
+def cache_compression(value: str) -> str:
+    if not is_compression_available(value):
+        raise argparse.ArgumentTypeError(
+            f"{value} needs the {COMPRESSION_MODULES[value]} package, which can be "
+            "installed with `pip install firefly-automate[cache]`"
+        )
+    return value
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "--yes",
@@ -45,14 +61,28 @@ parser.add_argument(
 )
 parser.add_argument(
     "--cache-file-name",
-    default="__firefly-iii_automate_cache.pkl",
+    default="__firefly-iii_automate_cache.sqlite",
     help="File name to be used for cache purpose.",
     type=str,
 )
+parser.add_argument(
+    "--cache-compression",
+    default="none",
+    choices=["none", "zstd", "lz4"],
+    help="Compress the cached records (needs the zstandard or lz4 package)",
+    type=cache_compression,
+)
+parser.add_argument(
+    "--cache-max-size",
+    default=256,
+    help="Size (in MiB) beyond which the least recently used cache entries are evicted",
+    type=int,
+)
 parser.add_argument(
     "--use-cache",
     action="store_true",
-    help="If set, store and use previously stored cache file",
+    help="If set, use the entries that were cached by previous runs (which may run "
+    "concurrently), or else only those of this run",
 )
 parser.add_argument(
     "-m",
@@ -67,82 +97,455 @@ parser.add_argument(
     help="Debug logging",
     action="store_true",
 )
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Record where the time goes (e.g. per phase and per rule), and show it at "
+    "the end",
+)
+parser.add_argument(
+    "--profile-output",
+    default=None,
+    help="Also write a profile (implies --profile): a speedscope file of the "
+    "phases if it ends with .json, or else the cProfile stats",
+    type=str,
+)
+parser.add_argument(
+    "--mem-profile",
+    action="store_true",
+    help="Record the memory at the end of each phase (e.g. after fetching, after "
+    "building DataFrames, after the rules) with the call sites that allocated the "
+    "most, and show it at the end. It slows down the command a lot.",
+)
+parser.add_argument(
+    "--http-metrics-output",
+    default=None,
+    help="Also write the metrics of the HTTP requests (which are shown at the end) "
+    "to this file: in Prometheus' text format if it ends with .prom, or else as json",
+    type=str,
+)
+parser.add_argument(
+    "--offline",
+    default=None,
+    help="Read the transactions, accounts, tags and rules from this snapshot (see the "
+    "`snapshot` and `export` commands) instead of the server, and write the changes "
+    "that would have been sent to --changeset",
+    type=str,
+)
+parser.add_argument(
+    "--changeset",
+    default="changeset.json",
+    help="File to write the changes of an --offline run to",
+    type=str,
+)
+parser.add_argument(
+    "--instances",
+    default=None,
+    type=lambda x: x.split(","),
+    help="Run the command against these (comma separated) instances of the config, "
+    "or `all` of them. They run concurrently, and then the results of all of them "
+    "are reported. Only `transform` is supported.",
+).completer = lambda **kwargs: _instance_names()
 parser.add_argument(
     "--always-override-reconciled",
     default=False,
     help="Debug logging",
     action="store_true",
 )
+# whether someone can be asked (e.g. to override a reconciled transaction), which is
+# not the case in the separated processes of --instances
+parser.set_defaults(interactive=True)
 
 ########################################################
 
 
 def _get_transactions():
-    global ARGS
+    from firefly_automate.firefly_request_manager import (
+        fetch_with_cache,
+        get_transactions,
+    )
+
+    transactions = fetch_with_cache(
+        ("transaction", ARGS.start, ARGS.end),
+        lambda: list(get_transactions(ARGS.start, ARGS.end)),
+    )
+    LOGGER.debug(transactions)
+    return transactions
+
+
+# commands that work on the existing transactions (and hence their accounts/rules)
+PREFETCH_COMMANDS = ("transform", "merge")
 
-    transaction_key = str(("transaction", ARGS.start, ARGS.end))
 
-    if transaction_key not in ARGS.cache:
-        ARGS.cache[transaction_key] = list(get_transactions(ARGS.start, ARGS.end))
+def prefetch(args: argparse.Namespace):
+    """Start fetching the accounts, rules and transactions concurrently on the shared
+    pool, so that they are already (or being) cached when the command needs them."""
+    from firefly_automate.connections_helpers import AsyncRequest
+    from firefly_automate.firefly_request_manager import (
+        get_all_account_entries,
+        get_rule_index,
+        get_transactions_matching,
+    )
 
-    LOGGER.debug(ARGS.cache[transaction_key])
-    return ARGS.cache[transaction_key]
+    command_module = import_command_module(args.command)
+    # e.g. `transform --list-rules` fetches nothing
+    needs_prefetch = getattr(command_module, "needs_prefetch", None)
+    if needs_prefetch is not None and not needs_prefetch(args):
+        return
+
+    def _prefetch(what: str, functor: Callable, *functor_args):
+        def _on_failure(exception: BaseException):
+            # the command fetches it again (and fails there, if it still fails)
+            print(f"[WARNING] Failed to prefetch the {what}: {exception!r}")
+
+        AsyncRequest.pool.apply_async(
+            functor, args=functor_args, error_callback=_on_failure
+        )
+
+    _prefetch("accounts", get_all_account_entries)
+    _prefetch("rules", get_rule_index)
+    # commands may only need the transactions that their queries match (the queries
+    # are built here, as it instantiates the rules)
+    queries = None
+    if hasattr(command_module, "transaction_queries"):
+        queries = command_module.transaction_queries(args)
+    if queries is None:
+        _prefetch("transactions", args.get_transactions)
+    else:
+        _prefetch(
+            "transactions", get_transactions_matching, queries, args.start, args.end
+        )
 
 
 def init(args: argparse.Namespace):
     global ARGS
     ARGS = args
-    ARGS.cache = shelve.open(ARGS.cache_file_name)
-    if ARGS.use_cache:
-        pass
-    else:
-        ARGS.cache.clear()
+    from firefly_automate.firefly_request_manager import CACHE_TTLS
+
+    ARGS.cache = RecordCache(
+        ARGS.cache_file_name,
+        ARGS.cache_compression,
+        max_size=ARGS.cache_max_size * 1024 * 1024,
+        ttls=CACHE_TTLS,
+    )
+    if not ARGS.use_cache:
+        # the cache is not cleared, as other runs may be using it
+        ARGS.cache.min_fetched_at = time.time()
+    snapshot = None
+    if args.offline:
+        from firefly_automate import offline
+
+        snapshot = offline.go_offline(args.offline)
+        print(
+            f"> Offline: using the snapshot of {snapshot.start} to {snapshot.end} "
+            f"(saved at {snapshot.saved_at})"
+        )
     ####################################
-    # if all is None, default to most recent 3 months
+    # if all is None, default to most recent 3 months (or the whole snapshot)
     if all(x is None for x in (args.start, args.end)):
-        args.end = datetime.now().date()
+        if snapshot is not None:
+            args.start, args.end = snapshot.start, snapshot.end
+        else:
+            args.end = datetime.now().date()
     if args.start is None and args.end is not None:
         args.start = args.end - relativedelta(months=args.relative_months)
     elif args.start is not None and args.end is None:
         args.end = args.start + relativedelta(months=args.relative_months)
     LOGGER.debug("From: {} to {}", args.start, args.end)
+    if snapshot is not None and not snapshot.covers(args.start, args.end):
+        print(
+            f"[WARNING] The snapshot has no transactions before {snapshot.start} or "
+            f"after {snapshot.end}"
+        )
     ####################################
     miscs.set_args(args)
 
     setup_logger(args.debug)
 
+    if args.command in PREFETCH_COMMANDS:
+        prefetch(args)
+
+
+# command name to its module. The modules (and hence their heavy dependencies) are
+# only imported when that command is being used.
+COMMANDS_MODULES = {
+    "transform": "run_transform_transactions",
+    "merge": "run_merge_transfer",
+    "import_csv": "run_import_csv",
+    "sync_rules": "run_sync_rules",
+    "snapshot": "run_snapshot",
+    "export": "run_export",
+    "watch": "run_watch",
+    "webhook": "run_webhook",
+}
+
+
+def import_command_module(command_name: str):
+    return importlib.import_module(
+        f".commands.{COMMANDS_MODULES[command_name]}", __package__
+    )
+
+
+def _global_option(arg: str):
+    """The global option that the argument (e.g. `--opt`, `--opt=value`, `-ovalue`
+    or an abbreviated `--op`) refers to, and whether its value is within it."""
+    actions = parser._option_string_actions
+    if arg.startswith("--"):
+        name, has_value = arg.split("=", 1)[0], "=" in arg
+        if name in actions:
+            return actions[name], has_value
+        matches = {a for s, a in actions.items() if s.startswith(name)}
+        if len(matches) == 1:
+            return matches.pop(), has_value
+        return None, has_value
+    return actions.get(arg[:2]), len(arg) > 2
+
+
+def _requested_commands(argv: Iterable[str]) -> List[str]:
+    """The command of the given command line (without the program's name), i.e. its
+    first positional argument after the global options. Only it needs its arguments
+    to be registered."""
+    argv = iter(argv)
+    for arg in argv:
+        if arg == "--":
+            arg = next(argv, None)
+        elif arg.startswith("-") and len(arg) > 1:
+            action, has_value = _global_option(arg)
+            if action is not None and action.nargs != 0 and not has_value:
+                # skip its value, which may well be named like a command
+                next(argv, None)
+            continue
+        return [arg] if arg in COMMANDS_MODULES else []
+    return []
 
-COMMANDS_MODULES = (
-    run_transform_transactions,
-    run_merge_transfer,
-    run_import_csv,
-)
 
 ARGS: argparse.Namespace = None
 parser.set_defaults(get_transactions=_get_transactions)
 
 subparser = parser.add_subparsers(dest="command")
-for _subcommand_module in COMMANDS_MODULES:
-    _sub_parser = subparser.add_parser(_subcommand_module.command_name)
-    _subcommand_module.init_subparser(_sub_parser)
+for _command_name in COMMANDS_MODULES:
+    subparser.add_parser(_command_name)
+
+
+_initialised_subparsers = set()
+
+
+def init_subparsers(argv: Iterable[str]):
+    for _command_name in _requested_commands(argv):
+        if _command_name in _initialised_subparsers:
+            continue
+        _module = import_command_module(_command_name)
+        _module.init_subparser(subparser.choices[_command_name])
+        _initialised_subparsers.add(_command_name)
 
 
 ########################################################
-argcomplete.autocomplete(parser)
+if "_ARGCOMPLETE" in os.environ:
+    init_subparsers(os.environ.get("COMP_LINE", "").split()[1:])
+    argcomplete.autocomplete(parser)
 ########################################################
 
 
+# commands that can run against multiple instances, which return a report
+MULTI_INSTANCE_COMMANDS = ("transform",)
+
+
+def _instance_names() -> List[str]:
+    from firefly_automate.config_loader import config
+
+    return config.instance_names()
+
+
+def _run_instance(args: argparse.Namespace, instance: str):
+    """Run the command against one instance, in a process of its own (hence its own
+    client pool). Return its report, error (if any) and output."""
+    import io
+
+    from firefly_automate.config_loader import config
+    from firefly_automate.connections_helpers import AsyncRequest
+
+    config.select_instance(instance)
+    args.instances = None
+    args.interactive = False
+    args.cache_file_name = f"{args.cache_file_name}.{instance}"
+    if hasattr(args, "memo_file_name"):
+        args.memo_file_name = f"{args.memo_file_name}.{instance}"
+    if args.http_metrics_output is not None:
+        root, ext = os.path.splitext(args.http_metrics_output)
+        args.http_metrics_output = f"{root}.{instance}{ext}"
+    output = io.StringIO()
+    report, error = None, None
+    with contextlib.redirect_stdout(output):
+        try:
+            init(args)
+            report = import_command_module(args.command).run(args)
+        except Exception as e:
+            error = repr(e)
+        finally:
+            # the process is ended without running the exit handlers
+            AsyncRequest.close()
+            close_cache(args)
+            report_http_metrics(args)
+    return report, error, output.getvalue()
+
+
+def run_instances(args: argparse.Namespace):
+    import multiprocessing
+
+    if args.command not in MULTI_INSTANCE_COMMANDS:
+        parser.error(f"--instances does not support the '{args.command}' command")
+    if args.offline:
+        parser.error("--instances cannot be used with --offline")
+    instances = args.instances
+    if "all" in instances:
+        instances = _instance_names()
+    unknown = set(instances) - set(_instance_names())
+    if len(unknown) > 0:
+        parser.error(f"unknown instance(s): {', '.join(sorted(unknown))}")
+    if not args.yes:
+        # nobody can confirm in the separated processes
+        print("> Only showing the updates of each instance (use --yes to apply them).")
+        args.dry_run = True
+
+    # one (fresh) process per instance, such that nothing is shared among them
+    with multiprocessing.Pool(len(instances), maxtasksperchild=1) as pool:
+        results = pool.starmap(_run_instance, [(args, name) for name in instances])
+
+    for name, (_, _, output) in zip(instances, results):
+        print(f"########## {name} ##########")
+        print(output, end="")
+    print("========================")
+    print(
+        f"{'instance':<20}{'transactions':>14}{'evaluated':>11}{'updates':>9}"
+        f"{'deletes':>9}  status"
+    )
+    for name, (report, error, _) in zip(instances, results):
+        if error is not None or report is None:
+            status = "-" if error is None else f"[ERROR] {error}"
+            print(f"{name:<20}{'-':>14}{'-':>11}{'-':>9}{'-':>9}  {status}")
+            continue
+        status = "applied" if report.applied else "-"
+        if not report.applied and report.num_updates + report.num_deletes > 0:
+            status = "not applied"
+        if report.num_skipped_reconciled > 0:
+            status += f" ({report.num_skipped_reconciled} reconciled skipped)"
+        print(
+            f"{name:<20}{report.num_transactions:>14}{report.num_evaluated:>11}"
+            f"{report.num_updates:>9}{report.num_deletes:>9}  {status}"
+        )
+    if any(error is not None for _, error, _ in results):
+        exit(1)
+
+
+def close_cache(args: argparse.Namespace):
+    """Close the cache (if it was opened), which saves when its entries were last
+    used, as needed by its LRU eviction."""
+    if getattr(args, "cache", None) is not None:
+        args.cache.close()
+        args.cache = None
+
+
+def report_http_metrics(args: argparse.Namespace):
+    """Show (and write) the metrics of the requests that the command had made."""
+    if "firefly_automate.connections_helpers" not in sys.modules:
+        # nothing could have been requested
+        return
+    from firefly_automate.connections_helpers import http_metrics
+
+    if http_metrics.num_requests == 0:
+        return
+    print("========================")
+    print(http_metrics.summary())
+    if args.http_metrics_output is not None:
+        http_metrics.write(args.http_metrics_output)
+        print(f"> Wrote the HTTP metrics to {args.http_metrics_output}")
+
+
+def write_changeset(args: argparse.Namespace):
+    """Write the changes of an offline run (even if there are none, such that an
+    outdated changeset is not mistaken for this run's)."""
+    from firefly_automate import offline
+
+    if not offline.is_offline():
+        return
+    offline.changeset.write(args.changeset)
+    print(f"> Wrote {len(offline.changeset)} change(s) to {args.changeset}")
+
+
+@contextlib.contextmanager
+def profiling(args: argparse.Namespace):
+    """Record the timings of the command if asked to, and show (and write) them
+    when it ends."""
+    if not (args.profile or args.profile_output):
+        yield
+        return
+
+    from firefly_automate.profiling import profiler
+
+    output = args.profile_output
+    speedscope = output is not None and output.endswith(".json")
+    profiler.enable(record_events=speedscope)
+    cprofile = None
+    if output is not None and not speedscope:
+        import cProfile
+
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        yield
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(output)
+        elif speedscope:
+            profiler.write_speedscope(output, name=f"firefly-automate {args.command}")
+        print("========================")
+        print(profiler.report())
+        if output is not None:
+            print(f"> Wrote the profile to {output}")
+
+
+@contextlib.contextmanager
+def mem_profiling(args: argparse.Namespace):
+    """Trace the memory of the command if asked to, and show it when it ends."""
+    if not args.mem_profile:
+        yield
+        return
+
+    from firefly_automate.profiling import mem_profiler
+
+    mem_profiler.enable()
+    try:
+        yield
+    finally:
+        mem_profiler.checkpoint(f"end of command {args.command}")
+        mem_profiler.disable()
+        print("========================")
+        print(mem_profiler.report())
+
+
 def main():
+    init_subparsers(sys.argv[1:])
     args = parser.parse_args()
-    init(args)
-
-    for _module in COMMANDS_MODULES:
-        if args.command == _module.command_name:
-            _module.run(args)
-            break
-    else:
+    if args.instances:
+        run_instances(args)
+        return
+    if args.command not in COMMANDS_MODULES:
         parser.print_usage()
         exit(1)
+    # registered first, such that they run after the background jobs are finished
+    atexit.register(close_cache, args)
+    atexit.register(report_http_metrics, args)
+    atexit.register(write_changeset, args)
+
+    from firefly_automate.profiling import mem_profiler, profiler
+
+    with profiling(args), mem_profiling(args):
+        with profiler.phase("init"):
+            init(args)
+        mem_profiler.checkpoint("init")
+        with profiler.phase(f"command {args.command}"):
+            import_command_module(args.command).run(args)
 
 
 if __name__ == "__main__":
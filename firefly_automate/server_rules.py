@@ -0,0 +1,267 @@
+"""
+Compiles the `classify_transaction` and `search_keyword` rule configs into Firefly III
+rules, such that they can be run by the server itself (see the `sync_rules` command).
+
+Only the configs that can be expressed with Firefly's triggers/actions are compiled;
+everything else is reported as skipped and keeps being handled client-side by
+`transform`. Note that Firefly's keyword triggers match on sub-strings, whereas the
+client-side rules match on whole words, and that `mapping_priority`/`rule_priority`
+conflict resolution has no server-side equivalent.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from firefly_automate.config_loader import config
+
+RULE_GROUP_PREFIX = "AUTOGEN_"
+FINGERPRINT_PREFIX = "firefly-automate:"
+
+# the attributes that can be updated, and the rule action that does so
+ATTRIBUTE_TO_ACTION = {
+    "category_name": "set_category",
+    "budget_name": "set_budget",
+    "tags": "add_tag",
+    "source_name": "set_source_account",
+    "destination_name": "set_destination_account",
+    "description": "set_description",
+    "notes": "set_notes",
+}
+# the attributes that can be matched, and the triggers that match them
+ATTRIBUTE_TO_CONTAINS_TRIGGER = {
+    "description": "description_contains",
+    "source_name": "from_account_contains",
+    "destination_name": "to_account_contains",
+    "notes": "notes_contains",
+}
+ATTRIBUTE_TO_IS_TRIGGER = {
+    "description": "description_is",
+    "source_name": "from_account_is",
+    "destination_name": "to_account_is",
+    "category_name": "category_is",
+    "budget_name": "budget_is",
+    "tags": "tag_is",
+}
+
+
+class NotCompilable(ValueError):
+    """The config cannot be expressed as a Firefly III rule."""
+
+
+@dataclass
+class ServerRule:
+    group: str
+    title: str
+    triggers: List[Tuple[str, str]]
+    actions: List[Tuple[str, str]]
+    # strict: all triggers must match; otherwise any of them
+    strict: bool = True
+    stop_processing: bool = False
+    order: int = 0
+
+    @property
+    def fingerprint(self) -> str:
+        definition = json.dumps(
+            [self.triggers, self.actions, self.strict, self.stop_processing, self.order]
+        )
+        return hashlib.sha1(definition.encode()).hexdigest()[:16]
+
+    @property
+    def description(self) -> str:
+        """The fingerprint is stored within the description of the remote rule, to
+        tell whether the remote rule is still up-to-date."""
+        return (
+            f"Auto generated from the '{self.group}' config. "
+            f"{FINGERPRINT_PREFIX}{self.fingerprint}"
+        )
+
+
+@dataclass
+class CompiledRules:
+    rules: Dict[str, List[ServerRule]] = field(default_factory=dict)
+    # config entry that were skipped, and the reason
+    skipped: List[Tuple[str, str]] = field(default_factory=list)
+
+    def add(self, rule: ServerRule):
+        rules = self.rules.setdefault(rule.group, [])
+        titles = {r.title for r in rules}
+        title, i = rule.title, 1
+        while rule.title in titles:
+            i += 1
+            rule.title = f"{title} #{i}"
+        rule.order = len(rules)
+        rules.append(rule)
+
+
+def _update_action(attribute: str, value: Any) -> List[Tuple[str, str]]:
+    if attribute not in ATTRIBUTE_TO_ACTION:
+        raise NotCompilable(f"updating '{attribute}' is not supported")
+    values = value if isinstance(value, list) else [value]
+    if attribute in ("source_name", "destination_name"):
+        # same as the client-side nice name mapping
+        vendor_name_mappings = config.get("vendor_name_mappings", {})
+        values = [vendor_name_mappings.get(v, v) for v in values]
+    if len(values) != 1 and attribute != "tags":
+        raise NotCompilable(f"multiple values for '{attribute}'")
+    return [(ATTRIBUTE_TO_ACTION[attribute], str(v)) for v in values]
+
+
+def compile_classify_transaction(
+    rule_configs: List[Dict[str, Any]], compiled: CompiledRules
+):
+    """Each keyword becomes one (strict) rule of transaction type & keyword, as Firefly
+    rules cannot mix `and` and `or` triggers."""
+    group = f"{RULE_GROUP_PREFIX}classify_transaction"
+    # import here to avoid importing all the rules
+    from firefly_automate.rules.rule_auto_classification_by_keywords import Keyword
+
+    for rule in rule_configs:
+        for value, keywords in rule["mappings"].items():
+            for keyword in map(Keyword, keywords):
+                name = (
+                    f"{rule['transaction_type']}: {keyword.keyword} => "
+                    f"{rule['attribute_to_update']}={value}"
+                )
+                try:
+                    actions = _update_action(rule["attribute_to_update"], value)
+                    if rule["set_extracted_keyword_to_attribute"]:
+                        if keyword.priority == "low":
+                            raise NotCompilable("low priority keyword")
+                        actions += _update_action(
+                            rule["set_extracted_keyword_to_attribute"], keyword.value
+                        )
+                except NotCompilable as e:
+                    compiled.skipped.append((f"classify_transaction: {name}", str(e)))
+                    continue
+                compiled.add(
+                    ServerRule(
+                        group,
+                        name,
+                        triggers=[
+                            ("transaction_type", rule["transaction_type"]),
+                            ("description_contains", keyword.keyword),
+                        ],
+                        actions=actions,
+                    )
+                )
+
+
+def _conditional_triggers(conditional: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Triggers that all have to match (i.e. strict)."""
+    assert len(conditional) == 1
+    key, val = list(conditional.items())[0]
+    if key == "transaction_type":
+        return [("transaction_type", val)]
+    elif key in ("contain_keywords", "match_exactly"):
+        mapping = (
+            ATTRIBUTE_TO_CONTAINS_TRIGGER
+            if key == "contain_keywords"
+            else ATTRIBUTE_TO_IS_TRIGGER
+        )
+        triggers = []
+        for attribute, value in val.items():
+            if attribute not in mapping:
+                raise NotCompilable(f"'{key}' on '{attribute}' is not supported")
+            triggers.append((mapping[attribute], value))
+        return triggers
+    elif key == "amount_range":
+        # firefly's amount comparisons are exclusive, ours are inclusive, and an
+        # `amount_exactly` on the bounds cannot be or-ed into strict triggers.
+        raise NotCompilable("the bounds of 'amount_range' would not match")
+    elif key == "and":
+        return [t for _conditional in val for t in _conditional_triggers(_conditional)]
+    raise NotCompilable(f"'{key}' cannot be nested")
+
+
+def _alternative_triggers(conditional: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Triggers any of which has to match (i.e. non-strict)."""
+    assert len(conditional) == 1
+    key, val = list(conditional.items())[0]
+    if key == "amount_range" and len(val) == 1:
+        # firefly's amount comparisons are exclusive, hence the bound itself is
+        # matched by its own trigger
+        ((bound, amount),) = val.items()
+        comparison = "amount_more" if bound == "min" else "amount_less"
+        return [(comparison, str(amount)), ("amount_exactly", str(amount))]
+    triggers = _conditional_triggers(conditional)
+    if len(triggers) != 1:
+        raise NotCompilable("'or' of multiple conditions")
+    return triggers
+
+
+def _transaction_type_of(triggers: List[Tuple[str, str]]) -> Optional[str]:
+    types = {v for t, v in triggers if t == "transaction_type"}
+    return types.pop() if len(types) == 1 else None
+
+
+def compile_search_keyword(rule_configs: List[Dict[str, Any]], compiled: CompiledRules):
+    group = f"{RULE_GROUP_PREFIX}search_keyword"
+    for i, rule in enumerate(rule_configs):
+        name = rule.get("name", f"unnamed #{i + 1}")
+        try:
+            if "replace" not in rule:
+                raise NotCompilable("nothing to replace")
+            conditional = rule["conditional"]
+            strict = True
+            if list(conditional.keys()) == ["or"]:
+                # only an `or` of single triggers can be expressed (as non-strict)
+                strict = False
+                triggers = [
+                    t for c in conditional["or"] for t in _alternative_triggers(c)
+                ]
+            else:
+                triggers = _conditional_triggers(conditional)
+
+            replace = dict(rule["replace"])
+            for special_key in (
+                "__CURRENT_source_destination_name",
+                "__OPPOSITE_source_destination_name",
+            ):
+                if special_key not in replace:
+                    continue
+                transaction_type = _transaction_type_of(triggers) if strict else None
+                if transaction_type not in ("withdrawal", "deposit"):
+                    raise NotCompilable(f"'{special_key}' without a transaction type")
+                is_source = (transaction_type == "withdrawal") == (
+                    special_key == "__CURRENT_source_destination_name"
+                )
+                replace[
+                    "source_name" if is_source else "destination_name"
+                ] = replace.pop(special_key)
+            actions = [a for k, v in replace.items() for a in _update_action(k, v)]
+        except NotCompilable as e:
+            compiled.skipped.append((f"search_keyword: {name}", str(e)))
+            continue
+        compiled.add(
+            ServerRule(
+                group,
+                name,
+                triggers=triggers,
+                actions=actions,
+                strict=strict,
+                stop_processing=rule["stop"],
+            )
+        )
+
+
+def compile_rules() -> CompiledRules:
+    """Compile the rule configs, grouped by the name of their Firefly rule group."""
+    # validate the configs the same way as the client-side rules
+    from firefly_automate.rules.rule_auto_classification_by_keywords import (
+        auto_classify_schema,
+    )
+    from firefly_automate.rules.rule_search_keyword import search_keyword_schema
+
+    compiled = CompiledRules()
+    rules_config = config.get("rules", {})
+    if "classify_transaction" in rules_config:
+        compile_classify_transaction(
+            auto_classify_schema.validate(rules_config["classify_transaction"]),
+            compiled,
+        )
+    if "search_keyword" in rules_config:
+        compile_search_keyword(
+            search_keyword_schema.validate(rules_config["search_keyword"]), compiled
+        )
+    return compiled
@@ -37,6 +37,10 @@ setup(
         "argcomplete>=1.12.3",
         "tabulate",
     ],
+    extras_require={
+        "export": ["pyarrow>=8.0.0"],
+        "cache": ["msgpack>=1.0.0", "zstandard", "lz4"],
+    },
     entry_points={
         "console_scripts": [
             "firefly-automate=firefly_automate.run:main",
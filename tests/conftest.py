@@ -0,0 +1,43 @@
+import pytest
+import yaml
+
+from firefly_automate.config_loader import config
+
+
+@pytest.fixture
+def user_config(tmp_path, monkeypatch):
+    """Use a config file of the given content instead of the user's."""
+
+    def _use(content: dict):
+        path = tmp_path / "config.yaml"
+        path.write_text(
+            yaml.safe_dump(
+                {
+                    "firefly_iii_host": "http://127.0.0.1:1",
+                    "firefly_iii_token": "token",
+                    **content,
+                }
+            )
+        )
+        monkeypatch.setattr(config, "path", str(path))
+        config.reload()
+        return config
+
+    yield _use
+    config.reload()
+
+
+@pytest.fixture(scope="module")
+def mock_firefly():
+    from firefly_automate.mock_firefly import MockFirefly
+
+    with MockFirefly(num_transactions=2000) as server:
+        yield server
+
+
+@pytest.fixture
+def transactions():
+    """The transactions of a synthetic ledger, newest first."""
+    from firefly_automate.mock_firefly import SyntheticLedger
+
+    return list(SyntheticLedger(500).transactions())
@@ -0,0 +1,73 @@
+import pandas as pd
+
+from firefly_automate.commands.run_import_csv import drop_overlapping_rows
+
+COFFEE = ("2023-01-02", "-4.50", "CAFE")
+RENT = ("2023-01-03", "-500.00", "RENT")
+SALARY = ("2023-01-05", "2000.00", "SALARY")
+
+
+def statements(*files, account="Checking", external_ids=None):
+    """The concatenated rows of the given files, each a list of rows."""
+    df = pd.DataFrame(
+        [
+            {
+                "_file": f"{i}.csv",
+                "_account": account,
+                "date": date,
+                "amount": amount,
+                "description": description,
+            }
+            for i, rows in enumerate(files)
+            for date, amount, description in rows
+        ]
+    )
+    if external_ids is not None:
+        df["external_id"] = external_ids
+    return df
+
+
+def test_rows_of_earlier_file_are_dropped():
+    df = statements([COFFEE, RENT], [RENT, SALARY])
+
+    assert drop_overlapping_rows(df).tolist() == [False, False, True, False]
+
+
+def test_repeats_within_file_are_kept():
+    df = statements([COFFEE, COFFEE])
+
+    assert not drop_overlapping_rows(df).any()
+
+
+def test_only_repeats_seen_in_earlier_file_are_dropped():
+    df = statements([COFFEE], [COFFEE, COFFEE, COFFEE], [COFFEE, COFFEE])
+
+    assert drop_overlapping_rows(df).tolist() == [
+        False,
+        True,
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_rows_of_other_accounts_are_kept():
+    df = pd.concat(
+        [statements([COFFEE]), statements([COFFEE], account="Credit card")],
+        ignore_index=True,
+    )
+    df.loc[1, "_file"] = "1.csv"
+
+    assert not drop_overlapping_rows(df).any()
+
+
+def test_duplicate_external_ids_are_dropped():
+    # the same transaction, with a different description in the later statement
+    df = statements(
+        [COFFEE, RENT],
+        [("2023-01-02", "-4.50", "CAFE SYDNEY"), RENT],
+        external_ids=["a", None, "a", None],
+    )
+
+    assert drop_overlapping_rows(df).tolist() == [False, False, True, True]
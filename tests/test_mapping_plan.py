@@ -0,0 +1,67 @@
+import itertools
+import os
+
+import pytest
+import yaml
+
+from firefly_automate.mapping_plan import load_mappings_file
+
+
+# distinct modification times, such that each rewrite is seen as a modification
+MTIMES = itertools.count(1_600_000_000)
+
+
+def write_yaml(path, content: dict):
+    path.write_text(yaml.safe_dump(content))
+    mtime = next(MTIMES)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def base(tmp_path):
+    path = tmp_path / "base.yml"
+    write_yaml(
+        path,
+        {
+            "date_format": "%d/%m/%Y",
+            "column_mappings": {"description": "description"},
+        },
+    )
+    return path
+
+
+def test_settings_override_their_base(tmp_path, base):
+    mappings = tmp_path / "mappings.yml"
+    write_yaml(mappings, {"__base_setting_yaml": str(base), "date_format": "%Y-%m-%d"})
+
+    settings, plan = load_mappings_file(str(mappings))
+
+    assert settings == {"date_format": "%Y-%m-%d"}
+    assert [op.target for op in plan.operations] == ["description"]
+
+
+def test_modified_base_is_reloaded(tmp_path, base):
+    mappings = tmp_path / "mappings.yml"
+    write_yaml(mappings, {"__base_setting_yaml": str(base)})
+    assert load_mappings_file(str(mappings))[0] == {"date_format": "%d/%m/%Y"}
+
+    write_yaml(
+        base,
+        {
+            "date_format": "%m/%d/%Y",
+            "column_mappings": {"amount": "__auto-abs:amount"},
+        },
+    )
+
+    settings, plan = load_mappings_file(str(mappings))
+    assert settings == {"date_format": "%m/%d/%Y"}
+    assert [op.directive for op in plan.operations] == ["auto-abs"]
+
+
+def test_cyclic_base_is_an_error(tmp_path):
+    a, b = tmp_path / "a.yml", tmp_path / "b.yml"
+    write_yaml(a, {"__base_setting_yaml": str(b)})
+    write_yaml(b, {"__base_setting_yaml": str(a)})
+
+    with pytest.raises(ValueError, match="form a cycle"):
+        load_mappings_file(str(a))
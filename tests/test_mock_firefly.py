@@ -0,0 +1,92 @@
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pytest
+
+from firefly_automate.mock_firefly import MockFirefly
+
+
+@pytest.fixture
+def server():
+    with MockFirefly(num_transactions=300, page_size=50) as server:
+        yield server
+
+
+def request(server: MockFirefly, path: str, method="GET", payload=None, **query):
+    """The status and json response of the given api request."""
+    url = f"{server.url}/api/v1/{path}?{urllib.parse.urlencode(query)}"
+    body = None if payload is None else json.dumps(payload).encode()
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(url, data=body, method=method)
+        ) as response:
+            content = response.read()
+            return response.status, json.loads(content) if content else None
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_transactions_are_paginated(server):
+    ids, page = [], 1
+    while True:
+        status, response = request(server, "transactions", page=page)
+        assert status == 200
+        ids += [t["id"] for t in response["data"]]
+        if page == response["meta"]["pagination"]["total_pages"]:
+            break
+        page += 1
+
+    assert page == 6
+    assert sorted(ids, key=int) == [str(i) for i in range(1, 301)]
+    assert server.num_requests["list_transactions"] == 6
+
+
+def test_search_filters_transactions(server):
+    ledger = server.ledger
+    query = (
+        f"date_after:{ledger.start_date} date_before:{ledger.end_date}"
+        ' type:withdrawal description_contains:"coles"'
+    )
+
+    status, response = request(server, "search/transactions", query=query)
+
+    assert status == 200
+    splits = [t["attributes"]["transactions"][0] for t in response["data"]]
+    assert 0 < len(splits) < 50
+    assert all(s["type"] == "withdrawal" for s in splits)
+    assert all("coles" in s["description"].lower() for s in splits)
+    assert [t["id"] for t in response["data"]] == ledger.list_ids(
+        ledger.start_date,
+        ledger.end_date,
+        kind="withdrawal",
+        description_contains="coles",
+    )
+
+
+def test_update_and_reset(server):
+    payload = {"transactions": [{"category_name": "Groceries"}]}
+
+    status, response = request(server, "transactions/1", "PUT", payload)
+
+    assert status == 200
+    split = response["data"]["attributes"]["transactions"][0]
+    assert split["category_name"] == "Groceries"
+    assert response["data"]["attributes"]["updated_at"] != "2023-01-01T00:00:00+00:00"
+
+    server.reset()
+
+    _, response = request(server, "transactions/1")
+    assert response["data"]["attributes"]["transactions"][0]["category_name"] is None
+    assert server.num_requests["get_transaction"] == 1
+
+
+def test_errors(server):
+    assert request(server, "transactions/0")[0] == 404
+    assert request(server, "unknown")[0] == 404
+
+    server.error_rate = 1
+    status, response = request(server, "transactions")
+    assert status == 500
+    assert response["message"] == "Injected error"
@@ -0,0 +1,142 @@
+import sys
+import time
+
+import pytest
+
+from firefly_automate import record_cache
+from firefly_automate.record_cache import (
+    CacheEntry,
+    RecordCache,
+    is_compression_available,
+)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite")
+
+
+@pytest.fixture
+def cache(cache_path):
+    cache = RecordCache(cache_path, ttls={"accounts": 60})
+    yield cache
+    cache.close()
+
+
+@pytest.mark.parametrize("compression", ["none", "zstd", "lz4"])
+def test_round_trip(cache_path, transactions, compression):
+    if not is_compression_available(compression):
+        pytest.skip(f"{compression} is not installed")
+    now = time.time()
+    rules = {"a rule": {"id": "1", "attributes": {"title": "a rule"}}}
+    cache = RecordCache(cache_path, compression)
+    cache[("transaction", "2023-01-01", "2023-12-31")] = CacheEntry(transactions, now)
+    cache[("account_transaction", "1")] = CacheEntry(transactions[:10], now)
+    cache[("rule_index",)] = CacheEntry(rules, now)
+    cache[("other",)] = CacheEntry(("a", 1, None), now)
+    cache.close()
+
+    # as another run would see them
+    cache = RecordCache(cache_path)
+    entry = cache.get(("transaction", "2023-01-01", "2023-12-31"))
+    assert entry.value == transactions
+    assert entry.fetched_at == now
+    assert cache.get(("account_transaction", "1")).value == transactions[:10]
+    assert cache.get(("rule_index",)).value == rules
+    assert cache.get(("other",)).value == ("a", 1, None)
+    assert cache.get(("missing",)) is None
+    cache.close()
+
+
+def test_records_are_shared_and_collected(cache, transactions):
+    def num_records():
+        return cache.db.execute("SELECT count(*) FROM records").fetchone()[0]
+
+    cache[("transaction",)] = CacheEntry(transactions, time.time())
+    cache[("account_transaction",)] = CacheEntry(transactions[:10], time.time())
+    assert num_records() == len(transactions)
+
+    cache[("transaction",)] = CacheEntry(transactions[10:], time.time())
+    assert num_records() == len(transactions)
+    cache[("account_transaction",)] = CacheEntry([], time.time())
+    assert num_records() == len(transactions) - 10
+
+
+def test_ttl_expiry(cache):
+    cache[("accounts", None)] = CacheEntry([{"id": "1"}], time.time() - 61)
+    cache[("accounts", "asset")] = CacheEntry([{"id": "1"}], time.time())
+    # no ttl
+    cache[("transaction",)] = CacheEntry([{"id": "1"}], time.time() - 10**6)
+
+    assert cache.get(("accounts", None)) is None
+    assert cache.get(("accounts", "asset")) is not None
+    assert cache.get(("transaction",)) is not None
+
+
+def test_entries_of_earlier_runs_are_ignored(cache):
+    cache[("transaction",)] = CacheEntry([{"id": "1"}], time.time())
+    cache.min_fetched_at = time.time()
+
+    assert cache.get(("transaction",)) is None
+
+
+def test_hits_do_not_write(cache):
+    cache[("transaction",)] = CacheEntry([{"id": "1"}], time.time())
+    num_changes = cache.db.total_changes
+
+    for _ in range(10):
+        assert cache.get(("transaction",)) is not None
+
+    assert cache.db.total_changes == num_changes
+
+
+def test_lru_eviction(cache, transactions, monkeypatch):
+    # such that each use is recorded
+    monkeypatch.setattr(record_cache, "LAST_USED_RESOLUTION", 0)
+    cache[("small",)] = CacheEntry(transactions[:50], time.time())
+    cache[("large",)] = CacheEntry(transactions[50:450], time.time())
+    cache.max_size = cache.size()
+    assert cache.get(("small",)) is not None
+
+    cache[("new",)] = CacheEntry(transactions[450:], time.time())
+
+    # the least recently used one is evicted, which is enough
+    assert cache.get(("large",)) is None
+    assert cache.get(("small",)) is not None
+    assert cache.get(("new",)) is not None
+    assert cache.size() <= cache.max_size * record_cache.EVICT_TO_FRACTION
+
+
+def test_expired_entries_are_evicted_first(cache, transactions):
+    cache[("accounts", None)] = CacheEntry(transactions[:400], time.time() - 61)
+    cache[("transaction",)] = CacheEntry(transactions[400:450], time.time())
+    cache.max_size = cache.size()
+
+    cache[("new",)] = CacheEntry(transactions[450:], time.time())
+
+    assert (
+        cache.db.execute(
+            "SELECT key FROM entries WHERE namespace = 'accounts'"
+        ).fetchall()
+        == []
+    )
+    assert cache.get(("transaction",)) is not None
+
+
+def test_missing_compression_module(cache_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    cache = RecordCache(cache_path, "zstd")
+    cache[("transaction",)] = CacheEntry([{"id": "1"}], time.time())
+    cache[("other",)] = CacheEntry("value", time.time())
+    cache.close()
+
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+
+    assert not is_compression_available("zstd")
+    with pytest.raises(ImportError):
+        RecordCache(cache_path, "zstd")
+    # what other runs wrote with it are misses
+    cache = RecordCache(cache_path)
+    assert cache.get(("transaction",)) is None
+    assert cache.get(("other",)) is None
+    cache.close()
@@ -0,0 +1,90 @@
+import copy
+
+import pytest
+
+from firefly_automate.rule_engine import RuleEngine
+from firefly_automate.rule_memo import RuleMemo
+
+RULES_CONFIG = {
+    "rules": {
+        "classify_transaction": [
+            {
+                "transaction_type": "withdrawal",
+                "attribute_to_update": "category_name",
+                "mappings": {"Groceries": ["woolworths", "coles"]},
+            }
+        ]
+    },
+    "mapping_priority": {"category_name": ["Groceries"]},
+}
+
+
+@pytest.fixture
+def memo_path(tmp_path):
+    return str(tmp_path / "memo")
+
+
+def process(transactions, memo_path):
+    """Apply the rules as a run would, and return the number of evaluated
+    transactions and the ids that have updates."""
+    memo = RuleMemo(memo_path)
+    try:
+        engine = RuleEngine(memo=memo)
+        num_evaluated = engine.process(transactions)
+        return num_evaluated, set(engine.pending_updates)
+    finally:
+        memo.close()
+
+
+def test_unchanged_transactions_are_skipped(user_config, transactions, memo_path):
+    user_config(RULES_CONFIG)
+
+    num_evaluated, updated = process(transactions, memo_path)
+    assert num_evaluated == len(transactions)
+    assert 0 < len(updated) < len(transactions)
+
+    # those with updates (which were not applied) are evaluated again
+    assert process(transactions, memo_path) == (len(updated), updated)
+
+
+def test_changed_transaction_is_evaluated(user_config, transactions, memo_path):
+    user_config(RULES_CONFIG)
+    _, updated = process(transactions, memo_path)
+
+    i, entry = next((i, t) for i, t in enumerate(transactions) if t.id not in updated)
+    changed = copy.copy(entry)
+    changed.description = "COLES 1234"
+    transactions = transactions[:i] + [changed] + transactions[i + 1 :]
+
+    num_evaluated, now_updated = process(transactions, memo_path)
+    assert num_evaluated == len(updated) + 1
+    assert now_updated == updated | {entry.id}
+
+
+@pytest.mark.parametrize(
+    "config_change",
+    [
+        {"rules": {"classify_transaction": [{"mappings": {"Groceries": ["aldi"]}}]}},
+        {"mapping_priority": {"category_name": []}},
+        {"vendor_name_mappings": {"WOOLWORTHS": "Woolworths"}},
+    ],
+    ids=["rule config", "mapping priority", "vendor name mappings"],
+)
+def test_changed_config_is_evaluated(
+    user_config, transactions, memo_path, config_change
+):
+    user_config(RULES_CONFIG)
+    process(transactions, memo_path)
+
+    changed_config = copy.deepcopy(RULES_CONFIG)
+    for key, val in config_change.items():
+        if key == "rules":
+            changed_config["rules"]["classify_transaction"][0].update(
+                val["classify_transaction"][0]
+            )
+        else:
+            changed_config[key] = val
+    user_config(changed_config)
+
+    num_evaluated, _ = process(transactions, memo_path)
+    assert num_evaluated == len(transactions)
@@ -0,0 +1,245 @@
+import pytest
+
+from firefly_automate.rules.rule_search_keyword import cond_amount_range
+from firefly_automate.server_rules import ATTRIBUTE_TO_ACTION, compile_rules
+
+# how firefly evaluates the amount triggers
+AMOUNT_TRIGGERS = {
+    "amount_less": lambda amount, value: amount < value,
+    "amount_exactly": lambda amount, value: amount == value,
+    "amount_more": lambda amount, value: amount > value,
+}
+
+
+def server_matches(rule, amount: float) -> bool:
+    matches = [AMOUNT_TRIGGERS[t](amount, float(v)) for t, v in rule.triggers]
+    return all(matches) if rule.strict else any(matches)
+
+
+def search_keyword_config(conditional):
+    return {
+        "rules": {
+            "search_keyword": [
+                {"name": "big", "conditional": conditional, "replace": {"notes": "x"}}
+            ]
+        }
+    }
+
+
+@pytest.mark.parametrize("bound", ["min", "max"])
+@pytest.mark.parametrize("amount", [99.99, 100, 100.01])
+def test_amount_range_bound_matches_as_locally(user_config, bound, amount):
+    user_config(search_keyword_config({"or": [{"amount_range": {bound: 100}}]}))
+
+    compiled = compile_rules()
+
+    (rule,) = compiled.rules["AUTOGEN_search_keyword"]
+    assert server_matches(rule, amount) == cond_amount_range(
+        {"amount": str(amount)}, {bound: 100}
+    )
+
+
+def test_strict_amount_range_is_not_compiled(user_config):
+    user_config(
+        search_keyword_config(
+            {
+                "and": [
+                    {"transaction_type": "withdrawal"},
+                    {"amount_range": {"min": 100}},
+                ]
+            }
+        )
+    )
+
+    compiled = compile_rules()
+
+    assert compiled.rules == {}
+    assert [name for name, _ in compiled.skipped] == ["search_keyword: big"]
+
+
+def classify_config(**rule):
+    return {
+        "rules": {
+            "classify_transaction": [
+                {
+                    "transaction_type": "withdrawal",
+                    "attribute_to_update": "category_name",
+                    **rule,
+                }
+            ]
+        }
+    }
+
+
+def test_classify_transaction_keyword_per_rule(user_config):
+    user_config(classify_config(mappings={"Groceries": ["woolworths", "coles"]}))
+
+    compiled = compile_rules()
+
+    rules = compiled.rules["AUTOGEN_classify_transaction"]
+    assert [(r.title, r.triggers, r.actions, r.strict, r.order) for r in rules] == [
+        (
+            "withdrawal: woolworths => category_name=Groceries",
+            [
+                ("transaction_type", "withdrawal"),
+                ("description_contains", "woolworths"),
+            ],
+            [("set_category", "Groceries")],
+            True,
+            0,
+        ),
+        (
+            "withdrawal: coles => category_name=Groceries",
+            [("transaction_type", "withdrawal"), ("description_contains", "coles")],
+            [("set_category", "Groceries")],
+            True,
+            1,
+        ),
+    ]
+    assert compiled.skipped == []
+
+
+def test_classify_transaction_extracted_keyword(user_config):
+    user_config(
+        {
+            **classify_config(
+                set_extracted_keyword_to_attribute="destination_name",
+                mappings={
+                    "Groceries": [
+                        {"WOOLWORTHS": "woolies"},
+                        {"COLES": {"value": "coles", "priority": "low"}},
+                    ]
+                },
+            ),
+            "vendor_name_mappings": {"woolies": "Woolworths"},
+        }
+    )
+
+    compiled = compile_rules()
+
+    (rule,) = compiled.rules["AUTOGEN_classify_transaction"]
+    assert rule.actions == [
+        ("set_category", "Groceries"),
+        ("set_destination_account", "Woolworths"),
+    ]
+    assert compiled.skipped == [
+        (
+            "classify_transaction: withdrawal: COLES => category_name=Groceries",
+            "low priority keyword",
+        )
+    ]
+
+
+def test_duplicate_titles_are_numbered(user_config):
+    user_config(
+        {
+            "rules": {
+                "classify_transaction": [
+                    {
+                        "transaction_type": "withdrawal",
+                        "attribute_to_update": "tags",
+                        "mappings": {"food": ["coles"]},
+                    }
+                ]
+                * 2
+            }
+        }
+    )
+
+    rules = compile_rules().rules["AUTOGEN_classify_transaction"]
+
+    assert [r.title for r in rules] == [
+        "withdrawal: coles => tags=food",
+        "withdrawal: coles => tags=food #2",
+    ]
+
+
+@pytest.mark.parametrize(
+    "transaction_type, attribute",
+    [("withdrawal", "source_name"), ("deposit", "destination_name")],
+)
+def test_current_source_destination_name(user_config, transaction_type, attribute):
+    user_config(
+        {
+            "rules": {
+                "search_keyword": [
+                    {
+                        "name": "own account",
+                        "conditional": {
+                            "and": [
+                                {"transaction_type": transaction_type},
+                                {"contain_keywords": {"description": "transfer"}},
+                            ]
+                        },
+                        "replace": {"__CURRENT_source_destination_name": "Savings"},
+                    }
+                ]
+            }
+        }
+    )
+
+    (rule,) = compile_rules().rules["AUTOGEN_search_keyword"]
+
+    assert rule.triggers == [
+        ("transaction_type", transaction_type),
+        ("description_contains", "transfer"),
+    ]
+    assert rule.actions == [(ATTRIBUTE_TO_ACTION[attribute], "Savings")]
+
+
+@pytest.mark.parametrize(
+    "rule, reason",
+    [
+        (
+            {
+                "conditional": {"contain_keywords": {"description": "transfer"}},
+                "replace": {"__CURRENT_source_destination_name": "Savings"},
+            },
+            "'__CURRENT_source_destination_name' without a transaction type",
+        ),
+        (
+            {
+                "conditional": {
+                    "or": [
+                        {"transaction_type": "withdrawal"},
+                        {
+                            "and": [
+                                {"transaction_type": "deposit"},
+                                {"contain_keywords": {"description": "x"}},
+                            ]
+                        },
+                    ]
+                },
+                "replace": {"notes": "x"},
+            },
+            "'or' of multiple conditions",
+        ),
+        (
+            {
+                "conditional": {"contain_keywords": {"description": "x"}},
+                "replace": {"foreign_amount": "1"},
+            },
+            "updating 'foreign_amount' is not supported",
+        ),
+    ],
+    ids=["no transaction type", "nested or", "unsupported attribute"],
+)
+def test_uncompilable_search_keyword_is_skipped(user_config, rule, reason):
+    user_config({"rules": {"search_keyword": [{"name": "x", **rule}]}})
+
+    compiled = compile_rules()
+
+    assert compiled.rules == {}
+    assert compiled.skipped == [("search_keyword: x", reason)]
+
+
+def test_fingerprint_follows_definition(user_config):
+    user_config(classify_config(mappings={"Groceries": ["coles"]}))
+    (rule,) = compile_rules().rules["AUTOGEN_classify_transaction"]
+    (same,) = compile_rules().rules["AUTOGEN_classify_transaction"]
+    user_config(classify_config(mappings={"Food": ["coles"]}))
+    (changed,) = compile_rules().rules["AUTOGEN_classify_transaction"]
+
+    assert rule.fingerprint == same.fingerprint
+    assert rule.fingerprint != changed.fingerprint
+    assert rule.fingerprint in rule.description
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from firefly_automate.data_type.transaction_query import TransactionQuery
+from firefly_automate.mock_firefly import _parse_search_query
+
+START = datetime.date(2023, 1, 1)
+END = datetime.date(2023, 12, 31)
+
+
+def test_merge_combines_fields():
+    a = TransactionQuery(account_name="Checking", transaction_type="withdrawal")
+    b = TransactionQuery(description_contains="coles")
+
+    assert a.merge(b) == TransactionQuery(
+        account_name="Checking",
+        transaction_type="withdrawal",
+        description_contains="coles",
+    )
+    assert a.merge(b) == b.merge(a)
+
+
+def test_merge_of_different_types_matches_nothing():
+    a = TransactionQuery(transaction_type="withdrawal")
+    b = TransactionQuery(transaction_type="deposit", account_name="Checking")
+
+    assert a.merge(b) is None
+
+
+@pytest.mark.parametrize("field", ["account_name", "description_contains"])
+def test_merge_of_different_values_keeps_own(field):
+    a = TransactionQuery(**{field: "a"})
+    b = TransactionQuery(**{field: "b"}, transaction_type="deposit")
+
+    assert a.merge(b) == TransactionQuery(**{field: "a"}, transaction_type="deposit")
+    assert b.merge(a) == b
+
+
+def test_merge_keeps_later_updated_after():
+    earlier = TransactionQuery(updated_after=datetime.date(2023, 1, 1))
+    later = TransactionQuery(updated_after=datetime.date(2023, 6, 1))
+
+    assert earlier.merge(later) == later
+    assert later.merge(earlier) == later
+    assert later.merge(TransactionQuery()) == later
+
+
+def test_is_account_only():
+    assert TransactionQuery(account_name="Checking").is_account_only()
+    assert not TransactionQuery().is_account_only()
+    assert not TransactionQuery(
+        account_name="Checking", description_contains="coles"
+    ).is_account_only()
+    assert not TransactionQuery(
+        account_name="Checking", updated_after=START
+    ).is_account_only()
+
+
+def test_to_search_query():
+    query = TransactionQuery(
+        account_name="Checking account",
+        transaction_type="withdrawal",
+        description_contains='say "hi"',
+        updated_after=datetime.date(2023, 6, 1),
+    )
+
+    assert query.to_search_query(START, END) == (
+        "date_after:2023-01-01 date_before:2023-12-31"
+        ' account_is:"Checking account" type:withdrawal'
+        ' description_contains:"say \\"hi\\"" updated_at_after:2023-06-01'
+    )
+    assert _parse_search_query(query.to_search_query(START, END)) == {
+        "start": START,
+        "end": END,
+        "account_name": "Checking account",
+        "kind": "withdrawal",
+        "description_contains": 'say "hi"',
+        "updated_after": datetime.date(2023, 6, 1),
+    }
+
+
+def test_to_search_query_of_empty_query():
+    assert TransactionQuery().to_search_query(START, END) == (
+        "date_after:2023-01-01 date_before:2023-12-31"
+    )
@@ -0,0 +1,83 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# few enough keyword queries to use the prefilter (see MAX_TRANSACTION_QUERIES)
+CONFIG = """
+rules:
+  classify_transaction:
+    - transaction_type: withdrawal
+      attribute_to_update: category_name
+      mappings:
+        Groceries: [woolworths, coles, aldi]
+        Entertainment: [netflix, jb hi-fi]
+  search_keyword:
+    - name: uber
+      conditional:
+        and:
+          - transaction_type: withdrawal
+          - contain_keywords: {description: UBER}
+      replace: {category_name: Transport}
+mapping_priority:
+  category_name: [Transport, Groceries]
+"""
+
+
+def update_blocks(updates: str):
+    """The (sorted) blocks of the printed updates, i.e. the headers of the accounts
+    and rules, and the changes of each transaction."""
+    return sorted(
+        block.strip() for block in re.split(r"\n\s*\n|\n(?=\S| >>|  > date:)", updates)
+    )
+
+
+@pytest.fixture
+def transform(tmp_path, mock_firefly):
+    config_dir = tmp_path / ".config" / "firefly-automate"
+    config_dir.mkdir(parents=True)
+    (config_dir / "config.yaml").write_text(CONFIG)
+    env = dict(
+        os.environ,
+        HOME=str(tmp_path),
+        PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]),
+        firefly_iii_host=mock_firefly.url,
+        firefly_iii_token="token",
+    )
+    ledger = mock_firefly.ledger
+
+    def _run(*argv: str) -> str:
+        """Run a dry-run transform over the whole ledger, and return its updates."""
+        mock_firefly.reset()
+        completed = subprocess.run(
+            [sys.executable, "-m", "firefly_automate.run", "--yes"]
+            + ["-s", str(ledger.start_date), "-e", str(ledger.end_date)]
+            + ["transform", "--dry-run", "--no-memo", *argv],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        _, _, updates = completed.stdout.partition("=" * 24 + "\n")
+        updates, _, _ = updates.partition("=" * 25 + "\n")
+        return updates
+
+    return _run
+
+
+def test_prefilter_matches_full_scan(transform, mock_firefly):
+    prefiltered = transform()
+    assert mock_firefly.num_requests["search_transactions"] > 0
+    assert mock_firefly.num_requests["list_transactions"] == 0
+
+    full_scan = transform("--full-scan")
+    assert mock_firefly.num_requests["search_transactions"] == 0
+
+    assert "Groceries" in prefiltered and "Transport" in prefiltered
+    # the same updates, though the transactions may be fetched in another order
+    assert update_blocks(prefiltered) == update_blocks(full_scan)
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from firefly_automate.commands.run_webhook import (
+    SAMPLE_PAYLOAD,
+    SIGNATURE_TOLERANCE,
+    InvalidPayload,
+    WebhookServer,
+    parse_payload,
+    verify_signature,
+)
+from firefly_automate.rule_engine import RuleEngine
+
+SECRET = "secret"
+BODY = json.dumps(SAMPLE_PAYLOAD).encode()
+
+
+def sign(body: bytes, timestamp: int = None, secret: str = SECRET) -> str:
+    if timestamp is None:
+        timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(), str(timestamp).encode() + b"." + body, hashlib.sha3_256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+@pytest.fixture
+def rules_config(user_config):
+    user_config(
+        {
+            "rules": {
+                "classify_transaction": [
+                    {
+                        "transaction_type": "withdrawal",
+                        "attribute_to_update": "category_name",
+                        "mappings": {"Groceries": ["woolworths"]},
+                    }
+                ]
+            },
+            "mapping_priority": {"category_name": ["Groceries"]},
+        }
+    )
+
+
+def start_server(workers: int) -> WebhookServer:
+    args = argparse.Namespace(
+        max_queued=10, workers=workers, secret=SECRET, dry_run=True
+    )
+    server = WebhookServer(("127.0.0.1", 0), args, RuleEngine())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server(rules_config):
+    """A server without workers, such that the queued transactions stay queued."""
+    server = start_server(workers=0)
+    yield server
+    server.stop()
+
+
+def post(server: WebhookServer, body: bytes, signature: str = None) -> int:
+    host, port = server.server_address
+    request = urllib.request.Request(f"http://{host}:{port}", data=body)
+    if signature is not None:
+        request.add_header("Signature", signature)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_verify_signature():
+    now = time.time()
+
+    assert verify_signature(SECRET, BODY, sign(BODY, int(now)), now)
+    assert not verify_signature(SECRET, BODY, None, now)
+    assert not verify_signature(SECRET, BODY, "v1=abc", now)
+    assert not verify_signature(SECRET, BODY, sign(BODY, secret="other"), now)
+    assert not verify_signature(SECRET, BODY + b" ", sign(BODY, int(now)), now)
+    stale = int(now) - SIGNATURE_TOLERANCE - 1
+    assert not verify_signature(SECRET, BODY, sign(BODY, stale), now)
+
+
+def test_parse_payload():
+    (entry,) = parse_payload(BODY)
+
+    assert entry.id == "1234"
+    assert entry.source_id == "1"
+    assert entry.description == "WOOLWORTHS 1234 SYDNEY"
+
+
+def test_parse_payload_of_other_triggers():
+    body = json.dumps({**SAMPLE_PAYLOAD, "trigger": "DESTROY_TRANSACTION"}).encode()
+
+    assert parse_payload(body) == []
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"not json",
+        b"[]",
+        json.dumps({**SAMPLE_PAYLOAD, "response": "ACCOUNTS"}).encode(),
+        json.dumps({**SAMPLE_PAYLOAD, "content": {"id": 1}}).encode(),
+        json.dumps(
+            {
+                **SAMPLE_PAYLOAD,
+                "content": {**SAMPLE_PAYLOAD["content"], "transactions": []},
+            }
+        ).encode(),
+    ],
+)
+def test_parse_malformed_payload(body):
+    with pytest.raises(InvalidPayload):
+        parse_payload(body)
+
+
+def test_signed_webhook_is_queued(server):
+    assert post(server, BODY, sign(BODY)) == 202
+
+    entry = server.queue.get_nowait()
+    assert entry.id == "1234"
+
+
+@pytest.mark.parametrize(
+    "body, signature, status",
+    [
+        (BODY, None, 401),
+        (BODY, sign(BODY, secret="other"), 401),
+        (BODY, sign(BODY, int(time.time()) - SIGNATURE_TOLERANCE - 60), 401),
+        (b"{not json", sign(b"{not json"), 400),
+    ],
+    ids=["unsigned", "wrong signature", "stale timestamp", "malformed body"],
+)
+def test_rejected_webhook_is_not_queued(server, body, signature, status):
+    assert post(server, body, signature) == status
+
+    assert server.queue.empty()
+
+
+def test_queued_transaction_is_processed(rules_config, capsys):
+    server = start_server(workers=1)
+    try:
+        assert post(server, BODY, sign(BODY)) == 202
+        server.queue.join()
+    finally:
+        server.stop()
+
+    assert "Groceries" in capsys.readouterr().out